@@ -157,9 +157,10 @@ def makeMetadataObject(metadata_object_type, data=None):
 		                % metadata_object_type)
 
 # Make some submodules stuff directly accessible from qidata package
-from qidataobject import ReadOnlyException
+from qidataobject import ReadOnlyException, InvalidAnnotationsException
 from qidatafile import QiDataFile, ClosedFileException
-from qidataset import QiDataSet, isDataset
+from qidataset import QiDataSet, FlushException, isDataset
+from annotationcache import AnnotationCache
 
 # ────────────────────
 # File opening factory
@@ -188,6 +189,24 @@ def isSupportedDataFile(file_path):
 			return True
 	return False
 
+def getFileDataType(file_path):
+	"""
+	Return the type of data stored in a file, reading only its metadata
+	(the data itself is not loaded)
+
+	:param file_path: Path of the file to examine
+	:type file_path: str
+	:return: Type stored in the file metadata, or the default type
+	         associated to its extension if none is stored
+	:rtype: qidata.DataType
+	:raises: TypeError if the file is not supported
+	"""
+	for pattern in _LOOKUP_ITEM_MODEL:
+		if pattern.match(file_path):
+			_t = qidatasensorfile._loadDataType(file_path)
+			return _t if _t else _LOOKUP_ITEM_MODEL[pattern].DEFAULT_TYPE
+	raise TypeError("Data type not supported by QiDataFile")
+
 def isSupported(data_path):
 	"""
 	Return True if path can be opened by qidata
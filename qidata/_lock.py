@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Advisory locks used to coordinate processes accessing the same files.
+
+Locks are taken with ``fcntl.flock``, so they are only honored by processes
+going through qidata. Inside a process, a single lock is kept per path and
+shared by all the objects opened on it, which keeps nested or concurrent
+opening of the same path from blocking forever.
+"""
+
+# Standard libraries
+import os
+import threading
+
+try:
+	import fcntl
+	has_fcntl = True
+except ImportError:
+	has_fcntl = False
+
+# Process-wide locks, indexed by real path. The guard protects the
+# dictionary and the counters of the locks, but is never held while waiting
+# for another process.
+_LOCKS = dict()
+_LOCKS_GUARD = threading.Lock()
+
+class _PathLock(object):
+	def __init__(self, fd):
+		self.fd = fd
+		self.shared = 0
+		self.exclusive = 0
+		# Objects holding the lock or waiting for it
+		self.users = 0
+		# True while a thread changes the state of the flock
+		self.busy = False
+		self.idle = threading.Condition(_LOCKS_GUARD)
+
+class FileLock(object):
+	"""
+	Shared / exclusive advisory lock on a file or a folder
+	"""
+
+	# ───────────
+	# Constructor
+
+	def __init__(self, path):
+		"""
+		:param path: Path of the file or folder to lock
+		:type path: str
+		"""
+		self._path = os.path.realpath(path)
+		self._exclusive = None
+
+	# ──────────
+	# Properties
+
+	@property
+	def locked(self):
+		"""
+		True if the lock is currently held
+		"""
+		return self._exclusive is not None
+
+	# ──────────
+	# Public API
+
+	def acquire(self, exclusive=False):
+		"""
+		Acquire the lock, waiting for other processes to release it if needed
+
+		:param exclusive: True to acquire an exclusive lock, False for a
+		                  shared one
+		:type exclusive: bool
+		:raises: RuntimeError if the lock is already held by this object
+
+		.. note::
+			Nothing is done on platforms without ``fcntl``
+		"""
+		if self.locked:
+			raise RuntimeError("Lock on %s is already held"%self._path)
+		self._exclusive = bool(exclusive)
+		if not has_fcntl:
+			return
+		with _LOCKS_GUARD:
+			try:
+				path_lock = _LOCKS[self._path]
+			except KeyError:
+				try:
+					path_lock = _PathLock(os.open(self._path, os.O_RDONLY))
+				except Exception:
+					self._exclusive = None
+					raise
+				_LOCKS[self._path] = path_lock
+			path_lock.users += 1
+			# Changes of the lock of a path are serialized inside the
+			# process, so that it is never upgraded concurrently by two
+			# threads
+			while path_lock.busy:
+				path_lock.idle.wait()
+			if exclusive and not path_lock.exclusive:
+				operation = fcntl.LOCK_EX
+			elif not exclusive and not path_lock.exclusive \
+			                   and not path_lock.shared:
+				operation = fcntl.LOCK_SH
+			else:
+				operation = None
+			if operation is None:
+				self._count(path_lock, 1)
+				return
+			path_lock.busy = True
+
+		# Other processes are waited for without holding the guard
+		try:
+			fcntl.flock(path_lock.fd, operation)
+		except Exception:
+			with _LOCKS_GUARD:
+				path_lock.busy = False
+				path_lock.users -= 1
+				self._forget(path_lock)
+				path_lock.idle.notify_all()
+			self._exclusive = None
+			raise
+		with _LOCKS_GUARD:
+			path_lock.busy = False
+			self._count(path_lock, 1)
+			path_lock.idle.notify_all()
+
+	def release(self):
+		"""
+		Release the lock, if held
+		"""
+		if not self.locked:
+			return
+		exclusive = self._exclusive
+		self._exclusive = None
+		if not has_fcntl:
+			return
+		with _LOCKS_GUARD:
+			path_lock = _LOCKS[self._path]
+			while path_lock.busy:
+				path_lock.idle.wait()
+			self._count(path_lock, -1, exclusive)
+			path_lock.users -= 1
+			if not path_lock.exclusive and not path_lock.shared:
+				fcntl.flock(path_lock.fd, fcntl.LOCK_UN)
+				self._forget(path_lock)
+				return
+			if path_lock.exclusive or not exclusive:
+				return
+			# Only shared holders remain. Converting the lock may wait for
+			# other processes, so it is done without holding the guard.
+			path_lock.busy = True
+
+		try:
+			fcntl.flock(path_lock.fd, fcntl.LOCK_SH)
+		finally:
+			with _LOCKS_GUARD:
+				path_lock.busy = False
+				path_lock.idle.notify_all()
+
+	def __del__(self):
+		self.release()
+
+	# ───────────
+	# Private API
+
+	def _count(self, path_lock, increment, exclusive=None):
+		"""
+		Update the number of holders of a path's lock (guard held)
+		"""
+		if exclusive is None:
+			exclusive = self._exclusive
+		if exclusive:
+			path_lock.exclusive += increment
+		else:
+			path_lock.shared += increment
+
+	def _forget(self, path_lock):
+		"""
+		Close the lock of a path once nobody uses it anymore (guard held)
+		"""
+		if path_lock.users == 0 and _LOCKS.get(self._path) is path_lock:
+			os.close(path_lock.fd)
+			_LOCKS.pop(self._path)
@@ -28,10 +28,17 @@
 
 # Standard libraries
 from collections import OrderedDict
+import contextlib
+import os
+import shutil
+import tempfile
 
 # Third-party libraries
 from qidata import makeMetadataObject, MetadataType
-from xmp.xmp import registerNamespace
+from xmp.xmp import XMPFile, registerNamespace
+
+# Local modules
+from qidata import xmpsession
 
 # Namespace reserved for annotation
 QIDATA_NS=u"http://softbank-robotics.com/qidata/1"
@@ -129,48 +136,92 @@ def _load_annotations(xmp_file):
 	:return: OrderedDict containing annotations
 	:rtype: collections.OrderedDict
 	"""
-	out = OrderedDict()
+	return _build_annotations(_read_annotations(xmp_file))
+
+def _read_annotations(xmp_file):
+	"""
+	Read the raw annotations stored in an XMPFile, without building the
+	MetadataObject instances
 
+	:param xmp_file: XMP file to read from
+	:type xmp_file: xmp.xmp.XMPFile
+	:return: Annotations as stored in the file (nested dicts and lists of
+	         strings), or None if there are none
+	:rtype: collections.OrderedDict
+	"""
 	# Retrieve all metadata from the annotation namespace
 	_raw_metadata = xmp_file.metadata[QIDATA_NS]
 
 	# If there are annotations
-	if _raw_metadata.children:
-		# Remove all "qidata" prefixes
-		data = _raw_metadata.value
-		_removePrefixes(data)
-
-		# Build the annotation structure
-		for annotatorID in data.keys():
-			out[annotatorID] = dict()
-			for metadata_type in list(MetadataType):
-				try:
-					if len(data[annotatorID][str(metadata_type)]) != 0:
-						out[annotatorID][str(metadata_type)] = []
-					else:
-						continue
-				except KeyError:
-					# metadata_type does not exist in file => it's ok
-					continue
+	if not _raw_metadata.children:
+		return None
+
+	# Remove all "qidata" prefixes
+	data = _raw_metadata.value
+	_removePrefixes(data)
+	return data
+
+def _read_file_annotations(xmp_path):
+	"""
+	Read the raw annotations stored in an XMP packet, without opening it
+	again if it did not change since it was last read (see
+	``qidata.xmpsession``)
+
+	:param xmp_path: Path of the XMP packet
+	:type xmp_path: str
+	:return: Annotations as stored in the file, or None if there are none
+	:rtype: collections.OrderedDict
+	"""
+	data = xmpsession.getSession().readNamespace(xmp_path, QIDATA_NS)
+	if data is None:
+		return None
+	_removePrefixes(data)
+	return data
 
-				for annotation in data[annotatorID][str(metadata_type)]:
-					obj = makeMetadataObject(
-						    metadata_type,
-						    annotation["info"]
-						  )
-					if annotation.has_key("location"):
-						loc = annotation["location"]
-						if isinstance(loc, list):
-							_unicodeListToBuiltInList(loc)
-						else:
-							loc = _unicodeToBuiltInType(loc)
-						out[annotatorID][str(metadata_type)].append(
-						                                       [obj, loc]
-						                                     )
+def _build_annotations(data):
+	"""
+	Build the annotation structure from raw annotations
+
+	:param data: Raw annotations, as returned by ``_read_annotations``. It
+	             is modified in-place.
+	:type data: collections.OrderedDict
+	:return: OrderedDict containing annotations
+	:rtype: collections.OrderedDict
+	"""
+	out = OrderedDict()
+	if data is None:
+		return out
+
+	for annotatorID in data.keys():
+		out[annotatorID] = dict()
+		for metadata_type in list(MetadataType):
+			try:
+				if len(data[annotatorID][str(metadata_type)]) != 0:
+					out[annotatorID][str(metadata_type)] = []
+				else:
+					continue
+			except KeyError:
+				# metadata_type does not exist in file => it's ok
+				continue
+
+			for annotation in data[annotatorID][str(metadata_type)]:
+				obj = makeMetadataObject(
+					    metadata_type,
+					    annotation["info"]
+					  )
+				if annotation.has_key("location"):
+					loc = annotation["location"]
+					if isinstance(loc, list):
+						_unicodeListToBuiltInList(loc)
 					else:
-						out[annotatorID][str(metadata_type)].append(
-							                                   [obj, None]
-							                                 )
+						loc = _unicodeToBuiltInType(loc)
+					out[annotatorID][str(metadata_type)].append(
+					                                       [obj, loc]
+					                                     )
+				else:
+					out[annotatorID][str(metadata_type)].append(
+						                                   [obj, None]
+						                                 )
 	return out
 
 def _save_annotations(xmp_file, annotations):
@@ -208,3 +259,37 @@ def _save_annotations(xmp_file, annotations):
 					tmp_dict["location"]=annotation[1]
 				_raw_metadata[annotation_maker][annotation_typename].append(tmp_dict)
 				_raw_metadata[annotation_maker][annotation_typename][-1]["info"]["version"] = annotation[0].version
+
+@contextlib.contextmanager
+def _atomic_update(xmp_path):
+	"""
+	Open an XMP file for writing so that changes are either entirely
+	written or not written at all.
+
+	Changes are made on a copy of the file, which replaces the original one
+	(by an atomic rename) only once it was fully written and flushed to disk.
+
+	:param xmp_path: Path of the XMP file to update
+	:type xmp_path: str
+
+	:Example:
+
+		>>> with _atomic_update("dataset/metadata.xmp") as xmp_file:
+		...     xmp_file.metadata[QIDATA_NS].key = "value"
+	"""
+	folder, filename = os.path.split(os.path.abspath(xmp_path))
+	_fd, tmp_path = tempfile.mkstemp(dir=folder,
+	                                 prefix="."+filename+".",
+	                                 suffix=".xmp")
+	os.close(_fd)
+	try:
+		shutil.copy2(xmp_path, tmp_path)
+		with XMPFile(tmp_path, rw=True) as xmp_file:
+			yield xmp_file
+		with open(tmp_path, "rb") as _f:
+			os.fsync(_f.fileno())
+		os.rename(tmp_path, xmp_path)
+		xmpsession.getSession().invalidate(xmp_path)
+	finally:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
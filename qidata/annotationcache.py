@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+The ``qidata.annotationcache`` module provides
+:class:`qidata.annotationcache.AnnotationCache`, a compact and read-only
+copy of the annotations of a dataset's files, meant to be shared between
+processes.
+
+The annotations are parsed once and stored in a single memory-mapped buffer,
+either anonymous (it is then shared with the processes forked after its
+creation) or backed by a file (which any process can open). Reading the
+annotations of a file from the cache does not involve any XMP parsing.
+
+:Example:
+
+	>>> with QiDataSet("dummy/dataset", "r") as d:
+	...     cache = d.shareAnnotations()
+	>>> # Fork the workers, then in each of them
+	>>> cache.getAnnotations("image_1.png")
+"""
+
+# Standard libraries
+import cPickle as pickle
+import mmap
+import os
+import struct
+import tempfile
+
+# Local modules
+import _mixin as xmp_tools
+
+# Identifies the buffer format, followed by the size of the index
+_CACHE_HEADER = struct.Struct("<4sQ")
+_CACHE_MAGIC = "QDA1"
+
+class AnnotationCache(object):
+	"""
+	Read-only annotations of several files, stored in a shared buffer
+	"""
+
+	# ───────────
+	# Constructor
+
+	def __init__(self, buffer):
+		"""
+		Wrap a buffer created by ``AnnotationCache.create``
+
+		:param buffer: Buffer holding the cache
+		:type buffer: mmap.mmap
+		:raises: ValueError if the buffer does not hold an annotation cache
+		"""
+		magic, index_size = _CACHE_HEADER.unpack_from(buffer, 0)
+		if magic != _CACHE_MAGIC:
+			raise ValueError("Given buffer is not an annotation cache")
+		self._buffer = buffer
+		self._data_offset = _CACHE_HEADER.size + index_size
+		self._index = pickle.loads(buffer[_CACHE_HEADER.size:self._data_offset])
+
+	@classmethod
+	def create(cls, raw_annotations, path=None):
+		"""
+		Create a cache
+
+		:param raw_annotations: Raw annotations of each file (as read by
+		                        ``qidata._mixin._read_annotations``), indexed
+		                        by file name
+		:type raw_annotations: dict
+		:param path: File in which the cache is stored. If None, the cache is
+		             only kept in memory (and shared with forked processes).
+		:type path: str
+		:rtype: qidata.annotationcache.AnnotationCache
+		"""
+		index = dict()
+		records = []
+		offset = 0
+		for name, data in raw_annotations.iteritems():
+			record = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+			index[name] = (offset, len(record))
+			records.append(record)
+			offset += len(record)
+		index = pickle.dumps(index, pickle.HIGHEST_PROTOCOL)
+		content = "".join(
+		    [_CACHE_HEADER.pack(_CACHE_MAGIC, len(index)), index] + records
+		)
+
+		if path is None:
+			buffer = mmap.mmap(-1, len(content))
+			buffer.write(content)
+			return cls(buffer)
+
+		# Write the cache next to its final location before moving it there,
+		# so that readers never see a partial file
+		_fd, tmp_path = tempfile.mkstemp(
+		    dir=os.path.dirname(os.path.abspath(path)),
+		    prefix="."+os.path.basename(path)+"."
+		)
+		try:
+			with os.fdopen(_fd, "wb") as _f:
+				_f.write(content)
+			os.rename(tmp_path, path)
+		finally:
+			if os.path.exists(tmp_path):
+				os.remove(tmp_path)
+		return cls.open(path)
+
+	@classmethod
+	def open(cls, path):
+		"""
+		Open a cache stored in a file
+
+		:param path: File storing the cache
+		:type path: str
+		:rtype: qidata.annotationcache.AnnotationCache
+		"""
+		with open(path, "rb") as _f:
+			buffer = mmap.mmap(_f.fileno(), 0, access=mmap.ACCESS_READ)
+		return cls(buffer)
+
+	# ──────────
+	# Properties
+
+	@property
+	def names(self):
+		"""
+		Names of the files whose annotations are cached
+		"""
+		return sorted(self._index.keys())
+
+	# ──────────
+	# Public API
+
+	def getAnnotations(self, name):
+		"""
+		Return the annotations of a file
+
+		:param name: Name of the file
+		:type name: str
+		:return: Annotations of the file, in the same form as
+		         ``qidata.qidatafile.QiDataFile.annotations``. The returned
+		         object is built at each call and can be freely modified.
+		:rtype: collections.OrderedDict
+		:raises: KeyError if the file is not in the cache
+		"""
+		offset, size = self._index[name]
+		start = self._data_offset + offset
+		data = pickle.loads(self._buffer[start:start+size])
+		return xmp_tools._build_annotations(data)
+
+	def close(self):
+		"""
+		Release the buffer (in this process only)
+		"""
+		self._buffer.close()
+
+	def __contains__(self, name):
+		return name in self._index
+
+	def __len__(self):
+		return len(self._index)
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+The ``qidata.batchloader`` module provides
+:class:`qidata.batchloader.BatchLoader`, which reads the images of a dataset
+and their annotated regions as NumPy batches.
+
+:Example:
+
+	>>> with QiDataSet("dummy/dataset", "r") as d:
+	...     loader = BatchLoader(d, stream="front", annotation_type="Face",
+	...                          batch_size=16, size=(320, 240))
+	>>> for images, boxes, labels in loader:
+	...     pass
+"""
+
+# Standard libraries
+from collections import deque
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import os
+
+# Third-party libraries
+import cv2
+import numpy as np
+
+# Local modules
+from qidata import MetadataType, qidatafile
+import _mixin as xmp_tools
+
+class BatchLoader(object):
+	"""
+	Iterates over the images of a dataset by batches
+
+	Each batch is a tuple ``(images, boxes, labels)``:
+
+	  - ``images`` is a (N, height, width, 3) uint8 array, in BGR order
+	  - ``boxes`` is a (M, 5) float32 array. Each row describes an annotated
+	    region by the index of its image in the batch and the coordinates of
+	    its upper left and lower right corners (x0, y0, x1, y1)
+	  - ``labels`` is a (M,) array holding the label of each region
+
+	Images are decoded, and their annotations read, concurrently. A few
+	batches are prepared in advance while the current one is used.
+	"""
+
+	# ───────────
+	# Constructor
+
+	def __init__(self, dataset, files=None, stream=None,
+	             annotation_type="Object", annotator=None, label=None,
+	             batch_size=32, size=None, crop=None, drop_last=False,
+	             workers=None, prefetch=2):
+		"""
+		:param dataset: Dataset containing the images
+		:type dataset: qidata.qidataset.QiDataSet
+		:param files: Names of the images to load
+		:type files: list
+		:param stream: Name of a stream whose images are loaded (in timestamp
+		               order). Used only if ``files`` is not given.
+		:type stream: str
+		:param annotation_type: Type of the annotations providing the regions
+		:type annotation_type: str or qidata.MetadataType
+		:param annotator: Only use the annotations made by this annotator
+		                  (annotations of all annotators are used if None)
+		:type annotator: str
+		:param label: Function giving the label of an annotation (its type
+		              name is used if None)
+		:type label: callable
+		:param batch_size: Number of images in each batch
+		:type batch_size: int
+		:param size: (width, height) to which images are resized
+		:type size: tuple
+		:param crop: Region of the images to keep, of the form
+		             [[x0,y0],[x1,y1]], applied before resizing. Regions
+		             falling out of it are discarded, and the others clipped.
+		:type crop: list
+		:param drop_last: Do not yield the last batch if it is incomplete
+		:type drop_last: bool
+		:param workers: Number of images decoded at the same time (defaults
+		                to the number of CPUs)
+		:type workers: int
+		:param prefetch: Number of batches prepared in advance
+		:type prefetch: int
+		:raises: ValueError if neither ``files`` nor ``stream`` is given
+		:raises: TypeError if ``annotation_type`` is not a valid MetadataType
+		:raises: KeyError if ``stream`` does not exist
+		"""
+		if files is not None:
+			self._files = list(files)
+		elif stream is not None:
+			self._files = dataset._getStreamArrays(stream)[1].tolist()
+		else:
+			raise ValueError("Either files or stream must be given")
+
+		try:
+			self._annotation_type = str(MetadataType[annotation_type])
+		except KeyError:
+			try:
+				self._annotation_type = str(MetadataType(annotation_type))
+			except ValueError:
+				raise TypeError(
+				          "%s is not a valid MetadataType"%annotation_type
+				      )
+
+		self._folder_path = dataset.name
+		self._annotator = annotator
+		self._label = label
+		self._batch_size = batch_size
+		self._size = tuple(size) if size is not None else None
+		self._crop = crop
+		self._drop_last = drop_last
+		self._workers = workers or cpu_count()
+		self._prefetch = max(1, prefetch)
+
+	# ──────────
+	# Properties
+
+	@property
+	def files(self):
+		"""
+		Names of the loaded images, in loading order
+		"""
+		return list(self._files)
+
+	# ──────────
+	# Public API
+
+	def __len__(self):
+		"""
+		Number of batches
+		"""
+		if self._drop_last:
+			return len(self._files) // self._batch_size
+		return (len(self._files) + self._batch_size - 1) // self._batch_size
+
+	def __iter__(self):
+		n_samples = len(self) * self._batch_size
+		n_samples = min(n_samples, len(self._files))
+		max_pending = self._prefetch * self._batch_size
+
+		pool = ThreadPool(self._workers)
+		try:
+			pending = deque()
+			next_sample = 0
+			samples = []
+			for _ in xrange(n_samples):
+				# Keep the pool busy, within the prefetching limit
+				while next_sample < n_samples and len(pending) < max_pending:
+					pending.append(
+					    pool.apply_async(
+					        self._loadSample,
+					        (self._files[next_sample],)
+					    )
+					)
+					next_sample += 1
+				samples.append(pending.popleft().get())
+				if len(samples) == self._batch_size:
+					yield self._makeBatch(samples)
+					samples = []
+			if len(samples) > 0:
+				yield self._makeBatch(samples)
+		finally:
+			pool.terminate()
+			pool.join()
+
+	# ───────────
+	# Private API
+
+	def _loadSample(self, name):
+		"""
+		Decodes an image and extracts its regions
+
+		:param name: Name of the image
+		:type name: str
+		:return: Image (cropped and resized), regions (N, 4) and their labels
+		:rtype: tuple
+		:raises: IOError if the image cannot be decoded
+		"""
+		path = os.path.join(self._folder_path, name)
+		image = cv2.imread(path, cv2.IMREAD_COLOR)
+		if image is None:
+			raise IOError("Could not decode %s"%path)
+
+		annotations = xmp_tools._build_annotations(
+		    xmp_tools._read_file_annotations(qidatafile._findXMPPath(path))
+		)
+
+		boxes = []
+		labels = []
+		for annotator, annotations_by_type in annotations.iteritems():
+			if self._annotator is not None and annotator != self._annotator:
+				continue
+			for annotation, location in annotations_by_type.get(
+			                                  self._annotation_type, []):
+				if location is None:
+					continue
+				boxes.append([location[0][0], location[0][1],
+				              location[1][0], location[1][1]])
+				labels.append(self._label(annotation) if self._label
+				              else self._annotation_type)
+		boxes = np.array(boxes, dtype=np.float32).reshape(-1, 4)
+		labels = np.array(labels, dtype=object)
+
+		if self._crop is not None:
+			(x0, y0), (x1, y1) = self._crop
+			image = image[y0:y1, x0:x1]
+			boxes -= np.array([x0, y0, x0, y0], dtype=np.float32)
+			np.clip(boxes[:,0::2], 0, image.shape[1], out=boxes[:,0::2])
+			np.clip(boxes[:,1::2], 0, image.shape[0], out=boxes[:,1::2])
+			# Drop the regions which were out of the crop
+			kept = (boxes[:,2] > boxes[:,0]) & (boxes[:,3] > boxes[:,1])
+			boxes = boxes[kept]
+			labels = labels[kept]
+
+		if self._size is not None:
+			scale = np.array([float(self._size[0]) / image.shape[1],
+			                  float(self._size[1]) / image.shape[0]] * 2,
+			                 dtype=np.float32)
+			image = cv2.resize(image, self._size, interpolation=cv2.INTER_AREA)
+			boxes *= scale
+
+		return image, boxes, labels
+
+	@staticmethod
+	def _makeBatch(samples):
+		"""
+		Stacks samples into a batch
+
+		:param samples: Samples returned by ``_loadSample``
+		:type samples: list
+		:return: images, boxes and labels of the batch
+		:rtype: tuple
+		:raises: ValueError if images do not all have the same shape (use
+		         ``size`` to resize them)
+		"""
+		if len(set(image.shape for (image, _, _) in samples)) > 1:
+			raise ValueError("Images of a batch must have the same shape, "
+			                 "use the size option to resize them")
+		images = np.stack([image for (image, _, _) in samples])
+		boxes = np.concatenate([
+		    np.hstack([np.full((len(b), 1), i, dtype=np.float32), b])
+		    for i, (_, b, _) in enumerate(samples)
+		])
+		labels = np.concatenate([l for (_, _, l) in samples])
+		return images, boxes, labels
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+The ``qidata.coco`` module converts dataset annotations to and from the JSON
+format used by the COCO dataset.
+
+Each annotation type (``qidata.MetadataType``) is a COCO category. Category
+ids are given by the sorted list of type names, so that exports made with
+the same metadata definitions share their ids.
+"""
+
+# Standard libraries
+import collections
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import json
+import os
+import shutil
+import tempfile
+
+# Third-party libraries
+import enum
+
+# Local modules
+from qidata import MetadataType, makeMetadataObject, qidatafile, qidataimagefile
+from qidata.metadata_objects import Object
+import _mixin as xmp_tools
+
+def getCategories():
+	"""
+	Return the COCO categories, one per annotation type
+
+	:return: Categories, as COCO dicts ("id", "name" and "supercategory")
+	:rtype: list
+	"""
+	return [
+	    dict(id=index+1, name=name, supercategory="qidata")
+	        for (index, name) in enumerate(sorted([str(t) for t in MetadataType]))
+	]
+
+def exportCOCO(dataset, out_path, annotator=None, max_workers=None):
+	"""
+	Write the annotations of a dataset's images in a COCO JSON file
+
+	The file is written incrementally while the images are examined
+	(concurrently, reading their headers and metadata only). At most twice
+	as many images as workers are examined in advance, so that memory use
+	does not depend on the size of the dataset.
+
+	:param dataset: Dataset to export
+	:type dataset: qidata.qidataset.QiDataSet
+	:param out_path: Path of the JSON file to write
+	:type out_path: str
+	:param annotator: Only export annotations made by this annotator (all
+	                  annotators if None)
+	:type annotator: str
+	:param max_workers: Maximum number of images examined at the same time
+	                    (defaults to the number of CPUs)
+	:type max_workers: int
+	:return: Number of exported images and annotations
+	:rtype: tuple
+
+	.. note::
+		Only annotations with a location are exported. Their bounding box is
+		given by the location's corners, and their fields are kept in the
+		"attributes" of the COCO annotation. The annotator is also given.
+	"""
+	category_ids = dict([(c["name"], c["id"]) for c in getCategories()])
+	folder_path = dataset.name
+	names = dataset._getImages()
+
+	def _read(name):
+		path = os.path.join(folder_path, name)
+		shape = qidataimagefile.getImageShape(path)
+		annotations = xmp_tools._build_annotations(
+		    xmp_tools._read_file_annotations(qidatafile._findXMPPath(path))
+		)
+		regions = []
+		for _annotator, annotations_by_type in annotations.iteritems():
+			if annotator is not None and _annotator != annotator:
+				continue
+			for annotation_type, typed_annotations \
+			                          in annotations_by_type.iteritems():
+				for obj, location in typed_annotations:
+					if location is not None:
+						regions.append((_annotator, annotation_type, obj,
+						                location))
+		return shape, regions
+
+	image_count = 0
+	annotation_count = 0
+	with open(out_path, "w") as _f:
+		_f.write('{"info": %s, "images": ['%json.dumps(
+		    dict(description=os.path.basename(os.path.abspath(folder_path)))
+		))
+		# Annotations are buffered on disk, and appended after the images
+		with tempfile.TemporaryFile() as _annotations:
+			if len(names) > 0:
+				workers = min(len(names), max_workers or cpu_count())
+				pool = ThreadPool(workers)
+				try:
+					# At most twice as many images as workers are examined in
+					# advance, so that results do not pile up in memory when
+					# writing falls behind
+					pending = collections.deque()
+					next_name = 0
+					for name in names:
+						while next_name < len(names) \
+						      and len(pending) < 2*workers:
+							pending.append(pool.apply_async(
+							    _read, (names[next_name],)
+							))
+							next_name += 1
+						shape, regions = pending.popleft().get()
+						image_count += 1
+						height, width = shape[:2] if shape is not None\
+						                          else (None, None)
+						if image_count > 1:
+							_f.write(", ")
+						_f.write(json.dumps(dict(id=image_count, file_name=name,
+						                         width=width, height=height)))
+						for (_annotator, annotation_type, obj, location)\
+						                                          in regions:
+							annotation_count += 1
+							x0, y0 = location[0]
+							x1, y1 = location[1]
+							if annotation_count > 1:
+								_annotations.write(", ")
+							_annotations.write(json.dumps(dict(
+							    id=annotation_count,
+							    image_id=image_count,
+							    category_id=category_ids[annotation_type],
+							    bbox=[x0, y0, x1-x0, y1-y0],
+							    area=(x1-x0)*(y1-y0),
+							    iscrowd=0,
+							    annotator=_annotator,
+							    attributes=_toBuiltIn(obj)
+							)))
+				finally:
+					pool.terminate()
+					pool.join()
+			_f.write('], "annotations": [')
+			_annotations.seek(0)
+			shutil.copyfileobj(_annotations, _f)
+		_f.write('], "categories": %s}'%json.dumps(getCategories()))
+	return image_count, annotation_count
+
+def importCOCO(dataset, json_path, annotator, max_workers=None):
+	"""
+	Add the annotations of a COCO JSON file to a dataset's images
+
+	Annotations are grouped by image, so that each image's metadata is
+	written once (see ``QiDataSet.importAnnotations``).
+
+	:param dataset: Dataset to which annotations are added, opened in "w"
+	                mode
+	:type dataset: qidata.qidataset.QiDataSet
+	:param json_path: Path of the COCO JSON file
+	:type json_path: str
+	:param annotator: Annotator of the imported annotations, unless they
+	                  give one (as the files written by ``exportCOCO`` do)
+	:type annotator: str
+	:param max_workers: Maximum number of images written at the same time
+	                    (defaults to the number of CPUs)
+	:type max_workers: int
+	:return: Number of imported annotations
+	:rtype: int
+	:raises: IOError if an image is not a child of the dataset
+
+	.. note::
+		Categories named after an annotation type (``qidata.MetadataType``)
+		are imported as such, with their "attributes". Other categories are
+		imported as ``Object`` annotations, whose type is the category name.
+	"""
+	with open(json_path) as _f:
+		content = json.load(_f)
+	file_names = dict([
+	    (image["id"], os.path.basename(str(image["file_name"])))
+	        for image in content.get("images", [])
+	])
+	categories = dict([
+	    (category["id"], str(category["name"]))
+	        for category in content.get("categories", [])
+	])
+	type_names = set([str(t) for t in MetadataType])
+
+	annotations = dict()
+	count = 0
+	for annotation in content.get("annotations", []):
+		category = categories[annotation["category_id"]]
+		if category in type_names:
+			obj = makeMetadataObject(category,
+			                         annotation.get("attributes", dict()))
+		else:
+			obj = Object(type=category)
+		# Boxes are usually given in floats, but locations are in pixels
+		x, y, width, height = [float(v) for v in annotation["bbox"]]
+		location = [[int(round(x)), int(round(y))],
+		            [int(round(x+width)), int(round(y+height))]]
+		_annotator = str(annotation.get("annotator", annotator))
+		annotations.setdefault(
+		    file_names[annotation["image_id"]], dict()
+		).setdefault(_annotator, []).append((obj, location))
+		count += 1
+
+	dataset.importAnnotations(annotations, max_workers)
+	return count
+
+def _toBuiltIn(value):
+	"""
+	Convert a metadata object (or one of its fields) into built-in types
+	which can be serialized in JSON
+	"""
+	if isinstance(value, collections.Mapping):
+		return dict([(k, _toBuiltIn(v)) for (k, v) in value.iteritems()])
+	if isinstance(value, (list, tuple)):
+		return [_toBuiltIn(v) for v in value]
+	if isinstance(value, enum.Enum):
+		return str(value)
+	return value
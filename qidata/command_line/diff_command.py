@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+# Standard libraries
+import json
+import os
+import sys
+
+# Third-party libraries
+import argparse
+try:
+	import argcomplete
+	has_argcomplete = True
+except ImportError:
+	has_argcomplete = False
+
+# Local modules
+from qidata import qidataset
+
+DESCRIPTION = "Lists the differences between two QiDataSets"
+
+_CHANGE_SYMBOLS = dict(added="+", removed="-", modified="M")
+
+class DiffCommand:
+
+	@staticmethod
+	def diff(args):
+		for path in (args.before, args.after):
+			throwIfAbsent(path)
+			if not qidataset.isDataset(path):
+				sys.exit(path+" isn't a valid QiDataSet")
+
+		with qidataset.QiDataSet(args.before) as before:
+			with qidataset.QiDataSet(args.after) as after:
+				changes = before.diff(after, args.jobs)
+
+		if args.json:
+			return json.dumps([
+			    dict(file=name, annotator=annotator, change=change, types=types)
+			        for (name, annotator, change, types) in changes
+			])
+		if len(changes) == 0:
+			return None
+		lines = []
+		for (name, annotator, change, types) in changes:
+			line = _CHANGE_SYMBOLS[change] + " " + name
+			if annotator is not None:
+				line += " [" + annotator + "]: " + ", ".join(types)
+			lines.append(line)
+		return "\n".join(lines)
+
+# ───────
+# Helpers
+
+def throwIfAbsent(path):
+	if not os.path.exists(path):
+		sys.exit(path+" doesn't exist")
+
+# ──────
+# Parser
+
+def make_command_parser(parent_parser=argparse.ArgumentParser(description=DESCRIPTION)):
+	before_argument = parent_parser.add_argument("before", help="reference dataset")
+	after_argument = parent_parser.add_argument("after", help="dataset to compare")
+	if has_argcomplete:
+		before_argument.completer = argcomplete.completers.DirectoriesCompleter()
+		after_argument.completer = argcomplete.completers.DirectoriesCompleter()
+	parent_parser.add_argument("-j", "--jobs", type=int, default=None,
+	                           help="number of files examined at the same time")
+	parent_parser.add_argument("--json", action="store_true",
+	                           help="print the changes as JSON")
+	parent_parser.set_defaults(func=DiffCommand.diff)
+	return parent_parser
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+The ``qidata.duplicates`` module finds images which are identical or nearly
+identical, inside a dataset or across several ones.
+
+Each image gets a perceptual hash (a 64-bit difference hash, computed on a
+version of the image decoded at reduced resolution). Similar images have
+hashes differing by a few bits only. Hashes are stored in each folder (see
+``HASH_FILE``) with the modification time and size of the images, so that
+they are only computed again when an image changes. They are then indexed
+in a BK-tree, which finds all the hashes close to a given one without
+comparing it to every other hash.
+"""
+
+# Standard libraries
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import os
+
+# Third-party libraries
+import cv2
+import numpy as np
+
+# Local modules
+from qidata import manifest, thumbnails
+
+#: File, in each folder, in which image hashes are stored
+HASH_FILE = os.path.join(".qidata_cache", "dhash.json")
+
+# Size of the images from which hashes are computed (one more column than
+# rows, as each bit compares two neighbouring pixels)
+_HASH_SIZE = 8
+
+def getImageHash(image_path):
+	"""
+	Compute the perceptual hash of an image
+
+	:param image_path: Path of the image
+	:type image_path: str
+	:return: 64-bit difference hash of the image
+	:rtype: int
+	:raises: IOError if the image cannot be decoded
+	"""
+	image = thumbnails._decode(image_path, 4*_HASH_SIZE)
+	if image.ndim == 3:
+		image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+	image = cv2.resize(image, (_HASH_SIZE+1, _HASH_SIZE),
+	                   interpolation=cv2.INTER_AREA)
+	bits = image[:, 1:] > image[:, :-1]
+	return int(np.packbits(bits).view(">u8")[0])
+
+def getFolderHashes(folder_path, max_workers=None):
+	"""
+	Return the perceptual hashes of all the images of a folder
+
+	Stored hashes are used when the images did not change since they were
+	computed. The others are computed concurrently, and stored.
+
+	:param folder_path: Path of the folder (typically, a dataset)
+	:type folder_path: str
+	:param max_workers: Maximum number of images hashed at the same time
+	                    (defaults to the number of CPUs)
+	:type max_workers: int
+	:return: Mapping of each image name with its hash
+	:rtype: dict
+	:raises: IOError if an image cannot be decoded
+	"""
+	names = sorted([
+	    name for name in os.listdir(folder_path) if thumbnails.isImage(name)
+	])
+	hashes = manifest._readManifest(folder_path, HASH_FILE)
+
+	def _update(name):
+		image_path = os.path.join(folder_path, name)
+		stamp = manifest._getStamp(image_path)
+		entry = hashes.get(name)
+		if entry is not None and entry[0] == stamp:
+			return None
+		return [stamp, "%016x"%getImageHash(image_path)]
+
+	if len(names) > 0:
+		pool = ThreadPool(min(len(names), max_workers or cpu_count()))
+		try:
+			updates = pool.map(_update, names)
+		finally:
+			pool.close()
+			pool.join()
+		updates = [(n, u) for (n, u) in zip(names, updates) if u is not None]
+		if len(updates) > 0:
+			hashes.update(updates)
+			manifest._writeManifest(folder_path, hashes, HASH_FILE)
+
+	return dict([(name, int(hashes[name][1], 16)) for name in names])
+
+def findDuplicates(folder_paths, max_distance=4, max_workers=None):
+	"""
+	Find groups of identical or nearly identical images among several
+	folders
+
+	:param folder_paths: Paths of the folders (typically, datasets)
+	:type folder_paths: list
+	:param max_distance: Maximum number of differing bits between the hashes
+	                     of two images considered as duplicates
+	:type max_distance: int
+	:param max_workers: Maximum number of images hashed at the same time
+	                    (defaults to the number of CPUs)
+	:type max_workers: int
+	:return: Groups of duplicates (sorted lists of image paths), sorted by
+	         their first path. Images without duplicates are not listed.
+	:rtype: list
+	"""
+	tree = BKTree()
+	for folder_path in folder_paths:
+		for name, image_hash in getFolderHashes(folder_path,
+		                                        max_workers).iteritems():
+			tree.add(image_hash, os.path.join(folder_path, name))
+
+	# Merge the groups of all images close to each other
+	parents = dict()
+	def _root(path):
+		while parents.get(path, path) != path:
+			path = parents[path]
+		return path
+
+	for image_hash, paths in tree:
+		root = _root(paths[0])
+		for path in paths[1:]:
+			parents[_root(path)] = root
+		for _, close_paths in tree.search(image_hash, max_distance):
+			close_root = _root(close_paths[0])
+			if close_root != root:
+				parents[close_root] = root
+
+	groups = dict()
+	for _, paths in tree:
+		for path in paths:
+			groups.setdefault(_root(path), []).append(path)
+	return sorted([sorted(group) for group in groups.values() if len(group) > 1])
+
+def hammingDistance(first_hash, second_hash):
+	"""
+	Return the number of differing bits between two hashes
+
+	:rtype: int
+	"""
+	return bin(first_hash ^ second_hash).count("1")
+
+class BKTree(object):
+	"""
+	Index of hashes allowing to find all the hashes within a given Hamming
+	distance of another one
+
+	Several items can be stored with the same hash.
+
+	:Example:
+		>>> tree = BKTree()
+		>>> tree.add(0b1011, "a.png")
+		>>> tree.add(0b1001, "b.png")
+		>>> tree.search(0b1011, 1)
+		[(0, ['a.png']), (1, ['b.png'])]
+	"""
+
+	# ───────────
+	# Constructor
+
+	def __init__(self):
+		# Each node is a list [hash, items, children], where children maps a
+		# distance to the child node whose hash is at that distance
+		self._root = None
+		self._size = 0
+
+	# ──────────
+	# Public API
+
+	def add(self, item_hash, item):
+		"""
+		Add an item to the index
+
+		:param item_hash: Hash of the item
+		:type item_hash: int
+		:param item: Item to store
+		"""
+		self._size += 1
+		if self._root is None:
+			self._root = [item_hash, [item], dict()]
+			return
+		node = self._root
+		while True:
+			distance = hammingDistance(item_hash, node[0])
+			if distance == 0:
+				node[1].append(item)
+				return
+			child = node[2].get(distance)
+			if child is None:
+				node[2][distance] = [item_hash, [item], dict()]
+				return
+			node = child
+
+	def search(self, item_hash, max_distance):
+		"""
+		Find the items whose hash is close to a given one
+
+		:param item_hash: Hash to look for
+		:type item_hash: int
+		:param max_distance: Maximum Hamming distance of the returned hashes
+		:type max_distance: int
+		:return: Distance and items of each close hash, sorted by distance
+		:rtype: list
+		"""
+		results = []
+		to_visit = [self._root] if self._root is not None else []
+		while len(to_visit) > 0:
+			node = to_visit.pop()
+			distance = hammingDistance(item_hash, node[0])
+			if distance <= max_distance:
+				results.append((distance, list(node[1])))
+			# By the triangle inequality, only children at a distance from
+			# the node close to ``distance`` can hold close hashes
+			for child_distance, child in node[2].iteritems():
+				if abs(child_distance - distance) <= max_distance:
+					to_visit.append(child)
+		results.sort(key=lambda r: r[0])
+		return results
+
+	def __iter__(self):
+		"""
+		Iterate over the stored hashes, with their items
+		"""
+		to_visit = [self._root] if self._root is not None else []
+		while len(to_visit) > 0:
+			node = to_visit.pop()
+			yield (node[0], node[1])
+			to_visit.extend(node[2].values())
+
+	def __len__(self):
+		return self._size
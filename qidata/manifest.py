@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+The ``qidata.manifest`` module keeps a hash of the content of each file of a
+dataset, so that two copies of a dataset can be compared without opening
+all their files.
+
+Each file gets a hash of its raw data, and a hash of the annotations of
+each of its annotators (computed on their canonical serialization). The XMP
+packet of a file without an external annotation file is left out of the
+hash of its data, so that annotations written in the file itself are not
+seen as a data change. This holds as long as the packet is updated in place
+(which is what its padding is for): a tool rewriting the file around a
+larger packet changes the hash of its data too. Hashes
+are stored in the dataset folder (see ``MANIFEST_FILE``) with the
+modification time and size of the files they were computed from, so that
+they are only computed again when a file changes.
+"""
+
+# Standard libraries
+import hashlib
+import json
+import mmap
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import os
+import tempfile
+
+# Local modules
+from qidata import qidatafile
+import _mixin as xmp_tools
+
+#: File, in the dataset folder, in which hashes are stored (its name changes
+#: with the way hashes are computed, so that older ones are not used)
+MANIFEST_FILE = os.path.join(".qidata_cache", "manifest-2.json")
+
+def getManifest(folder_path, names, max_workers=None):
+	"""
+	Return the content hashes of some files of a folder
+
+	Stored hashes are used when the files did not change since they were
+	computed. The others are computed concurrently, and stored.
+
+	:param folder_path: Path of the folder (typically, a dataset)
+	:type folder_path: str
+	:param names: Names of the files of interest
+	:type names: list
+	:param max_workers: Maximum number of files hashed at the same time
+	                    (defaults to the number of CPUs)
+	:type max_workers: int
+	:return: Mapping of each name with the hash of the file's data and the
+	         hashes of its annotations (a mapping of each annotator with the
+	         hash of their annotations)
+	:rtype: dict
+	"""
+	manifest = _readManifest(folder_path)
+
+	def _update(name):
+		entry = manifest.get(name, dict())
+		file_path = os.path.join(folder_path, name)
+		xmp_path = qidatafile._findXMPPath(file_path)
+		data_stamp = _getStamp(file_path)
+		xmp_stamp = _getStamp(xmp_path)
+		updated = dict(entry)
+		if entry.get("data_stamp") != data_stamp:
+			updated["data_stamp"] = data_stamp
+			updated["data"] = _hashFile(file_path,
+			                            skip_xmp=(xmp_path == file_path))
+		if entry.get("xmp_stamp") != xmp_stamp:
+			updated["xmp_stamp"] = xmp_stamp
+			updated["annotations"] = _hashAnnotations(xmp_path)
+		return None if updated == entry else updated
+
+	if len(names) > 0:
+		pool = ThreadPool(min(len(names), max_workers or cpu_count()))
+		try:
+			updates = pool.map(_update, names)
+		finally:
+			pool.close()
+			pool.join()
+		updates = [(n, u) for (n, u) in zip(names, updates) if u is not None]
+		if len(updates) > 0:
+			manifest.update(updates)
+			_writeManifest(folder_path, manifest)
+
+	return dict([
+	    (name, (manifest[name]["data"], manifest[name]["annotations"]))
+	        for name in names
+	])
+
+def _getStamp(file_path):
+	"""
+	Return the modification time and size of a file
+	"""
+	stat = os.stat(file_path)
+	return [stat.st_mtime, stat.st_size]
+
+def _hashFile(file_path, skip_xmp=False):
+	"""
+	Return the hash of a file content, without its embedded XMP packet if
+	``skip_xmp`` is True
+	"""
+	sha1 = hashlib.sha1()
+	with open(file_path, "rb") as _f:
+		(begin, end) = _findXMPPacket(_f) if skip_xmp else (0, 0)
+		remaining = begin
+		while remaining > 0:
+			block = _f.read(min(remaining, 1<<20))
+			if block == "":
+				break
+			sha1.update(block)
+			remaining -= len(block)
+		_f.seek(end)
+		for block in iter(lambda: _f.read(1<<20), ""):
+			sha1.update(block)
+	return sha1.hexdigest()
+
+def _findXMPPacket(_f):
+	"""
+	Return the offsets of the beginning and of the end of the XMP packet
+	embedded in an open file ((0, 0) if there is none)
+	"""
+	if os.fstat(_f.fileno()).st_size == 0:
+		return (0, 0)
+	data = mmap.mmap(_f.fileno(), 0, access=mmap.ACCESS_READ)
+	try:
+		begin = data.find("<?xpacket begin=")
+		trailer = data.find("<?xpacket end=", begin) if begin >= 0 else -1
+		end = data.find("?>", trailer) if trailer >= 0 else -1
+		if end < 0:
+			return (0, 0)
+		return (begin, end + len("?>"))
+	finally:
+		data.close()
+
+def _hashAnnotations(xmp_path):
+	"""
+	Return the hash of the annotations of each annotator of an XMP packet
+	"""
+	data = xmp_tools._read_file_annotations(xmp_path)
+	if data is None:
+		return dict()
+	return dict([
+	    (annotator, _hashRawAnnotations(annotations))
+	        for (annotator, annotations) in data.iteritems()
+	])
+
+def _hashRawAnnotations(raw_annotations):
+	"""
+	Return the hash of the canonical serialization of raw annotations
+	"""
+	return hashlib.sha1(
+	    json.dumps(raw_annotations, sort_keys=True, separators=(",", ":"))
+	).hexdigest()
+
+def _readManifest(folder_path, manifest_file=MANIFEST_FILE):
+	"""
+	Read the hashes stored in a folder (an empty mapping if there are none
+	or if they cannot be read)
+	"""
+	try:
+		with open(os.path.join(folder_path, manifest_file)) as _f:
+			manifest = json.load(_f)
+	except (IOError, ValueError):
+		return dict()
+	return manifest if isinstance(manifest, dict) else dict()
+
+def _writeManifest(folder_path, manifest, manifest_file=MANIFEST_FILE):
+	"""
+	Store hashes in a folder
+
+	The manifest is replaced atomically. Failures (on a read-only folder
+	for instance) are ignored, hashes are then computed again next time.
+	"""
+	manifest_path = os.path.join(folder_path, manifest_file)
+	try:
+		if not os.path.isdir(os.path.dirname(manifest_path)):
+			os.makedirs(os.path.dirname(manifest_path))
+		_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(manifest_path),
+		                                 prefix=".")
+		with os.fdopen(_fd, "w") as _f:
+			json.dump(manifest, _f)
+		os.rename(tmp_path, manifest_path)
+	except (IOError, OSError):
+		pass
@@ -32,11 +32,14 @@
 from distutils.version import StrictVersion
 
 # Third-party libraries
+import numpy as np
 from strong_typing.typed_parameters import IntegerParameter as _Int
 
 # Local modules
 from qidata.metadata_objects import MetadataObject
 
+NANOSECONDS_PER_SECOND = 1000000000
+
 class TimeStamp(MetadataObject):
 
 	__ATTRIBUTES__ = [
@@ -52,3 +55,127 @@ class TimeStamp(MetadataObject):
 
 	__VERSION__="0.1"
 	__DESCRIPTION__="Timestamp at which the data was created"
+
+
+	# ──────────
+	# Properties
+
+	@property
+	def total_nanoseconds(self):
+		"""
+		Timestamp as a single number of nanoseconds since Epoch
+
+		:rtype: int
+		"""
+		return self.seconds*NANOSECONDS_PER_SECOND + self.nanoseconds
+
+	# ──────────
+	# Public API
+
+	@classmethod
+	def fromNanoseconds(cls, total_nanoseconds):
+		"""
+		Create a timestamp from a number of nanoseconds since Epoch
+
+		:param total_nanoseconds: Nanoseconds since Epoch
+		:type total_nanoseconds: int
+		:rtype: qidata.metadata_objects.TimeStamp
+		"""
+		seconds, nanoseconds = divmod(int(total_nanoseconds),
+		                              NANOSECONDS_PER_SECOND)
+		return cls(seconds, nanoseconds)
+
+	# ───────────────────────
+	# Ordering and arithmetic
+
+	def __lt__(self, other):
+		if not isinstance(other, TimeStamp): return NotImplemented
+		return self.total_nanoseconds < other.total_nanoseconds
+
+	def __le__(self, other):
+		if not isinstance(other, TimeStamp): return NotImplemented
+		return self.total_nanoseconds <= other.total_nanoseconds
+
+	def __gt__(self, other):
+		if not isinstance(other, TimeStamp): return NotImplemented
+		return self.total_nanoseconds > other.total_nanoseconds
+
+	def __ge__(self, other):
+		if not isinstance(other, TimeStamp): return NotImplemented
+		return self.total_nanoseconds >= other.total_nanoseconds
+
+	def __add__(self, nanoseconds):
+		"""
+		Shift a timestamp by a number of nanoseconds
+		"""
+		if isinstance(nanoseconds, TimeStamp): return NotImplemented
+		return TimeStamp.fromNanoseconds(self.total_nanoseconds + nanoseconds)
+
+	__radd__ = __add__
+
+	def __sub__(self, other):
+		"""
+		Difference with another timestamp (in nanoseconds), or timestamp
+		shifted back by a number of nanoseconds
+		"""
+		if isinstance(other, TimeStamp):
+			return self.total_nanoseconds - other.total_nanoseconds
+		return TimeStamp.fromNanoseconds(self.total_nanoseconds - other)
+
+# ──────────
+# Conversion
+
+def asNanoseconds(timestamp):
+	"""
+	Convert a timestamp into a number of nanoseconds since Epoch, the form
+	in which datasets store and index stream timestamps
+
+	:param timestamp: TimeStamp instance, (seconds, nanoseconds) pair, or
+	                  number of nanoseconds
+	:rtype: int
+	"""
+	if isinstance(timestamp, TimeStamp):
+		return timestamp.total_nanoseconds
+	if isinstance(timestamp, (int, long, np.integer)):
+		return int(timestamp)
+	return int(timestamp[0])*NANOSECONDS_PER_SECOND + int(timestamp[1])
+
+def toNanoseconds(timestamps, count=-1):
+	"""
+	Convert timestamps into an array of nanoseconds since Epoch
+
+	:param timestamps: TimeStamp instances, (seconds, nanoseconds) pairs or
+	                   numbers of nanoseconds
+	:type timestamps: iterable
+	:param count: Number of timestamps, if known (speeds up conversion)
+	:type count: int
+	:rtype: numpy.ndarray (int64)
+	"""
+	return np.fromiter(
+	    (asNanoseconds(ts) for ts in timestamps),
+	    dtype=np.int64,
+	    count=count
+	)
+
+def toPairs(nanoseconds):
+	"""
+	Convert an array of nanoseconds since Epoch into (seconds, nanoseconds)
+	pairs
+
+	:param nanoseconds: Nanoseconds since Epoch
+	:type nanoseconds: numpy.ndarray
+	:rtype: list
+	"""
+	seconds, nanoseconds = np.divmod(np.asarray(nanoseconds, dtype=np.int64),
+	                                 NANOSECONDS_PER_SECOND)
+	return zip(seconds.tolist(), nanoseconds.tolist())
+
+def toTimeStamps(nanoseconds):
+	"""
+	Convert an array of nanoseconds since Epoch into TimeStamp instances
+
+	:param nanoseconds: Nanoseconds since Epoch
+	:type nanoseconds: numpy.ndarray
+	:rtype: list
+	"""
+	return [TimeStamp(sec, nsec) for (sec, nsec) in toPairs(nanoseconds)]
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+The ``qidata.poses`` module provides vectorized operations on sensor poses.
+
+Poses are stored in (N, 7) float64 arrays: each row holds a translation
+(x, y, z) followed by a unit rotation quaternion (x, y, z, w), like
+:class:`qidata.metadata_objects.Transform`. A pose transforms coordinates
+from the sensor frame into the global frame. All functions also accept a
+single pose (a size 7 vector).
+"""
+
+# Third-party libraries
+import numpy as np
+
+def composePoses(poses_a, poses_b):
+	"""
+	Compose poses (apply ``poses_b``, then ``poses_a``)
+
+	:param poses_a: Left-hand poses
+	:type poses_a: numpy.ndarray
+	:param poses_b: Right-hand poses
+	:type poses_b: numpy.ndarray
+	:return: ``poses_a * poses_b``
+	:rtype: numpy.ndarray
+	"""
+	poses_a, poses_b = _asPoses(poses_a), _asPoses(poses_b)
+	out = np.empty(np.broadcast(poses_a, poses_b).shape)
+	out[...,:3] = poses_a[...,:3] + _rotate(poses_a[...,3:], poses_b[...,:3])
+	out[...,3:] = _multiply(poses_a[...,3:], poses_b[...,3:])
+	return out
+
+def invertPoses(poses):
+	"""
+	Invert poses
+
+	:param poses: Poses to invert
+	:type poses: numpy.ndarray
+	:rtype: numpy.ndarray
+	"""
+	poses = _asPoses(poses)
+	out = np.empty(poses.shape)
+	out[...,3:] = _conjugate(poses[...,3:])
+	out[...,:3] = -_rotate(out[...,3:], poses[...,:3])
+	return out
+
+def relativePoses(poses_a, poses_b):
+	"""
+	Express poses in the frame of other poses
+
+	:param poses_a: Reference poses
+	:type poses_a: numpy.ndarray
+	:param poses_b: Poses to express in the reference frames
+	:type poses_b: numpy.ndarray
+	:return: ``poses_a^-1 * poses_b``. For consecutive poses of a
+	         trajectory, ``relativePoses(poses[:-1], poses[1:])`` gives the
+	         motion between each pair.
+	:rtype: numpy.ndarray
+	"""
+	return composePoses(invertPoses(poses_a), poses_b)
+
+def interpolatePoses(timestamps, poses, query_timestamps):
+	"""
+	Interpolate a trajectory at given times
+
+	Translations are interpolated linearly and rotations spherically
+	(slerp). Queries out of the trajectory get its first or last pose.
+
+	:param timestamps: Timestamps of the trajectory poses, sorted (int64
+	                   nanoseconds)
+	:type timestamps: numpy.ndarray
+	:param poses: Poses of the trajectory
+	:type poses: numpy.ndarray
+	:param query_timestamps: Timestamps at which the trajectory is
+	                         interpolated (int64 nanoseconds)
+	:type query_timestamps: numpy.ndarray
+	:return: Interpolated poses
+	:rtype: numpy.ndarray
+	:raises: ValueError if the trajectory is empty
+	"""
+	timestamps = np.asarray(timestamps, dtype=np.int64)
+	poses = _asPoses(poses)
+	query_timestamps = np.asarray(query_timestamps, dtype=np.int64)
+	if len(timestamps) == 0:
+		raise ValueError("Cannot interpolate an empty trajectory")
+	if len(timestamps) == 1:
+		return np.repeat(poses.reshape(-1, 7)[:1], len(query_timestamps), axis=0)
+
+	after = np.clip(np.searchsorted(timestamps, query_timestamps),
+	                1,
+	                len(timestamps)-1)
+	before = after - 1
+	# Work on differences, so that large int64 timestamps keep their precision
+	span = (timestamps[after] - timestamps[before]).astype(np.float64)
+	ratio = (query_timestamps - timestamps[before]).astype(np.float64)
+	ratio = np.clip(np.divide(ratio, span, out=np.zeros_like(ratio),
+	                          where=span>0), 0., 1.)[:,np.newaxis]
+
+	out = np.empty((len(query_timestamps), 7))
+	out[:,:3] = poses[before,:3] + ratio*(poses[after,:3] - poses[before,:3])
+	out[:,3:] = _slerp(poses[before,3:], poses[after,3:], ratio)
+	return out
+
+# ───────
+# Helpers
+
+def _asPoses(poses):
+	poses = np.asarray(poses, dtype=np.float64)
+	if poses.shape[-1] != 7:
+		raise ValueError("Poses must have 7 coordinates")
+	return poses
+
+def _conjugate(q):
+	return q * np.array([-1., -1., -1., 1.])
+
+def _multiply(q1, q2):
+	x1, y1, z1, w1 = np.rollaxis(q1, -1)
+	x2, y2, z2, w2 = np.rollaxis(q2, -1)
+	return np.stack([w1*x2 + x1*w2 + y1*z2 - z1*y2,
+	                 w1*y2 - x1*z2 + y1*w2 + z1*x2,
+	                 w1*z2 + x1*y2 - y1*x2 + z1*w2,
+	                 w1*w2 - x1*x2 - y1*y2 - z1*z2], axis=-1)
+
+def _rotate(q, v):
+	# v' = v + 2w (u x v) + 2 u x (u x v), with u the vector part of q
+	u, w = q[...,:3], q[...,3:]
+	t = 2*np.cross(u, v)
+	return v + w*t + np.cross(u, t)
+
+def _slerp(q1, q2, ratio):
+	dot = np.sum(q1*q2, axis=-1, keepdims=True)
+	# Take the shortest path
+	q2 = np.where(dot < 0, -q2, q2)
+	dot = np.abs(dot)
+	theta = np.arccos(np.clip(dot, -1., 1.))
+	sin_theta = np.sin(theta)
+	close = sin_theta < 1e-6
+	safe_sin = np.where(close, 1., sin_theta)
+	w1 = np.where(close, 1.-ratio, np.sin((1.-ratio)*theta)/safe_sin)
+	w2 = np.where(close, ratio, np.sin(ratio*theta)/safe_sin)
+	q = w1*q1 + w2*q2
+	return q / np.linalg.norm(q, axis=-1, keepdims=True)
@@ -37,6 +37,9 @@ from qidata import DataType
 from qidata.qidatasensorfile import QiDataSensorFile
 
 class QiDataAudioFile(QiDataSensorFile):
+
+	DEFAULT_TYPE = DataType.AUDIO #: Type of sounds with no stored type
+
 	# ───────────
 	# Constructor
 
@@ -49,7 +52,7 @@ class QiDataAudioFile(QiDataSensorFile):
 	@property
 	def type(self):
 		_t = QiDataSensorFile.type.fget(self)
-		return _t if _t else DataType.AUDIO
+		return _t if _t else self.DEFAULT_TYPE
 
 	@type.setter
 	def type(self, new_type):
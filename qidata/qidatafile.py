@@ -47,9 +47,10 @@ from collections import OrderedDict
 from xmp.xmp import XMPFile, registerNamespace
 
 # Local modules
-from qidata import DataType
+from qidata import DataType, xmpsession
 from qidata.qidataobject import QiDataObject
 import _mixin as xmp_tools
+from _lock import FileLock
 
 class ClosedFileException(Exception):pass
 
@@ -61,6 +62,20 @@ def throwIfClosed(f):
 		return f(*args)
 	return wraps
 
+def _findXMPPath(file_path):
+	"""
+	Return the path of the XMP packet to read for a given file
+
+	:param file_path: Path of the data file
+	:type file_path: str
+	:return: Path of the external annotation file if there is one, the
+	         path of the file itself otherwise
+	:rtype: str
+	"""
+	if os.path.exists(file_path + ".xmp"):
+		return file_path + ".xmp"
+	return file_path
+
 # def getFileDataType(path):
 # 	"""
 # 	Return type of data stored in given file
@@ -80,7 +95,7 @@ class QiDataFile(QiDataObject):
 	# ───────────
 	# Constructor
 
-	def __init__(self, file_path, mode = "r"):
+	def __init__(self, file_path, mode = "r", merge=False):
 		"""
 		Create and open a QiDataFile.
 		QiDataFile wraps the xmp library specifically to store QiDataObjects under the
@@ -90,43 +105,35 @@ class QiDataFile(QiDataObject):
 		:type file_path: str
 		:param mode: opening mode, "r" for reading, "w" for writing
 		:param mode: str
+		:param merge: In "w" mode, do not lock the file while it is open, only
+		              while its metadata is written on close
+		:type merge: bool
 
 		.. warnings::
 			The mode behavior is different from the regular Python file mode.
 			The file is NEVER created if it does not exist. Besides, opening
 			an existing file in "w" mode does not overwrite it.
-		"""
-		if os.path.splitext(file_path)[1] == ".xmp":
-			# If file is a .xmp, just read it normally
-			# If the filename without xmp extension is an existing
-			# file, then mark it as the real file opened
-			xmp_path = file_path
-			if os.path.exists(os.path.splitext(file_path)[0]):
-				file_path = os.path.splitext(file_path)[0]
 
-		elif os.path.exists(file_path + ".xmp"):
-			# If there is an external annotation file, use it
-			xmp_path = file_path + ".xmp"
-
-		elif mode=="w":
-			# If there is no external annotation file but we are in "w" mode
-			# Copy the internal annotations in an external annotation file
-			xmp_path = file_path + ".xmp"
-			with XMPFile(file_path, rw=False) as _internal:
-				with XMPFile(xmp_path, rw=True) as _external:
-					_external.libxmp_metadata = _internal.libxmp_metadata
+		.. note::
+			The file is locked until it is closed: other processes can open it
+			concurrently in "r" mode, but opening it in "w" mode waits for
+			all other users to close it. With ``merge``, the last process to
+			write a change overwrites the changes written by the others.
+		"""
+		if os.path.splitext(file_path)[1] == ".xmp" \
+		    and os.path.exists(os.path.splitext(file_path)[0]):
+			self._lock = FileLock(os.path.splitext(file_path)[0])
 		else:
-			# Open the internal annotations
-			xmp_path = file_path
-
-
-		# Store the file path
-		self._file_path = file_path
-
-		# And prepare the xmp file
-		self._xmp_file = XMPFile(xmp_path, rw=(mode=="w"))
-		self._is_closed = True
-		self._open()
+			self._lock = FileLock(file_path)
+		self._lock.acquire(exclusive=(mode=="w"))
+		try:
+			self._openXMP(file_path, mode)
+		except:
+			self._lock.release()
+			raise
+		self._merge = (mode == "w" and merge)
+		if self._merge:
+			self._lock.release()
 
 	# ──────────
 	# Properties
@@ -146,7 +153,7 @@ class QiDataFile(QiDataObject):
 		"r" => read-only mode
 		"w" => read/write mode
 		"""
-		return "w" if self._xmp_file.rw else "r"
+		return self._mode
 
 	@property
 	def read_only(self):
@@ -165,11 +172,23 @@ class QiDataFile(QiDataObject):
 	def close(self):
 		"""
 		Closes the file after writing the metadata
+
+		.. note::
+			Metadata are only written if they were modified since the file was
+			opened.
 		"""
-		if self.mode != "r":
-			xmp_tools._save_annotations(self._xmp_file, self.annotations)
-		self._xmp_file.close()
-		self._is_closed = True
+		try:
+			is_modified = self.mode != "r" and self._isModified()
+			self._xmp_file.close()
+			if is_modified:
+				if self._merge:
+					self._lock.acquire(exclusive=True)
+				with XMPFile(self._xmp_path, rw=True) as _xmp_file:
+					self._saveMetadata(_xmp_file)
+				xmpsession.getSession().invalidate(self._xmp_path)
+			self._is_closed = True
+		finally:
+			self._lock.release()
 
 	@throwIfClosed
 	def cancelChanges(self):
@@ -183,6 +202,10 @@ class QiDataFile(QiDataObject):
 	def addAnnotation(self, annotator, annotation, location=None):
 		QiDataObject.addAnnotation(self, annotator, annotation, location)
 
+	@throwIfClosed
+	def addAnnotations(self, annotator, annotations, locations=None):
+		QiDataObject.addAnnotations(self, annotator, annotations, locations)
+
 	@throwIfClosed
 	def removeAnnotation(self, annotator, annotation, location=None):
 		QiDataObject.removeAnnotation(self, annotator, annotation, location)
@@ -190,6 +213,46 @@ class QiDataFile(QiDataObject):
 	# ───────────
 	# Private API
 
+	def _openXMP(self, file_path, mode):
+		"""
+		Find (or create in "w" mode) the XMP packet holding the file's
+		metadata and open it
+		"""
+		if os.path.splitext(file_path)[1] == ".xmp":
+			# If file is a .xmp, just read it normally
+			# If the filename without xmp extension is an existing
+			# file, then mark it as the real file opened
+			xmp_path = file_path
+			if os.path.exists(os.path.splitext(file_path)[0]):
+				file_path = os.path.splitext(file_path)[0]
+
+		elif os.path.exists(file_path + ".xmp"):
+			# If there is an external annotation file, use it
+			xmp_path = file_path + ".xmp"
+
+		elif mode=="w":
+			# If there is no external annotation file but we are in "w" mode
+			# Copy the internal annotations in an external annotation file
+			xmp_path = file_path + ".xmp"
+			with XMPFile(file_path, rw=False) as _internal:
+				with XMPFile(xmp_path, rw=True) as _external:
+					_external.libxmp_metadata = _internal.libxmp_metadata
+		else:
+			# Open the internal annotations
+			xmp_path = file_path
+
+
+		# Store the file path
+		self._file_path = file_path
+		self._mode = "w" if mode=="w" else "r"
+
+		# And prepare the xmp file. It is only opened for reading, changes are
+		# written when the file is closed (see ``close``)
+		self._xmp_path = xmp_path
+		self._xmp_file = XMPFile(xmp_path, rw=False)
+		self._is_closed = True
+		self._open()
+
 	def _open(self):
 		"""
 		Open the file
@@ -200,6 +263,14 @@ class QiDataFile(QiDataObject):
 		self._loadAnnotations()
 		return self
 
+	def _isModified(self):
+		"""
+		States if the metadata was changed since it was loaded
+
+		:return: True if the metadata needs to be written
+		"""
+		return self._annotations != self._saved_annotations
+
 	@throwIfClosed
 	def _loadAnnotations(self):
 		"""
@@ -208,6 +279,19 @@ class QiDataFile(QiDataObject):
 		# Load annotations
 		self._annotations = xmp_tools._load_annotations(self._xmp_file)
 
+		# Keep a copy to detect changes
+		if self.mode != "r":
+			self._saved_annotations = copy.deepcopy(self._annotations)
+
+	def _saveMetadata(self, xmp_file):
+		"""
+		Writes the metadata
+
+		:param xmp_file: XMP file to write in
+		:type xmp_file: xmp.xmp.XMPFile
+		"""
+		xmp_tools._save_annotations(xmp_file, self._annotations)
+
 	# ───────────────
 	# Context Manager
 
@@ -63,7 +63,7 @@ class QiDataFrame(QiDataFile):
 	# ───────────
 	# Constructor
 
-	def __init__(self, file_path, mode = "r", files=[]):
+	def __init__(self, file_path, mode = "r", files=[], merge=False):
 		"""
 		Create and open a QiDataFrame.
 
@@ -73,11 +73,14 @@ class QiDataFrame(QiDataFile):
 		:type mode: str
 		:param files: list of files that composes the frame
 		:type files: list
+		:param merge: In "w" mode, only lock the frame while it is written
+		              (see ``QiDataFile``)
+		:type merge: bool
 		:raises: TypeError if less than 2 files are given
 		"""
 		self._files = set(files)
 		self._is_valid = True
-		QiDataFile.__init__(self, file_path, mode)
+		QiDataFile.__init__(self, file_path, mode, merge)
 
 	@staticmethod
 	def create(files, parent_corpus_path):
@@ -91,6 +94,11 @@ class QiDataFrame(QiDataFile):
 		:raises: TypeError if less than 2 files are given
 		"""
 		frame_name = os.path.join(parent_corpus_path,str(uuid.uuid4())+".frame.xmp")
+
+		# Create the frame file so that it can be opened
+		with XMPFile(frame_name, rw=True):
+			pass
+
 		frame = QiDataFrame(frame_name, "w", files)
 		return frame
 
@@ -122,23 +130,18 @@ class QiDataFrame(QiDataFile):
 	def annotations(self):
 		return QiDataFile.annotations.__get__(self)
 
-	# ──────────
-	# Public API
-
-	def close(self):
-		"""
-		Closes the file frame after writing the metadata
-		"""
-		if self.mode != "r":
-			# Erase current frame content's metadata
-			_raw_metadata = self._xmp_file.metadata[QIDATA_FRAME_NS]
-			setattr(_raw_metadata, "files", list(self._files))
-
-		QiDataFile.close(self)
-
 	# ───────────
 	# Private API
 
+	def _isModified(self):
+		return QiDataFile._isModified(self)\
+		       or self._files != self._saved_files
+
+	def _saveMetadata(self, xmp_file):
+		QiDataFile._saveMetadata(self, xmp_file)
+		_raw_metadata = xmp_file.metadata[QIDATA_FRAME_NS]
+		setattr(_raw_metadata, "files", list(self._files))
+
 	def _isLocationValid(self, location):
 		"""
 		Checks if a location given with an annotation is correct
@@ -176,9 +179,11 @@ class QiDataFrame(QiDataFile):
 		QiDataFile._open(self)
 
 		# Load content info stored in metadata
+		self._saved_files = None
 		_raw_metadata = self._xmp_file.metadata[QIDATA_FRAME_NS]
 		if _raw_metadata.children:
 			data = _raw_metadata.value
 			xmp_tools._removePrefixes(data)
 			self._files = set(data["files"])
+			self._saved_files = set(self._files)
 		return self
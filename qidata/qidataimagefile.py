@@ -33,22 +33,149 @@ QiDataSensorFile specialization for image files
 """
 
 # Standard libraries
-
+import os
+import struct
+import threading
 
 # Third-party libraries
 import cv2
 from image import Image
+import numpy as np
 
 # Local modules
 from qidata import DataType
 from qidata.qidatasensorfile import QiDataSensorFile
+from qidata import thumbnails
+
+_PNG_SIGNATURE = "\x89PNG\r\n\x1a\n"
+# Number of channels of each PNG color type (as decoded by OpenCV)
+_PNG_CHANNELS = {0:1, 2:3, 3:3, 4:4, 6:4}
+# JPEG markers starting a frame (and giving the image dimensions)
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - set([0xC4, 0xC8, 0xCC])
+# JPEG markers which are not followed by a segment length
+_JPEG_STANDALONE_MARKERS = set(range(0xD0, 0xDA)) | set([0x01])
+
+# Shapes already read, indexed by path, with the mtime and size of the file
+_SHAPES = dict()
+_SHAPES_GUARD = threading.Lock()
+
+def getImageShape(file_path):
+	"""
+	Return the shape of an image, reading only its header
+
+	Shapes are cached, and read again only if the file was modified.
+
+	:param file_path: Path of the image (PNG or JPEG)
+	:type file_path: str
+	:return: Shape of the decoded image, as given by NumPy: (height, width)
+	         or (height, width, channels). None if the header could not be
+	         understood.
+	:rtype: tuple
+	"""
+	stat = os.stat(file_path)
+	stamp = (stat.st_mtime, stat.st_size)
+	with _SHAPES_GUARD:
+		cached = _SHAPES.get(file_path)
+	if cached is not None and cached[0] == stamp:
+		return cached[1]
+
+	with open(file_path, "rb") as _f:
+		shape = _readPNGShape(_f)
+		if shape is None:
+			_f.seek(0)
+			shape = _readJPEGShape(_f)
+	with _SHAPES_GUARD:
+		_SHAPES[file_path] = (stamp, shape)
+	return shape
+
+def isValidLocation(location, shape=None):
+	"""
+	Checks if a location is a valid image region
+
+	:param location: The location to evaluate, of the form [[0,0],[100,100]]
+	                 (coordinates of the upper left and lower right corners)
+	:type location: list
+	:param shape: Shape of the image. If given, the region must also be
+	              properly ordered and lie inside the image.
+	:type shape: tuple
+	:rtype: bool
+	"""
+	try:
+		is_valid = (
+		  isinstance(location[0][0],int)\
+		    and isinstance(location[0][1],int)\
+		    and isinstance(location[1][0],int)\
+		    and isinstance(location[1][1],int)
+		)
+	except Exception:
+		return False
+	if is_valid and shape is not None:
+		height, width = shape[:2]
+		is_valid = (
+		  0 <= location[0][0] <= location[1][0] <= width\
+		    and 0 <= location[0][1] <= location[1][1] <= height
+		)
+	return is_valid
+
+def _readPNGShape(f):
+	"""
+	Read the shape of a PNG image from its IHDR chunk
+	"""
+	header = f.read(26)
+	if len(header) < 26 or not header.startswith(_PNG_SIGNATURE)\
+	   or header[12:16] != "IHDR":
+		return None
+	width, height, _, color_type = struct.unpack(">IIBB", header[16:26])
+	channels = _PNG_CHANNELS.get(color_type)
+	if channels is None:
+		return None
+	return (height, width) if channels == 1 else (height, width, channels)
+
+def _readJPEGShape(f):
+	"""
+	Read the shape of a JPEG image from its first SOF segment
+	"""
+	if f.read(2) != "\xff\xd8":
+		return None
+	while True:
+		byte = f.read(1)
+		if byte == "":
+			return None
+		if byte != "\xff":
+			continue
+		marker = f.read(1)
+		while marker == "\xff":
+			# Fill bytes
+			marker = f.read(1)
+		if marker == "":
+			return None
+		marker = ord(marker)
+		if marker in _JPEG_STANDALONE_MARKERS or marker == 0:
+			continue
+		segment_header = f.read(2)
+		if len(segment_header) < 2:
+			return None
+		length = struct.unpack(">H", segment_header)[0]
+		if marker in _JPEG_SOF_MARKERS:
+			frame_header = f.read(6)
+			if len(frame_header) < 6:
+				return None
+			_, height, width, channels = struct.unpack(">BHHB", frame_header)
+			return (height, width) if channels == 1 else (height, width, channels)
+		f.seek(length - 2, os.SEEK_CUR)
 
 class QiDataImageFile(QiDataSensorFile):
+
+	DEFAULT_TYPE = DataType.IMAGE #: Type of images with no stored type
+
+	#: If True, annotation locations must also lie inside the image
+	check_location_bounds = False
+
 	# ───────────
 	# Constructor
 
 	def __init__(self, file_path, mode = "r"):
-		self._raw_data = Image(file_path)
+		self._raw_data = None
 		QiDataSensorFile.__init__(self, file_path, mode)
 
 	# ──────────
@@ -57,7 +184,7 @@ class QiDataImageFile(QiDataSensorFile):
 	@property
 	def type(self):
 		_t = QiDataSensorFile.type.fget(self)
-		return _t if _t else DataType.IMAGE
+		return _t if _t else self.DEFAULT_TYPE
 
 	@type.setter
 	def type(self, new_type):
@@ -69,9 +196,46 @@ class QiDataImageFile(QiDataSensorFile):
 	def raw_data(self):
 		"""
 		Returns the image opened with OpenCV
+
+		.. note::
+			The image is only decoded when this is first called
 		"""
+		if self._raw_data is None:
+			self._raw_data = Image(self._file_path)
 		return self._raw_data
 
+	@property
+	def shape(self):
+		"""
+		Returns the shape of the image, read from the file header when
+		possible (so that the image does not need to be decoded)
+		"""
+		shape = getImageShape(self._file_path)
+		if shape is None:
+			shape = self.raw_data.numpy_image.shape
+		return shape
+
+	# ──────────
+	# Public API
+
+	def getThumbnail(self, max_size):
+		"""
+		Returns a downscaled version of the image, without decoding it at full
+		resolution (unlike ``raw_data``)
+
+		Thumbnails are kept in a cache next to the image (see
+		:mod:`qidata.thumbnails`), and generated when first requested.
+
+		:param max_size: Maximum length of the thumbnail's sides
+		:type max_size: int
+		:return: Thumbnail (BGR)
+		:rtype: numpy.ndarray
+		"""
+		return thumbnails.getThumbnail(self._file_path, max_size)
+
+	# ───────────
+	# Private API
+
 	def _isLocationValid(self, location):
 		"""
 		Checks if a location given with an annotation is correct
@@ -83,22 +247,53 @@ class QiDataImageFile(QiDataSensorFile):
 			The location is expected to be of the form [[0,0],[100,100]]. It
 			represents a rectangle, by the coordinates of its upper left and
 			lower right corners.
+			If ``check_location_bounds`` is True, the rectangle must also be
+			properly ordered and lie inside the image.
 		"""
 		if location is None: return True
+		return isValidLocation(
+		    location,
+		    self.shape if self.check_location_bounds else None
+		)
+
+	def _areLocationsValid(self, locations):
+		"""
+		Checks several locations at once
+
+		Locations are checked as a single NumPy array. Only if this is not
+		possible (some locations are malformed or not integers) are they
+		checked one by one.
+
+		:param locations: The locations to evaluate
+		:type locations: list
+		:return: For each location, True if it is valid
+		:rtype: numpy.ndarray
+		"""
+		are_valid = np.ones(len(locations), dtype=bool)
+		indexes = [i for i, loc in enumerate(locations) if loc is not None]
+		if len(indexes) == 0:
+			return are_valid
 		try:
-			return (
-			  isinstance(location[0][0],int)\
-			    and isinstance(location[0][1],int)\
-			    and isinstance(location[1][0],int)\
-			    and isinstance(location[1][1],int)
-			)
-		except Exception:
-			return False
+			boxes = np.array([locations[i] for i in indexes])
+		except ValueError:
+			# Ragged locations
+			boxes = None
+		if boxes is None or boxes.shape != (len(indexes), 2, 2)\
+		   or boxes.dtype.kind not in "iu":
+			return super(QiDataImageFile, self)._areLocationsValid(locations)
+
+		if self.check_location_bounds:
+			height, width = self.shape[:2]
+			x0, y0 = boxes[:,0,0], boxes[:,0,1]
+			x1, y1 = boxes[:,1,0], boxes[:,1,1]
+			are_valid[indexes] = (0 <= x0) & (x0 <= x1) & (x1 <= width)\
+			                     & (0 <= y0) & (y0 <= y1) & (y1 <= height)
+		return are_valid
 
 	# ──────────────
 	# Textualization
 
 	def __unicode__(self):
 		res_str = QiDataSensorFile.__unicode__(self)
-		res_str += "Image shape: " + str(self.raw_data.numpy_image.shape) + "\n"
+		res_str += "Image shape: " + str(self.shape) + "\n"
 		return res_str
\ No newline at end of file
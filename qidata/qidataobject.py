@@ -40,12 +40,27 @@ from textualize import textualize_metadata
 
 class ReadOnlyException(Exception):pass
 
+class InvalidAnnotationsException(Exception):
+	"""
+	Raised when some annotations given to ``addAnnotations`` are invalid
+
+	``errors`` holds the index of each invalid annotation with the reason
+	why it was rejected.
+	"""
+	def __init__(self, errors):
+		self.errors = errors
+		Exception.__init__(
+		  self,
+		  "%d invalid annotation(s): "%len(errors)\
+		    + ", ".join(["%d (%s)"%(index, msg) for (index, msg) in errors])
+		)
+
 def throwIfReadOnly(f):
-	def wraps(*args):
+	def wraps(*args, **kwargs):
 		self=args[0]
 		if self.read_only:
 			raise ReadOnlyException("This method cannot be used in read-only")
-		return f(*args)
+		return f(*args, **kwargs)
 
 	# Keep the function docstring
 	wraps.__doc__ = f.__doc__
@@ -151,6 +166,82 @@ class QiDataObject(object):
 		  [annotation, location]
 		)
 
+	@throwIfReadOnly
+	def addAnnotations(self, annotator, annotations, locations=None):
+		"""
+		Adds several annotations at once
+
+		This is equivalent to calling ``addAnnotation`` for each annotation,
+		but types are checked once per class and locations are checked all
+		together (see ``_areLocationsValid``).
+
+		:param annotator: The identifier of the annotations' maker
+		:type annotator: str
+		:param annotations: The annotations to add
+		:type annotations: list
+		:param locations: The area of each annotation (None if no annotation
+		                  has one)
+		:type locations: list or numpy.ndarray
+
+		:raises: ValueError if there are not as many locations as annotations
+		:raises: InvalidAnnotationsException if some annotations or locations
+		         are invalid. In that case, no annotation is added.
+		"""
+		# Make sure self._annotations exists
+		assert(hasattr(self, "_annotations") or self.annotations is not None)
+
+		annotations = list(annotations)
+		if locations is None:
+			locations = [None]*len(annotations)
+		elif hasattr(locations, "tolist"):
+			# Store NumPy arrays as built-in types
+			locations = locations.tolist()
+		else:
+			locations = list(locations)
+		if len(locations) != len(annotations):
+			raise ValueError("%d locations given for %d annotations"%(
+			                   len(locations),
+			                   len(annotations)
+			                 ))
+		if len(annotations) == 0:
+			return
+
+		# Check annotation types, once per class
+		type_names = dict()
+		for annotation in annotations:
+			class_ = type(annotation)
+			if type_names.has_key(class_):
+				continue
+			try:
+				MetadataType[class_.__name__]
+				if not issubclass(class_, MetadataObject):
+					raise KeyError
+				type_names[class_] = class_.__name__
+			except KeyError:
+				type_names[class_] = None
+
+		errors = []
+		are_valid = self._areLocationsValid(locations)
+		for index, annotation in enumerate(annotations):
+			if type_names[type(annotation)] is None:
+				errors.append((index, "annotation is not a proper MetadataObject"))
+			elif not are_valid[index]:
+				errors.append((index, "location %s is invalid"%str(locations[index])))
+		if len(errors) > 0:
+			raise InvalidAnnotationsException(errors)
+
+		# Group annotations by type, and add them
+		grouped = OrderedDict()
+		for annotation, location in zip(annotations, locations):
+			grouped.setdefault(type_names[type(annotation)], []).append(
+			  [annotation, location]
+			)
+		personal_annotations = self._annotations.setdefault(annotator, dict())
+		for annotation_name, new_annotations in grouped.iteritems():
+			personal_annotations.setdefault(annotation_name, list()).extend(
+			  new_annotations
+			)
+
 	def getAnnotations(self, annotator, annotation_type=None):
 		"""
 		Return the list of annotations made by ``annotator`` of type
@@ -277,6 +368,22 @@ class QiDataObject(object):
 			A ``None`` location must always be considered as valid.
 		"""
 
+	def _areLocationsValid(self, locations):
+		"""
+		Determines if several locations given to ``addAnnotations`` are
+		correct.
+
+		:param locations: The locations to test
+		:type locations: list
+		:return: For each location, True if it is valid
+		:rtype: list
+
+		.. note::
+			This calls ``_isLocationValid`` on each location. Subclasses can
+			override it to check them all at once.
+		"""
+		return [self._isLocationValid(location) for location in locations]
+
 	# ──────────────
 	# Textualization
 
@@ -28,12 +28,19 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+# Standard libraries
+import copy
+import os
+import threading
+
 # Third-party libraries
-from xmp.xmp import XMPFile, registerNamespace
+from xmp.xmp import registerNamespace
 
 # Local modules
 from qidata import DataType
 from qidata.metadata_objects import Transform, TimeStamp
+from qidata.metadata_objects.timestamp import toNanoseconds
+from qidata import qidatafile, xmpsession
 from qidata.qidatafile import QiDataFile, throwIfClosed
 from qidata.qidataobject import QiDataObject
 from qidata.qidatasensorobject import QiDataSensorObject
@@ -42,26 +49,109 @@ import _mixin as xmp_tools
 QIDATA_SENSOR_NS=u"http://softbank-robotics.com/qidatasensor/1"
 registerNamespace(QIDATA_SENSOR_NS, "qidatasensor")
 
-class QiDataSensorFile(QiDataSensorObject, QiDataFile):
-
-	# ──────────
-	# Public API
-
-	def close(self):
-		"""
-		Closes the file after writing the metadata
-		"""
-		if self.mode != "r":
-			_raw_metadata = self._xmp_file.metadata[QIDATA_SENSOR_NS]
-			setattr(_raw_metadata, "data_type", self.type)
-			setattr(_raw_metadata, "transform", self.transform)
-			setattr(_raw_metadata, "timestamp", self.timestamp)
+_IDENTITY_POSE = (0., 0., 0., 0., 0., 0., 1.)
+
+# Poses already read, indexed by metadata path, with the mtime and size of
+# the metadata file
+_POSES = dict()
+_POSES_GUARD = threading.Lock()
+
+def _loadDataType(file_path):
+	"""
+	Read the data type stored in a file's metadata, without opening the
+	file's data
+
+	:param file_path: Path of the data file
+	:type file_path: str
+	:return: Stored data type, or None if the file has none
+	:rtype: qidata.DataType
+	"""
+	data = _loadSensorMetadata(file_path)
+	return DataType[data["data_type"]] if data is not None else None
+
+def getPose(file_path):
+	"""
+	Read the transform stored in a file's metadata, without opening the
+	file's data
+
+	Poses are cached, and read again only if the metadata was modified.
+
+	:param file_path: Path of the data file
+	:type file_path: str
+	:return: Translation (x, y, z) followed by the rotation quaternion
+	         (x, y, z, w). The identity if the file has no transform.
+	:rtype: tuple
+	"""
+	xmp_path = qidatafile._findXMPPath(file_path)
+	stat = os.stat(xmp_path)
+	stamp = (stat.st_mtime, stat.st_size)
+	with _POSES_GUARD:
+		cached = _POSES.get(xmp_path)
+	if cached is not None and cached[0] == stamp:
+		return cached[1]
+
+	data = _loadSensorMetadata(file_path)
+	if data is None:
+		pose = _IDENTITY_POSE
+	else:
+		translation = data["transform"]["translation"]
+		rotation = data["transform"]["rotation"]
+		pose = tuple(
+		    [float(translation[k]) for k in "xyz"]\
+		      + [float(rotation[k]) for k in "xyzw"]
+		)
+	with _POSES_GUARD:
+		_POSES[xmp_path] = (stamp, pose)
+	return pose
+
+def getTimestamps(file_paths):
+	"""
+	Read the timestamps stored in several files' metadata, without opening
+	the files' data
+
+	:param file_paths: Paths of the data files
+	:type file_paths: list
+	:return: Timestamps in nanoseconds since Epoch, 0 for files without
+	         sensor metadata
+	:rtype: numpy.ndarray (int64)
+	"""
+	def _pair(file_path):
+		data = _loadSensorMetadata(file_path)
+		if data is None:
+			return (0, 0)
+		return (int(data["timestamp"]["seconds"]),
+		        int(data["timestamp"]["nanoseconds"]))
+	return toNanoseconds(map(_pair, file_paths), len(file_paths))
+
+def _loadSensorMetadata(file_path):
+	"""
+	Read the sensor metadata of a file, without opening the file's data
+
+	:param file_path: Path of the data file
+	:type file_path: str
+	:return: Raw sensor metadata (data type, transform and timestamp), or None
+	         if the file has none
+	:rtype: collections.OrderedDict
+	"""
+	data = xmpsession.getSession().readNamespace(
+	    qidatafile._findXMPPath(file_path), QIDATA_SENSOR_NS
+	)
+	if data is None:
+		return None
+	xmp_tools._removePrefixes(data)
+	return data
 
-		super(QiDataSensorFile, self).close()
+class QiDataSensorFile(QiDataSensorObject, QiDataFile):
 
 	# ───────────
 	# Private API
 
+	def _isModified(self):
+		return super(QiDataSensorFile, self)._isModified()\
+		       or self._saved_sensor_metadata != (self.type,
+		                                          self.transform,
+		                                          self.timestamp)
+
 	@throwIfClosed
 	def _loadAnnotations(self):
 		super(QiDataSensorFile, self)._loadAnnotations()
@@ -75,6 +165,19 @@ class QiDataSensorFile(QiDataSensorObject, QiDataFile):
 			self._position = Transform(**data["transform"])
 			self._timestamp = TimeStamp(**data["timestamp"])
 
+		# Keep a copy to detect changes
+		if self.mode != "r":
+			self._saved_sensor_metadata = copy.deepcopy(
+			    (self.type, self.transform, self.timestamp)
+			)
+
+	def _saveMetadata(self, xmp_file):
+		super(QiDataSensorFile, self)._saveMetadata(xmp_file)
+		_raw_metadata = xmp_file.metadata[QIDATA_SENSOR_NS]
+		setattr(_raw_metadata, "data_type", self.type)
+		setattr(_raw_metadata, "transform", self.transform)
+		setattr(_raw_metadata, "timestamp", self.timestamp)
+
 	# ──────────────
 	# Textualization
 
@@ -29,31 +29,128 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 # Standard libraries
-from collections import OrderedDict
+import base64
+from collections import Counter, OrderedDict
 import copy
+import csv
 import glob
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 import os
+import struct
+import weakref
+import zlib
 
 # Third-party libraries
+import cv2
+import numpy as np
 from xmp.xmp import XMPFile, registerNamespace
 from strong_typing._textualize import textualize_sequence, textualize_mapping
 
 # Local modules
 import qidata
-from qidata import qidataframe, DataType, _BaseEnum
+from qidata import qidataframe, qidatafile, qidatasensorfile, DataType, _BaseEnum
+from qidata import manifest
+from qidata.annotationcache import AnnotationCache
 from qidata.metadata_objects import Context
+from qidata.metadata_objects.timestamp import asNanoseconds, toPairs,\
+                                              NANOSECONDS_PER_SECOND
 from qidata.qidataobject import QiDataObject, throwIfReadOnly
 import _mixin as xmp_tools
+from _lock import FileLock
 
 QIDATA_CONTENT_NS=u"http://softbank-robotics.com/qidataset/1"
 registerNamespace(QIDATA_CONTENT_NS, "qidataset")
 
 METADATA_FILENAME = "metadata.xmp" # Place-holder
 
+# Version of the compact stream encoding
+_STREAM_ENCODING_VERSION = 1
+_STREAM_HEADER = struct.Struct("<BQ")
+
+class FlushException(Exception):
+	"""
+	Raised when some elements of a dataset could not be written on close.
+
+	:ivar errors: pairs of the name of each element which failed and the
+	              exception raised while writing it
+	"""
+	def __init__(self, errors):
+		self.errors = errors
+		Exception.__init__(
+		    self,
+		    "Failed to write %d element(s):\n"%len(errors) + "\n".join(
+		        ["%s: %s"%(name, str(e)) for (name, e) in errors]
+		    )
+		)
+
 def isDataset(path):
     return os.path.isdir(path)\
              and os.path.isfile(os.path.join(path, METADATA_FILENAME))
 
+def _encodeStream(stream):
+	"""
+	Encodes a stream's content in a compact string
+
+	The payload holds a version byte, the number of files, the delta-encoded
+	timestamps (little-endian int64 nanoseconds, in increasing order) and the
+	matching filenames separated by new lines. It is compressed with zlib and
+	encoded in base64 to be stored as a single XMP value.
+
+	:param stream: Stream content, mapping timestamps (nanoseconds) to
+	               filenames
+	:type stream: dict
+	:return: Encoded stream
+	:rtype: str
+	"""
+	timestamps = np.fromiter(stream.iterkeys(), dtype=np.int64,
+	                         count=len(stream))
+	filenames = stream.values()
+	order = np.argsort(timestamps, kind="mergesort")
+	deltas = np.diff(timestamps[order])
+	deltas = np.concatenate([timestamps[order][:1], deltas]).astype("<i8")
+	payload = _STREAM_HEADER.pack(_STREAM_ENCODING_VERSION, len(stream))
+	payload += deltas.tostring()
+	joined_filenames = "\n".join([filenames[i] for i in order])
+	if isinstance(joined_filenames, unicode):
+		joined_filenames = joined_filenames.encode("utf-8")
+	payload += joined_filenames
+	return base64.b64encode(zlib.compress(payload))
+
+def _decodeStream(encoded_stream):
+	"""
+	Decodes a stream encoded by ``_encodeStream``
+
+	:param encoded_stream: Encoded stream
+	:type encoded_stream: str
+	:return: Stream content, mapping timestamps (nanoseconds) to filenames
+	:rtype: dict
+	:raises: ValueError if the encoding version is not supported
+	"""
+	payload = zlib.decompress(base64.b64decode(encoded_stream))
+	version, count = _STREAM_HEADER.unpack_from(payload)
+	if version != _STREAM_ENCODING_VERSION:
+		raise ValueError("Unsupported stream encoding version: %d"%version)
+	if count == 0:
+		return dict()
+	offset = _STREAM_HEADER.size
+	timestamps = np.cumsum(
+	                 np.frombuffer(payload, dtype="<i8", count=count,
+	                               offset=offset)
+	             )
+	offset += 8*count
+	filenames = payload[offset:].split("\n")
+	return dict(zip(timestamps.tolist(), [str(f) for f in filenames]))
+
+def _toPairStream(stream):
+	"""
+	Returns a copy of a stream's content keyed by (sec, nsec) timestamps, as
+	given by the public API (streams are stored with nanosecond timestamps)
+	"""
+	timestamps = np.fromiter(stream.iterkeys(), dtype=np.int64,
+	                         count=len(stream))
+	return dict(zip(toPairs(timestamps), stream.values()))
+
 class QiDataSet(object):
 
 	class AnnotationStatus(_BaseEnum):
@@ -75,7 +172,7 @@ class QiDataSet(object):
 	# ───────────
 	# Constructor
 
-	def __init__(self, folder_path, mode="r"):
+	def __init__(self, folder_path, mode="r", merge=False):
 		"""
 		Open a QiDataSet.
 
@@ -83,6 +180,10 @@ class QiDataSet(object):
 		:type folder_path: str
 		:param mode: opening mode, "r" for reading, "w" for writing
 		:type mode: str
+		:param merge: In "w" mode, do not lock the dataset while it is open,
+		              and merge the changes made to its metadata with those
+		              made by other processes in the meantime when closing it
+		:type merge: bool
 
 		.. warnings::
 
@@ -96,36 +197,33 @@ class QiDataSet(object):
 			In "w" mode, any folder can be opened. If no "metadata.xmp" file is
 			present, one will be created. If there is one, it WILL NOT BE TRUNCATED
 			(unlike the regular "w" mode of file opening).
+
+		.. note::
+
+			The dataset is locked until it is closed: other processes can open
+			it concurrently in "r" mode, but opening it in "w" mode waits for
+			all other users to close it. With ``merge``, the dataset is only
+			locked while its metadata is read and written, so that several
+			processes can edit it (typically, different children of it) at the
+			same time. Each part of the metadata (annotation status, file
+			types, context and each stream) is then merged with the stored
+			one, the latest change winning on conflicts. Frames are likewise
+			only locked while they are written, a frame modified by several
+			processes keeping the last written version.
 		"""
 		if not os.path.isdir(folder_path):
 			raise IOError("%s is not a valid folder"%folder_path)
 
-		self._folder_path = folder_path
-		metadata_path = os.path.join(folder_path, METADATA_FILENAME)
-		if not isDataset(folder_path):
-			if mode == "r" :
-				# This is not an existing qidata dataset and we are not allowed
-				# to create it
-				raise IOError(
-				  "Given path is not a QiData dataset: %s does not exist"%(
-				  	METADATA_FILENAME
-				  )
-				)
-			elif mode=="w":
-				# Folder is not a data set but we can turn it into one
-
-				# We need XMP to create an empty metadata.xmp
-				# Open it with xmp so that metadata.xmp is created
-				with XMPFile(metadata_path, rw=True):
-					pass
-
-		self._annotation_content = dict()
-		self._files_type = dict()
-		self._xmp_file = XMPFile(metadata_path, rw=(mode=="w"))
-		self._is_closed = True
-		self._streams = dict()
-		self._frames = list()
-		self._open()
+		self._lock = FileLock(folder_path)
+		self._lock.acquire(exclusive=(mode=="w"))
+		self._merge = (mode == "w" and merge)
+		try:
+			self._openFolder(folder_path, mode)
+		except:
+			self._lock.release()
+			raise
+		if self._merge:
+			self._lock.release()
 
 	# ──────────
 	# Properties
@@ -195,7 +293,7 @@ class QiDataSet(object):
 		"r" => read-only mode
 		"w" => read/write mode
 		"""
-		return "w" if self._xmp_file.rw else "r"
+		return self._mode
 
 	@property
 	def read_only(self):
@@ -211,6 +309,81 @@ class QiDataSet(object):
 	# ──────────
 	# Public API
 
+	def alignStreams(self, names, tolerance_ns, policy="nearest"):
+		"""
+		Matches the files of several streams on the timestamps of the first one
+
+		For each timestamp of the reference stream (the first one given), every
+		other stream provides the file whose timestamp is the closest
+		("nearest" policy) or the closest one not after it ("previous"
+		policy). Rows where at least one stream has no file within
+		``tolerance_ns`` are dropped.
+
+		:param names: Names of the streams to align, the first one being the
+		              reference
+		:type names: list
+		:param tolerance_ns: Maximum distance allowed between a reference
+		                     timestamp and a matched timestamp, in nanoseconds
+		:type tolerance_ns: int
+		:param policy: "nearest" or "previous"
+		:type policy: str
+		:return: Reference timestamps (int64 nanoseconds) and, for each stream,
+		         the matched filenames and their distance (int64 nanoseconds)
+		         to the reference timestamp
+		:rtype: tuple(numpy.ndarray, collections.OrderedDict)
+		:raises: KeyError if a stream does not exist
+		:raises: ValueError if the policy is unknown or no stream is given
+
+		:Example:
+			>>> ts, aligned = d.alignStreams(["cam2d", "depth"], 20000000)
+			>>> depth_files, depth_distances = aligned["depth"]
+		"""
+		if policy not in ["nearest", "previous"]:
+			raise ValueError("%s is not a valid alignment policy"%policy)
+		if len(names) == 0:
+			raise ValueError("At least one stream is needed for an alignment")
+
+		ref_ts, ref_files = self._getStreamArrays(names[0])
+		keep = np.ones(len(ref_ts), dtype=bool)
+		matches = OrderedDict()
+		matches[names[0]] = (ref_files, np.zeros(len(ref_ts), dtype=np.int64))
+
+		for name in names[1:]:
+			ts, files = self._getStreamArrays(name)
+			if len(ts) == 0:
+				keep[:] = False
+				matches[name] = (np.empty(len(ref_ts), dtype=object),
+				                 np.zeros(len(ref_ts), dtype=np.int64))
+				continue
+
+			# Index of the last timestamp not after each reference timestamp
+			previous = np.searchsorted(ts, ref_ts, side="right") - 1
+			has_previous = previous >= 0
+			previous = np.clip(previous, 0, len(ts)-1)
+			distance = ref_ts - ts[previous]
+			index = previous
+			valid = has_previous
+
+			if policy == "nearest":
+				following = np.clip(previous + has_previous, 0, len(ts)-1)
+				following_distance = ts[following] - ref_ts
+				use_following = np.logical_or(
+				    np.logical_not(has_previous),
+				    following_distance < distance
+				)
+				index = np.where(use_following, following, previous)
+				distance = np.abs(np.where(use_following,
+				                           following_distance,
+				                           distance))
+				valid = np.ones(len(ref_ts), dtype=bool)
+
+			keep &= valid & (distance <= tolerance_ns)
+			matches[name] = (files[index], distance)
+
+		for name in matches:
+			matches[name] = (matches[name][0][keep], matches[name][1][keep])
+		return ref_ts[keep], matches
+
 	def createNewStream(self, name, timestamp_file_pairs):
 		"""
 		Creates a new set of files which should be considered as part
@@ -218,7 +391,9 @@ class QiDataSet(object):
 
 		:param name: Name given to the stream
 		:type name: str
-		:param timestamp_file_pairs: List of pairs of filename and timestamp
+		:param timestamp_file_pairs: List of pairs of timestamp and filename.
+		                             Timestamps are (sec, nsec) pairs,
+		                             TimeStamp instances or nanoseconds.
 		:type timestamp_file_pairs: list
 		:raises: AttributeError if an empty list is given
 		:raises: TypeError if the given files have different types
@@ -227,62 +402,149 @@ class QiDataSet(object):
 			raise AttributeError(
 			        "At least one file is needed to create a stream"
 			      )
-		with self.openChild(timestamp_file_pairs[0][1]) as f:
-			data_type = f.type
-		for i in range(1,len(timestamp_file_pairs)):
-			if timestamp_file_pairs[i][1] in self._files_type[str(data_type)]:
-				continue
-			with self.openChild(timestamp_file_pairs[i][1]) as f:
-				if data_type == f.type:
-					continue
+		file_types = self._getFileTypes(
+		                 [pair[1] for pair in timestamp_file_pairs]
+		             )
+		if len(set(file_types.itervalues())) != 1:
 			raise TypeError("Given files are not all of the same type")
-		self._streams[name] = (data_type, dict(timestamp_file_pairs))
+		data_type = DataType[file_types.itervalues().next()]
+		self._setStream(name, data_type, dict([
+		    (asNanoseconds(timestamp), filename)
+		        for (timestamp, filename) in timestamp_file_pairs
+		]))
 
-	def close(self):
+	def close(self, max_workers=None):
 		"""
 		Closes the dataset after writing the metadata
-		"""
-		if self.mode != "r":
-			# Erase current dataset content's metadata
-			_raw_metadata = self._xmp_file.metadata[QIDATA_CONTENT_NS]
-			for key in _raw_metadata.attributes():
-				del _raw_metadata[key]
 
-			# Save new dataset content's metadata
-			for (key, value) in self._annotation_content.iteritems():
-				setattr(
-				    _raw_metadata.annotation_content,
-				    key[0],
-				    {key[1]:value}
-				)
+		Frames, and children opened with ``openChild`` which are still open,
+		are closed (and written if they were modified) concurrently.
 
-			setattr(
-			    _raw_metadata,
-			    "files_type",
-			    self._files_type
-			)
+		:param max_workers: Maximum number of elements written at the same
+		                    time (defaults to the number of CPUs)
+		:type max_workers: int
+		:raises: FlushException if some elements could not be written. All
+		         other elements are written nonetheless.
 
-			setattr(
-			    _raw_metadata,
-			    "context",
-			    self.context
-			)
+		.. note::
+			Only the parts of the metadata that were modified since the dataset
+			was opened are written (nothing is written if there is no change).
+			They are written in a temporary file which then replaces
+			"metadata.xmp", so that an interruption cannot leave it partially
+			written. If the dataset was opened with ``merge``, they are first
+			merged with the metadata currently stored.
+		"""
+		errors = []
+		try:
+			modified_parts = self._getModifiedParts() if self.mode != "r" else set()
+			self._xmp_file.close()
+			if len(modified_parts) > 0:
+				if self._merge:
+					self._lock.acquire(exclusive=True)
+					self._mergeWithStoredMetadata()
+				with xmp_tools._atomic_update(self._metadata_path) as _xmp_file:
+					self._saveMetadata(_xmp_file, modified_parts)
+				self._markAsSaved()
+		except Exception as e:
+			errors.append((METADATA_FILENAME, e))
+		finally:
+			self._lock.release()
+
+		to_close = self._frames.values()
+		to_close += [f for f in self._opened_children if not f.closed]
+		errors += self._closeAll(to_close, max_workers)
+		self._is_closed = True
 
-			# Save data streams (they need to be a little be reworked to fit
-			# XMP base rules, namely numbers cannot be keys so we add the
-			# letter "t" in front of the timestamps)
-			tmp_streams = dict()
-			for stream_name, stream in self._streams.iteritems():
-				tmp_streams[stream_name] = (stream[0],dict())
-				for (timestamp,filename) in stream[1].iteritems():
-					tmp_streams[stream_name][1]["t%d.%09d"%timestamp] = filename
+		if len(errors) > 0:
+			raise FlushException(errors)
 
-			setattr(_raw_metadata, "streams", tmp_streams)
+	def diff(self, other, max_workers=None):
+		"""
+		Lists the differences between the content of this dataset and of
+		another one (typically, two copies of the same dataset)
+
+		The hashes of the files' data and annotations are compared first
+		(see ``qidata.manifest``). Only the metadata of the files whose
+		annotation hashes differ are read, to find which annotation types
+		changed. Files are examined concurrently.
+
+		:param other: Dataset to compare with (the "new" content)
+		:type other: qidata.qidataset.QiDataSet
+		:param max_workers: Maximum number of files examined at the same time
+		                    (defaults to the number of CPUs)
+		:type max_workers: int
+		:return: Changes, sorted by file name and annotator. Each change is
+		         a tuple (file name, annotator, change, annotation types),
+		         where change is "added", "removed" or "modified". Changes
+		         of a whole file, or of its data, have no annotator and no
+		         annotation type.
+		:rtype: list
+		:raises: IOError if a dataset is not opened in "r" mode
 
-		self._xmp_file.close()
-		for f in self._frames:
-			f.close()
-		self._is_closed = True
+		:Example:
+			>>> with QiDataSet("before") as a, QiDataSet("after") as b:
+			...     a.diff(b)
+			[('image_1.png', 'jdoe', 'modified', ['Face'])]
+		"""
+		if not (self.read_only and other.read_only):
+			raise IOError("Datasets can only be compared in \"r\" mode")
+
+		names = set(self.children)
+		other_names = set(other.children)
+		common = sorted(names & other_names)
+		changes = [(name, None, "removed", []) for name in names - other_names]
+		changes += [(name, None, "added", []) for name in other_names - names]
+
+		hashes = manifest.getManifest(self._folder_path, common, max_workers)
+		other_hashes = manifest.getManifest(other.name, common, max_workers)
+		to_compare = []
+		for name in common:
+			data_hash, annotation_hashes = hashes[name]
+			other_data_hash, other_annotation_hashes = other_hashes[name]
+			if data_hash != other_data_hash:
+				changes.append((name, None, "modified", []))
+			annotators = [
+			    annotator
+			        for annotator in set(annotation_hashes)\
+			                         | set(other_annotation_hashes)
+			            if annotation_hashes.get(annotator)\
+			                 != other_annotation_hashes.get(annotator)
+			]
+			if len(annotators) > 0:
+				to_compare.append((name, annotators))
+
+		def _compare(args):
+			name, annotators = args
+			before = xmp_tools._build_annotations(self._readAnnotations(name))
+			after = xmp_tools._build_annotations(other._readAnnotations(name))
+			file_changes = []
+			for annotator in annotators:
+				if not before.has_key(annotator):
+					file_changes.append((name, annotator, "added",
+					                     sorted(after[annotator].keys())))
+				elif not after.has_key(annotator):
+					file_changes.append((name, annotator, "removed",
+					                     sorted(before[annotator].keys())))
+				else:
+					types = sorted([
+					    t for t in set(before[annotator])|set(after[annotator])
+					        if before[annotator].get(t) != after[annotator].get(t)
+					])
+					if len(types) > 0:
+						file_changes.append((name, annotator, "modified", types))
+			return file_changes
+
+		if len(to_compare) > 0:
+			pool = ThreadPool(min(len(to_compare), max_workers or cpu_count()))
+			try:
+				results = pool.map(_compare, to_compare)
+			finally:
+				pool.close()
+				pool.join()
+			changes += [c for result in results for c in result]
+
+		changes.sort(key=lambda c: (c[0], c[1] or ""))
+		return changes
 
 	def examineContent(self):
 		"""
@@ -299,6 +561,7 @@ class QiDataSet(object):
 		"""
 		_annotation_content = dict()
 		self._files_type = dict()
+		self._file_type = dict()
 		for name in self.children:
 			path = os.path.join(self._folder_path, name)
 			with qidata.open(path, "r") as _f:
@@ -310,9 +573,7 @@ class QiDataSet(object):
 						    annotation_type
 						  )
 						] = QiDataSet.AnnotationStatus.PARTIAL
-				if not self._files_type.has_key(str(_f.type)):
-					self._files_type[str(_f.type)] = []
-				self._files_type[str(_f.type)].append(name)
+				self._registerFileType(name, str(_f.type))
 
 		for _f in self.getAllFrames():
 			for annotator, annotations in _f.annotations.iteritems():
@@ -386,6 +647,157 @@ class QiDataSet(object):
 		# 	if value == True:
 		# 		self._content._data[key] = True
 
+	def extractCrops(self, annotation_type, annotator=None, out=None,
+	                 max_workers=None):
+		"""
+		Saves the regions of the dataset's images described by annotations
+
+		Each image is decoded once, and all its regions are cut out of it
+		and saved as PNG files. A manifest ("manifest.csv") lists, for each
+		saved crop, the image it comes from, the annotator, the annotation
+		type and the region's corners. Images are processed concurrently,
+		and crops are written as soon as they are cut, so that only a few
+		images are in memory at the same time.
+
+		:param annotation_type: Type of the annotations to extract
+		:type annotation_type: str or qidata.MetadataType
+		:param annotator: Only extract annotations made by this annotator (all
+		                  annotators if None)
+		:type annotator: str
+		:param out: Folder in which crops are written (created if needed)
+		:type out: str
+		:param max_workers: Maximum number of images processed at the same
+		                    time (defaults to the number of CPUs)
+		:type max_workers: int
+		:return: Path of the manifest
+		:rtype: str
+		:raises: ValueError if ``out`` is not given
+		:raises: IOError if an image cannot be decoded or a crop written
+
+		.. note::
+			Annotations without location, or whose location is out of the
+			image, are ignored. Other regions are clipped to the image.
+
+		.. note::
+			Crops are named after the full name of their image (extension
+			included), the annotator (path separators replaced by "_"), the
+			annotation type and the annotation's index.
+		"""
+		if out is None:
+			raise ValueError("An output folder must be given")
+		if not os.path.isdir(out):
+			os.makedirs(out)
+		annotation_type = str(annotation_type)
+
+		names = self._getImages()
+
+		def _extract(name):
+			annotations = xmp_tools._build_annotations(
+			    self._readAnnotations(name)
+			)
+			regions = []
+			for _annotator, annotations_by_type in annotations.iteritems():
+				if annotator is not None and _annotator != annotator:
+					continue
+				for _, location in annotations_by_type.get(annotation_type, []):
+					if location is not None:
+						regions.append((_annotator, location))
+			if len(regions) == 0:
+				return []
+
+			image = cv2.imread(os.path.join(self._folder_path, name),
+			                   cv2.IMREAD_UNCHANGED)
+			if image is None:
+				raise IOError("Could not decode %s"%name)
+			boxes = np.array([
+			    [loc[0][0], loc[0][1], loc[1][0], loc[1][1]]
+			        for (_, loc) in regions
+			], dtype=np.int64)
+			np.clip(boxes[:,0::2], 0, image.shape[1], out=boxes[:,0::2])
+			np.clip(boxes[:,1::2], 0, image.shape[0], out=boxes[:,1::2])
+
+			rows = []
+			for index, ((_annotator, _), (x0, y0, x1, y1)) \
+			                           in enumerate(zip(regions, boxes)):
+				if x1 <= x0 or y1 <= y0:
+					continue
+				safe_annotator = _annotator.replace(os.sep, "_")
+				if os.altsep is not None:
+					safe_annotator = safe_annotator.replace(os.altsep, "_")
+				crop_name = "%s_%s_%s_%d.png"%(name, safe_annotator,
+				                               annotation_type, index)
+				if not cv2.imwrite(os.path.join(out, crop_name),
+				                   image[y0:y1, x0:x1]):
+					raise IOError("Could not write %s"%crop_name)
+				rows.append([crop_name, name, _annotator, annotation_type,
+				             x0, y0, x1, y1])
+			return rows
+
+		manifest_path = os.path.join(out, "manifest.csv")
+		with open(manifest_path, "wb") as _f:
+			writer = csv.writer(_f)
+			writer.writerow(["crop", "source", "annotator", "type",
+			                 "x0", "y0", "x1", "y1"])
+			if len(names) == 0:
+				return manifest_path
+			pool = ThreadPool(min(len(names), max_workers or cpu_count()))
+			try:
+				for rows in pool.imap(_extract, names):
+					writer.writerows(rows)
+			finally:
+				pool.close()
+				pool.join()
+		return manifest_path
+
+	def findInvalidLocations(self, max_workers=None):
+		"""
+		Finds the annotations of the dataset's images whose location is not a
+		region of the image
+
+		Image dimensions are read from the files' headers, and annotations
+		from their XMP packets: no image is decoded. Images are examined
+		concurrently.
+
+		:param max_workers: Maximum number of images examined at the same
+		                    time (defaults to the number of CPUs)
+		:type max_workers: int
+		:return: File name, annotator, annotation type, index (among the
+		         annotations of this type) and location of each invalid
+		         annotation
+		:rtype: list
+		"""
+		names = self._getImages()
+
+		def _check(name):
+			shape = qidata.qidataimagefile.getImageShape(
+			    os.path.join(self._folder_path, name)
+			)
+			annotations = xmp_tools._build_annotations(
+			    self._readAnnotations(name)
+			)
+			invalid = []
+			for annotator, annotations_by_type in annotations.iteritems():
+				for annotation_type, typed_annotations \
+				                          in annotations_by_type.iteritems():
+					for index, (_, location) in enumerate(typed_annotations):
+						if location is None:
+							continue
+						if not qidata.qidataimagefile.isValidLocation(location,
+						                                              shape):
+							invalid.append((name, annotator, annotation_type,
+							                index, location))
+			return invalid
+
+		if len(names) == 0:
+			return []
+		pool = ThreadPool(min(len(names), max_workers or cpu_count()))
+		try:
+			results = pool.map(_check, names)
+		finally:
+			pool.close()
+			pool.join()
+		return [r for result in results for r in result]
+
 	@staticmethod
 	def filter(
 	    dataset_list,
@@ -462,10 +874,9 @@ class QiDataSet(object):
 		:return: Every stream known by the data set
 		:rtype: dict
 		"""
-		return copy.deepcopy(
-			dict(
-				(name, data[1]) for (name, data) in self._streams.iteritems()
-			)
+		return dict(
+			(name, _toPairStream(data[1]))
+				for (name, data) in self._streams.iteritems()
 		)
 
 	def getStreamsOfType(self, data_type):
@@ -477,10 +888,10 @@ class QiDataSet(object):
 		:return: Every stream of the requested type known by the data set
 		:rtype: dict
 		"""
-		return copy.deepcopy(
-			dict(
-				(name, data[1]) for (name, data) in self._streams.iteritems() if data[0]==data_type
-			)
+		return dict(
+			(name, _toPairStream(data[1]))
+				for (name, data) in self._streams.iteritems()
+					if data[0]==data_type
 		)
 
 	def getStream(self, stream_name):
@@ -493,7 +904,39 @@ class QiDataSet(object):
 		:rtype: dict
 		:raises: KeyError if stream_name does not exist
 		"""
-		return copy.deepcopy(self._streams[stream_name][1])
+		return _toPairStream(self._streams[stream_name][1])
+
+	def getStreamPoses(self, stream_name, max_workers=None):
+		"""
+		Returns the sensor poses of all the files of a stream, as arrays
+
+		Poses are read concurrently from the files' metadata (the files' data
+		is not loaded), and cached until the files are modified.
+
+		:param stream_name: Data stream of interest
+		:type stream_name: str
+		:param max_workers: Maximum number of files read at the same time
+		                    (defaults to the number of CPUs)
+		:type max_workers: int
+		:return: Timestamps of the stream (int64 nanoseconds) in increasing
+		         order, and the pose of each corresponding file as a (N, 7)
+		         float64 array (translation x, y, z, then rotation quaternion
+		         x, y, z, w). See :mod:`qidata.poses` to process them.
+		:rtype: tuple(numpy.ndarray, numpy.ndarray)
+		:raises: KeyError if stream_name does not exist
+		"""
+		timestamps, files = self._getStreamArrays(stream_name)
+		paths = [os.path.join(self._folder_path, f) for f in files]
+		if len(paths) > 1:
+			pool = ThreadPool(min(len(paths), max_workers or cpu_count()))
+			try:
+				poses = pool.map(qidatasensorfile.getPose, paths)
+			finally:
+				pool.close()
+				pool.join()
+		else:
+			poses = map(qidatasensorfile.getPose, paths)
+		return timestamps, np.array(poses, dtype=np.float64).reshape(-1, 7)
 
 	def getStreamType(self, stream_name):
 		"""
@@ -512,20 +955,50 @@ class QiDataSet(object):
 
 		:param stream_name: Name of the stream to modify
 		:type stream_name: str
-		:param file_timestamp_pair_to_add: Pair of filename and timestamp
+		:param file_timestamp_pair_to_add: Pair of timestamp and filename (see
+		                                   ``createNewStream``)
 		:type file_timestamp_pair_to_add: tuple
 		:raises: KeyError if stream does not exist
 		:raises: ValueError if file is not in the dataset
 		"""
 		_tmp=file_timestamp_pair_to_add
-		if not _tmp[1] in self.children:
+		if not self._streams.has_key(stream_name):
+			raise KeyError(stream_name)
+		if not self._isChild(_tmp[1]):
 			raise ValueError("Given file is not in the dataset")
-		self._streams[stream_name][1][_tmp[0]]=_tmp[1]
+		self._addToStreamIndexes(stream_name, asNanoseconds(_tmp[0]), _tmp[1])
+
+	def addManyToStream(self, stream_name, file_timestamp_pairs_to_add):
+		"""
+		Add several pairs (timestamp, file name) to a data stream
+
+		All pairs are validated before the stream is modified, so the stream
+		is left untouched if one of them is invalid.
+
+		:param stream_name: Name of the stream to modify
+		:type stream_name: str
+		:param file_timestamp_pairs_to_add: Pairs of timestamp and filename
+		:type file_timestamp_pairs_to_add: list
+		:raises: KeyError if stream does not exist
+		:raises: ValueError if a file is not in the dataset
+		"""
+		if not self._streams.has_key(stream_name):
+			raise KeyError(stream_name)
+		children = set(self.children)
+		for (_, filename) in file_timestamp_pairs_to_add:
+			if not filename in children:
+				raise ValueError("%s is not in the dataset"%filename)
+		for (timestamp, filename) in file_timestamp_pairs_to_add:
+			self._addToStreamIndexes(stream_name, asNanoseconds(timestamp),
+			                         filename)
 
 	def removeFromStream(self, stream_name, file_to_remove):
 		"""
 		Remove a file from a data stream
 
+		If the file appears at several timestamps, only its earliest
+		occurrence is removed.
+
 		:param stream_name: Name of the stream to modify
 		:type stream_name: str
 		:param file_to_remove: Name of the file to remove
@@ -533,14 +1006,51 @@ class QiDataSet(object):
 		:raises: KeyError if stream does not exist
 		:raises: ValueError if file is not in the stream
 		"""
-		for (ts, filename) in self._streams[stream_name][1].iteritems():
-			if filename == file_to_remove:
-				self._streams[stream_name][1].pop(ts)
-				break
-		else:
+		if not self._stream_files[stream_name].has_key(file_to_remove):
 			raise ValueError("Given file is not in the stream")
+		self._removeFromStreamIndexes(
+		    stream_name,
+		    min(self._stream_files[stream_name][file_to_remove])
+		)
 		# si le stream devient vide, on devrait le supprimer
 
+	def removeManyFromStream(self, stream_name, files_to_remove):
+		"""
+		Remove several files from a data stream
+
+		All files are validated before the stream is modified, so the stream
+		is left untouched if one of them is not part of it. As with
+		``removeFromStream``, each name removes the earliest occurrence of
+		the file.
+
+		:param stream_name: Name of the stream to modify
+		:type stream_name: str
+		:param files_to_remove: Names of the files to remove
+		:type files_to_remove: list
+		:raises: KeyError if stream does not exist
+		:raises: ValueError if a file is not in the stream
+		"""
+		stream_files = self._stream_files[stream_name]
+		for filename, count in Counter(files_to_remove).iteritems():
+			if len(stream_files.get(filename, [])) < count:
+				raise ValueError("%s is not in the stream"%filename)
+		for filename in files_to_remove:
+			self._removeFromStreamIndexes(
+			    stream_name,
+			    min(stream_files[filename])
+			)
+
+	def getStreamsContaining(self, filename):
+		"""
+		Returns the names of all streams including a given file
+
+		:param filename: Name of the file of interest
+		:type filename: str
+		:return: Names of the streams including ``filename``
+		:rtype: set
+		"""
+		return set(self._file_streams.get(filename, []))
+
 	@throwIfReadOnly
 	def createNewFrame(self, *files):
 		"""
@@ -555,7 +1065,7 @@ class QiDataSet(object):
 		if len(files) < 2:
 			raise TypeError("createNewFrame needs at least 2 files (%d given)"%len(files))
 		frame = qidataframe.QiDataFrame.create(files, self._folder_path)
-		self._frames.append(frame)
+		self._addFrame(frame)
 		return frame
 
 	@throwIfReadOnly
@@ -574,16 +1084,12 @@ class QiDataSet(object):
 			f=files[0]
 		else:
 			f = self.getFrame(*files)
-		if f is None:
+		if f is None or self._frames.get(f._file_path) is not f:
 			return
-		try:
-			self._frames.remove(f)
-		except ValueError:
-			pass
-		else:
-			f.close()
-			f._is_valid=False
-			os.remove(f._file_path)
+		self._removeFrameFromIndexes(f)
+		f.close()
+		f._is_valid=False
+		os.remove(f._file_path)
 
 	def getAllFrames(self):
 		"""
@@ -592,7 +1098,7 @@ class QiDataSet(object):
 		:return: Every frames of the dataset
 		:rtype: list
 		"""
-		return copy.copy(self._frames)
+		return self._frames.values()
 
 	def getFrame(self, *files):
 		"""
@@ -600,14 +1106,92 @@ class QiDataSet(object):
 
 		:param files: files composing the researched frame
 		:param files: str
-		:return: Researched frame
+		:return: Researched frame, or None if no frame matches the requested
+		         files
 		:rtype: :class:``QiDataFrame``
-		:raises: IndexError if no frame matches the requested files
 		"""
+		return self._frames_by_files.get(frozenset(files))
+
+	def getFramesContaining(self, filename):
+		"""
+		Get all frames including a given file
+
+		:param filename: Name of the file of interest
+		:type filename: str
+		:return: Frames including ``filename``
+		:rtype: list
+		"""
+		return list(self._frames_by_file.get(filename, []))
+
+	@throwIfReadOnly
+	def importAnnotations(self, annotations, max_workers=None):
+		"""
+		Adds annotations to many children at once
+
+		Children are opened concurrently, and each one is written only once,
+		with all its new annotations. The annotation content and file types
+		of the dataset are updated in memory, and written with the rest of
+		the dataset's metadata when it is closed.
+
+		:param annotations: Mapping of each child's name with its new
+		                    annotations, given as a mapping of each annotator
+		                    with a list of pairs (annotation, location)
+		:type annotations: dict
+		:param max_workers: Maximum number of children written at the same
+		                    time (defaults to the number of CPUs)
+		:type max_workers: int
+		:raises: IOError if a name is not a child of the dataset
+		:raises: FlushException if some children could not be written. All
+		         other children are written nonetheless.
+
+		:Example:
+			>>> with QiDataSet("dummy/dataset", "w") as d:
+			...     d.importAnnotations({
+			...         "image_1.png": {
+			...             "jdoe": [(Object(type="cup"), [[0,0],[10,10]])]
+			...         }
+			...     })
+		"""
+		for name in annotations:
+			if not self._isChild(name):
+				raise IOError("%s is not a child of the current dataset"%name)
+
+		def _import(name):
+			try:
+				with qidata.open(os.path.join(self._folder_path, name),
+				                 "w") as _f:
+					for annotator, pairs in annotations[name].iteritems():
+						_f.addAnnotations(annotator,
+						                  [annotation for (annotation, _) in pairs],
+						                  [location for (_, location) in pairs])
+					return (name, str(_f.type), None)
+			except Exception as e:
+				return (name, None, e)
+
+		names = sorted(annotations)
+		if len(names) == 0:
+			return
+		pool = ThreadPool(min(len(names), max_workers or cpu_count()))
 		try:
-			return [f for f in self._frames if set(files)==f._files][0]
-		except IndexError:
-			return None
+			results = pool.map(_import, names)
+		finally:
+			pool.close()
+			pool.join()
+
+		errors = []
+		for (name, type_name, e) in results:
+			if e is not None:
+				errors.append((name, e))
+				continue
+			self._registerFileType(name, type_name)
+			for annotator, pairs in annotations[name].iteritems():
+				for (annotation, _) in pairs:
+					key = (annotator, type(annotation).__name__)
+					if not self._annotation_content.has_key(key):
+						self._annotation_content[key] = \
+						  QiDataSet.AnnotationStatus.PARTIAL
+		if len(errors) > 0:
+			raise FlushException(errors)
 
 	def openChild(self, name):
 		"""
@@ -624,12 +1208,53 @@ class QiDataSet(object):
 		if not name in self.children:
 			raise IOError("%s is not a child of the current dataset"%name)
 		if os.path.isfile(path):
-			return qidata.open(path, self.mode)
+			child = qidata.open(path, self.mode)
+			if self.mode != "r":
+				self._opened_children.add(child)
+			return child
 		# elif os.path.isdir(path):
 		# 	return QiDataSet(path, self.mode)
 		else:
 			raise IOError("%s is neither a file nor a folder"%name)
 
+	def shareAnnotations(self, path=None):
+		"""
+		Loads the annotations of all the dataset's children into a compact
+		cache which can be shared with other processes
+
+		The children's metadata are parsed once (concurrently), and then
+		stored in a read-only shared buffer. Processes forked afterwards can
+		query the returned cache without opening or parsing any file.
+
+		:param path: File in which the cache is stored, so that processes
+		             which were not forked from this one can open it with
+		             ``AnnotationCache.open``. If None, the cache is only
+		             stored in memory.
+		:type path: str
+		:return: Annotations of the dataset's children
+		:rtype: qidata.annotationcache.AnnotationCache
+		:raises: IOError if the dataset is not opened in "r" mode
+
+		:Example:
+			>>> with QiDataSet("dummy/dataset", "r") as d:
+			...     cache = d.shareAnnotations()
+			>>> cache.getAnnotations("image_1.png")["jdoe"]["Face"]
+		"""
+		if not self.read_only:
+			raise IOError("Annotations can only be shared in \"r\" mode")
+
+		names = self.children
+		if len(names) > 1:
+			pool = ThreadPool(min(len(names), cpu_count()))
+			try:
+				raw_annotations = pool.map(self._readAnnotations, names)
+			finally:
+				pool.close()
+				pool.join()
+		else:
+			raw_annotations = map(self._readAnnotations, names)
+		return AnnotationCache.create(dict(zip(names, raw_annotations)), path)
+
 	def setAnnotationStatus(self, annotator_name, metadata_type, is_total):
 		"""
 		Set an annotation's status
@@ -654,41 +1279,424 @@ class QiDataSet(object):
 	# ───────────
 	# Private API
 
-	def _open(self):
+	def _addToStreamIndexes(self, stream_name, timestamp, filename):
 		"""
-		Open the data set
+		Adds a file to a stream and keeps the filename indexes up to date
+
+		If the timestamp was already used, the file it pointed to is replaced.
+		A file can appear at several timestamps of the same stream.
 		"""
-		frames = glob.glob(self._folder_path+"/*.frame.xmp")
-		for frame in frames:
-			self._frames.append(
-				qidataframe.QiDataFrame(
-					frame,
-					self.mode
-				)
-			)
-		self._xmp_file.__enter__()
-		self._is_closed = False
+		stream = self._streams[stream_name][1]
+		if stream.has_key(timestamp):
+			self._removeFromStreamIndexes(stream_name, timestamp)
+		stream[timestamp] = filename
+		stream_files = self._stream_files[stream_name]
+		stream_files.setdefault(filename, set()).add(timestamp)
+		self._file_streams.setdefault(filename, set()).add(stream_name)
+		self._modified_streams.add(stream_name)
+
+	def _removeFromStreamIndexes(self, stream_name, timestamp):
+		"""
+		Removes the entry of a stream at a given timestamp and keeps the
+		filename indexes up to date
+		"""
+		filename = self._streams[stream_name][1].pop(timestamp)
+		stream_files = self._stream_files[stream_name]
+		stream_files[filename].discard(timestamp)
+		if len(stream_files[filename]) == 0:
+			stream_files.pop(filename)
+			self._file_streams[filename].discard(stream_name)
+			if len(self._file_streams[filename]) == 0:
+				self._file_streams.pop(filename)
+		self._modified_streams.add(stream_name)
+
+	def _setStream(self, stream_name, data_type, timestamp_file_map):
+		"""
+		Registers a stream and indexes its filenames
 
-		# Load content info stored in metadata
-		_raw_metadata = self._xmp_file.metadata[QIDATA_CONTENT_NS]
-		if _raw_metadata.children:
-			data = _raw_metadata.value
-			xmp_tools._removePrefixes(data)
-			self._annotation_content = dict()
-			if data.has_key("annotation_content"):
-				content = data["annotation_content"]
-				for annotator in content:
-					for annot_type, value in content[annotator].iteritems():
-						value = QiDataSet.AnnotationStatus[value]
-						self._annotation_content[(annotator,annot_type)]=value
-
-			if data.has_key("context"):
-				self._context = Context(**data["context"])
+		:param stream_name: Name of the stream
+		:type stream_name: str
+		:param data_type: Type of the stream's files
+		:type data_type: ``qidata.DataType``
+		:param timestamp_file_map: Stream content
+		:type timestamp_file_map: dict
+		"""
+		if self._streams.has_key(stream_name):
+			for timestamp in self._streams[stream_name][1].keys():
+				self._removeFromStreamIndexes(stream_name, timestamp)
+		self._streams[stream_name] = (data_type, dict())
+		self._stream_files[stream_name] = dict()
+		self._modified_streams.add(stream_name)
+		for (timestamp, filename) in timestamp_file_map.iteritems():
+			self._addToStreamIndexes(stream_name, timestamp, filename)
+
+	def _getFileTypes(self, names):
+		"""
+		Returns the data type of several children
+
+		Types are taken from the dataset's registry when known. Otherwise,
+		they are read from the files' metadata in parallel (without loading
+		the files' data) and registered.
+
+		:param names: Names of the children of interest
+		:type names: list
+		:return: Mapping of each name with its type name
+		:rtype: dict
+		:raises: IOError if a file is not a child of the dataset
+		"""
+		types = dict()
+		unknown = []
+		for name in set(names):
+			if self._file_type.has_key(name):
+				types[name] = self._file_type[name]
+			elif self._isChild(name):
+				unknown.append(name)
 			else:
-				self._context = Context()
+				raise IOError("%s is not a child of the current dataset"%name)
+
+		if len(unknown) == 0:
+			return types
+
+		paths = [os.path.join(self._folder_path, name) for name in unknown]
+		if len(unknown) == 1:
+			read_types = [qidata.getFileDataType(paths[0])]
+		else:
+			pool = ThreadPool(min(len(unknown), cpu_count()))
+			try:
+				read_types = pool.map(qidata.getFileDataType, paths)
+			finally:
+				pool.close()
+				pool.join()
+
+		for name, data_type in zip(unknown, read_types):
+			types[name] = str(data_type)
+			self._registerFileType(name, str(data_type))
+		return types
+
+	def _getImages(self):
+		"""
+		Returns the names of the dataset's images, sorted
+		"""
+		return sorted([
+		    name for (name, type_name)
+		        in self._getFileTypes(self.children).iteritems()
+		            if type_name.startswith("IMAGE")
+		])
+
+	def _registerFileType(self, name, type_name):
+		"""
+		Records the type of a child in both type indexes
 
+		:param name: Name of the child
+		:type name: str
+		:param type_name: Name of the child's data type
+		:type type_name: str
+		"""
+		if self._file_type.get(name) == type_name:
+			return
+		self._unregisterFileType(name)
+		self._file_type[name] = type_name
+		self._files_type.setdefault(type_name, []).append(name)
+
+	def _unregisterFileType(self, name):
+		"""
+		Removes a child from both type indexes
+
+		:param name: Name of the child
+		:type name: str
+		"""
+		type_name = self._file_type.pop(name, None)
+		if type_name is None:
+			return
+		self._files_type[type_name].remove(name)
+		if len(self._files_type[type_name]) == 0:
+			self._files_type.pop(type_name)
+
+	def _readAnnotations(self, name):
+		"""
+		Reads the raw annotations of a child, from its XMP packet only
+
+		:param name: Name of the child
+		:type name: str
+		:return: Raw annotations (see ``qidata._mixin._read_annotations``)
+		:rtype: collections.OrderedDict
+		"""
+		return xmp_tools._read_file_annotations(
+		    qidatafile._findXMPPath(os.path.join(self._folder_path, name))
+		)
+
+	def _isChild(self, name):
+		"""
+		Checks if a file is a supported file of the dataset, without listing
+		the whole folder
+		"""
+		return qidata.isSupportedDataFile(name)\
+		       and os.path.dirname(name) == ""\
+		       and os.path.isfile(os.path.join(self._folder_path, name))
+
+	def _addFrame(self, frame):
+		"""
+		Registers a frame and indexes it by the files composing it
+
+		:param frame: Frame to register
+		:type frame: :class:``QiDataFrame``
+		"""
+		self._frames[frame._file_path] = frame
+		self._frames_by_files.setdefault(frozenset(frame._files), frame)
+		for filename in frame._files:
+			self._frames_by_file.setdefault(filename, []).append(frame)
+
+	def _removeFrameFromIndexes(self, frame):
+		"""
+		Unregisters a frame and removes it from the indexes
+
+		:param frame: Frame to unregister
+		:type frame: :class:``QiDataFrame``
+		"""
+		self._frames.pop(frame._file_path)
+		for filename in frame._files:
+			self._frames_by_file[filename].remove(frame)
+			if len(self._frames_by_file[filename]) == 0:
+				self._frames_by_file.pop(filename)
+
+		key = frozenset(frame._files)
+		if self._frames_by_files.get(key) is frame:
+			# Another frame may be composed of the same files
+			self._frames_by_files.pop(key)
+			for filename in frame._files:
+				for other in self._frames_by_file.get(filename, []):
+					if other._files == frame._files:
+						self._frames_by_files[key] = other
+						return
+				break
+
+	@staticmethod
+	def _closeAll(files, max_workers=None):
+		"""
+		Closes several files concurrently
+
+		:param files: Files to close
+		:type files: list
+		:param max_workers: Maximum number of files closed at the same time
+		                    (defaults to the number of CPUs)
+		:type max_workers: int
+		:return: Pairs of the name of each file which failed to close and the
+		         raised exception
+		:rtype: list
+		"""
+		def _close(f):
+			try:
+				f.close()
+			except Exception as e:
+				return (f.name, e)
+
+		if len(files) == 0:
+			return []
+		elif len(files) == 1:
+			results = [_close(files[0])]
+		else:
+			pool = ThreadPool(min(len(files), max_workers or cpu_count()))
+			try:
+				results = pool.map(_close, files)
+			finally:
+				pool.close()
+				pool.join()
+		return [r for r in results if r is not None]
+
+	def _getModifiedParts(self):
+		"""
+		Lists the parts of the dataset metadata modified since it was last
+		loaded or saved
+
+		:return: Names of the modified parts, among "annotation_content",
+		         "files_type", "context" and "streams"
+		:rtype: set
+		"""
+		if self._saved_state is None:
+			# Nothing was ever saved
+			return set(["annotation_content", "files_type", "context", "streams"])
+
+		modified_parts = set()
+		if self._annotation_content != self._saved_state["annotation_content"]:
+			modified_parts.add("annotation_content")
+		if self._file_type != self._saved_state["files_type"]:
+			modified_parts.add("files_type")
+		if self._context != self._saved_state["context"]:
+			modified_parts.add("context")
+		if len(self._modified_streams) > 0 or self._has_legacy_streams:
+			# Streams stored in the former layout are upgraded by any
+			# dataset opened in "w" mode
+			modified_parts.add("streams")
+		return modified_parts
+
+	def _markAsSaved(self):
+		"""
+		Records the current state as the one stored in "metadata.xmp"
+		"""
+		self._saved_state = dict(
+		    annotation_content=copy.copy(self._annotation_content),
+		    files_type=copy.copy(self._file_type),
+		    context=copy.deepcopy(self._context)
+		)
+		self._modified_streams = set()
+
+	def _saveMetadata(self, xmp_file, parts):
+		"""
+		Writes parts of the dataset metadata
+
+		:param xmp_file: XMP file to write in
+		:type xmp_file: xmp.xmp.XMPFile
+		:param parts: Names of the parts to write (see ``_getModifiedParts``)
+		:type parts: set
+		"""
+		# Erase the parts to rewrite
+		_raw_metadata = xmp_file.metadata[QIDATA_CONTENT_NS]
+		for key in _raw_metadata.attributes():
+			if key.split(":")[-1] in parts:
+				del _raw_metadata[key]
+
+		if "annotation_content" in parts:
+			annotation_content = dict()
+			for (key, value) in self._annotation_content.iteritems():
+				annotation_content.setdefault(key[0], dict())[key[1]] = value
+			setattr(
+			    _raw_metadata,
+			    "annotation_content",
+			    annotation_content
+			)
+
+		if "files_type" in parts:
+			setattr(
+			    _raw_metadata,
+			    "files_type",
+			    self._files_type
+			)
+
+		if "context" in parts:
+			setattr(
+			    _raw_metadata,
+			    "context",
+			    self.context
+			)
+
+		if "streams" in parts:
+			# Save data streams in their compact form (see _encodeStream).
+			# Datasets using the former layout (one "t<sec>.<nsec>" key per
+			# file) are upgraded this way.
+			tmp_streams = dict()
+			for stream_name, stream in self._streams.iteritems():
+				tmp_streams[stream_name] = (stream[0], _encodeStream(stream[1]))
+
+			setattr(_raw_metadata, "streams", tmp_streams)
+			self._has_legacy_streams = False
+
+	def _mergeWithStoredMetadata(self):
+		"""
+		Applies the changes made since the dataset was opened on top of the
+		metadata currently stored, which other processes may have modified
+		"""
+		with XMPFile(self._metadata_path, rw=False) as _xmp_file:
+			stored = self._loadMetadata(_xmp_file)
+		if stored is None:
+			return
+		saved = self._saved_state or dict(
+		    annotation_content=dict(),
+		    files_type=dict(),
+		    context=None
+		)
+
+		# Annotation status
+		annotation_content = stored["annotation_content"]
+		for key in saved["annotation_content"]:
+			if not self._annotation_content.has_key(key):
+				annotation_content.pop(key, None)
+		for key, value in self._annotation_content.iteritems():
+			if saved["annotation_content"].get(key) != value:
+				annotation_content[key] = value
+		self._annotation_content = annotation_content
+
+		# File types
+		file_type = self._file_type
+		self._files_type = dict()
+		self._file_type = dict()
+		for type_name, file_list in stored["files_type"].iteritems():
+			for name in file_list:
+				self._registerFileType(name, type_name)
+		for name in saved["files_type"]:
+			if not file_type.has_key(name) and self._file_type.has_key(name):
+				type_name = self._file_type.pop(name)
+				self._files_type[type_name].remove(name)
+				if len(self._files_type[type_name]) == 0:
+					self._files_type.pop(type_name)
+		for name, type_name in file_type.iteritems():
+			if saved["files_type"].get(name) != type_name:
+				self._registerFileType(name, type_name)
+
+		# Context
+		if self._context == saved["context"]:
+			self._context = stored["context"]
+
+		# Streams
+		for stream_name, stream in stored["streams"].iteritems():
+			if stream_name not in self._modified_streams:
+				self._setStream(stream_name, stream[0], stream[1])
+
+	def _getStreamArrays(self, stream_name):
+		"""
+		Returns a stream as sorted arrays
+
+		:param stream_name: Name of the stream
+		:type stream_name: str
+		:return: Timestamps of the stream (int64 nanoseconds) in increasing
+		         order, and the corresponding filenames
+		:rtype: tuple(numpy.ndarray, numpy.ndarray)
+		:raises: KeyError if stream does not exist
+		"""
+		stream = self._streams[stream_name][1]
+		timestamps = np.fromiter(stream.iterkeys(), dtype=np.int64,
+		                         count=len(stream))
+		files = np.empty(len(stream), dtype=object)
+		files[:] = stream.values()
+		order = np.argsort(timestamps, kind="mergesort")
+		return timestamps[order], files[order]
+
+	def _loadMetadata(self, xmp_file):
+		"""
+		Reads the content information stored in "metadata.xmp"
+
+		:param xmp_file: XMP file to read from
+		:type xmp_file: xmp.xmp.XMPFile
+		:return: Annotation content, file types (lists of files per type),
+		         context and streams stored in the file, or None if it holds
+		         no content information
+		:rtype: dict
+		"""
+		_raw_metadata = xmp_file.metadata[QIDATA_CONTENT_NS]
+		if not _raw_metadata.children:
+			return None
+
+		data = _raw_metadata.value
+		xmp_tools._removePrefixes(data)
+		stored = dict(
+		    annotation_content=dict(),
+		    files_type=dict(),
+		    context=Context(),
+		    streams=dict(),
+		    has_legacy_streams=False
+		)
+		if data.has_key("annotation_content"):
+			content = data["annotation_content"]
+			for annotator in content:
+				for annot_type, value in content[annotator].iteritems():
+					value = QiDataSet.AnnotationStatus[value]
+					stored["annotation_content"][(annotator,annot_type)]=value
+
+		if data.has_key("context"):
+			stored["context"] = Context(**data["context"])
+
+		if data.has_key("files_type"):
 			for file_type, file_list in data["files_type"].iteritems():
-				self._files_type[file_type]=file_list
+				stored["files_type"][file_type]=file_list
 
 		# 	# In a previous version, files_info was counting the number of file
 		# 	# of each type. In the current version, we store for each type the
@@ -714,17 +1722,98 @@ class QiDataSet(object):
 		# 			files_info[str(file_type)].append(path)
 		# 		self._content._type_content = dict(files_info)
 
-			# If streams are defined, load them. We have to go through the
-			# whole structure to make sure that timestamps are properly
-			# converted to float (after removal of the appended prefix letter
-			# and filenames must be converted to string, as this is the type we
-			# use, but they are saved as unicode)
-			if data.has_key("streams") and len(data["streams"])>0:
-				for stream_name, stream in data["streams"].iteritems():
-					self._streams[stream_name] = [DataType[stream[0]],dict()]
+		# If streams are defined, load them. Streams are either stored in
+		# their compact form (see _encodeStream), or in the former layout.
+		# In that case, we have to go through the whole structure to make
+		# sure that timestamps are properly converted to integers (after
+		# removal of the appended prefix letter) and filenames must be
+		# converted to string, as this is the type we use, but they are
+		# saved as unicode)
+		if data.has_key("streams") and len(data["streams"])>0:
+			for stream_name, stream in data["streams"].iteritems():
+				if isinstance(stream[1], basestring):
+					_stream = _decodeStream(str(stream[1]))
+				else:
+					stored["has_legacy_streams"] = True
+					_stream = dict()
 					for (timestamp,filename) in stream[1].iteritems():
-						_ts = tuple(map(int, timestamp[1:].split(".")))
-						self._streams[stream_name][1][_ts] = str(filename)
+						_sec, _nsec = map(int, timestamp[1:].split("."))
+						_ts = _sec*NANOSECONDS_PER_SECOND + _nsec
+						_stream[_ts] = str(filename)
+				stored["streams"][stream_name] = (DataType[stream[0]], _stream)
+		return stored
+
+	def _openFolder(self, folder_path, mode):
+		"""
+		Turn the folder into a dataset if needed (in "w" mode) and open it
+		"""
+		self._folder_path = folder_path
+		metadata_path = os.path.join(folder_path, METADATA_FILENAME)
+		if not isDataset(folder_path):
+			if mode == "r" :
+				# This is not an existing qidata dataset and we are not allowed
+				# to create it
+				raise IOError(
+				  "Given path is not a QiData dataset: %s does not exist"%(
+				  	METADATA_FILENAME
+				  )
+				)
+			elif mode=="w":
+				# Folder is not a data set but we can turn it into one
+
+				# We need XMP to create an empty metadata.xmp
+				# Open it with xmp so that metadata.xmp is created
+				with XMPFile(metadata_path, rw=True):
+					pass
+
+		self._mode = "w" if mode=="w" else "r"
+		self._annotation_content = dict()
+		self._files_type = dict()
+		self._file_type = dict()
+		self._metadata_path = metadata_path
+		self._xmp_file = XMPFile(metadata_path, rw=False)
+		self._is_closed = True
+		self._saved_state = None
+		self._has_legacy_streams = False
+		self._streams = dict()
+		self._stream_files = dict()
+		self._file_streams = dict()
+		self._modified_streams = set()
+		self._frames = OrderedDict()
+		self._opened_children = weakref.WeakSet()
+		self._frames_by_files = dict()
+		self._frames_by_file = dict()
+		self._open()
+
+	def _open(self):
+		"""
+		Open the data set
+		"""
+		frames = glob.glob(self._folder_path+"/*.frame.xmp")
+		for frame in frames:
+			self._addFrame(
+				qidataframe.QiDataFrame(
+					frame,
+					self.mode,
+					merge=self._merge
+				)
+			)
+		self._xmp_file.__enter__()
+		self._is_closed = False
+
+		# Load content info stored in metadata
+		stored = self._loadMetadata(self._xmp_file)
+		if stored is not None:
+			self._annotation_content = stored["annotation_content"]
+			self._context = stored["context"]
+			for file_type, file_list in stored["files_type"].iteritems():
+				self._files_type[file_type]=file_list
+				for name in file_list:
+					self._file_type[name] = file_type
+			for stream_name, stream in stored["streams"].iteritems():
+				self._setStream(stream_name, stream[0], stream[1])
+			self._has_legacy_streams = stored["has_legacy_streams"]
+			self._markAsSaved()
 
 		else:
 			# if no content info was stored, infere it from the files
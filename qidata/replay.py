@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+The ``qidata.replay`` module provides :class:`qidata.replay.StreamReplay`,
+which plays the streams of a dataset back in time order, at the pace they
+were recorded (or at a scaled pace).
+
+:Example:
+
+	>>> with QiDataSet("dummy/dataset", "r") as d:
+	...     replay = StreamReplay(d, ["front_camera", "depth_camera"])
+	>>> for timestamp, stream, name, image in replay:
+	...     pass
+	>>> replay.dropped
+	[]
+"""
+
+# Standard libraries
+from collections import deque
+import heapq
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import os
+import time
+
+# Third-party libraries
+import cv2
+
+# Local modules
+from qidata import thumbnails
+
+class StreamReplay(object):
+	"""
+	Iterates over the files of several streams of a dataset, by increasing
+	timestamp
+
+	Each step is a tuple ``(timestamp, stream, name, data)``, where
+	``timestamp`` is in nanoseconds and ``data`` is the loaded file (see
+	``loader``).
+
+	Streams are merged by timestamp. Upcoming files are loaded concurrently
+	while the current one is used. Files are emitted when the replay clock
+	reaches their timestamp: if the consumer is too slow to keep up, files
+	which are already too late are dropped (see ``dropped``).
+	"""
+
+	# ───────────
+	# Constructor
+
+	def __init__(self, dataset, streams, speed=1.0, max_lag=0.1,
+	             loader=None, prefetch=8, workers=None,
+	             clock=time.time, sleep=time.sleep):
+		"""
+		Prepare the replay of some streams
+
+		:param dataset: Dataset containing the streams
+		:type dataset: qidata.qidataset.QiDataSet
+		:param streams: Names of the streams to replay
+		:type streams: list
+		:param speed: Replay speed, relative to the recording speed. If None,
+		              files are emitted as fast as possible.
+		:type speed: float
+		:param max_lag: Delay (in seconds) after which a late file is
+		                dropped. If None, late files are never dropped.
+		:type max_lag: float
+		:param loader: Function loading a file, given its path. By default,
+		               images are decoded with OpenCV, and the content of
+		               other files is read.
+		:type loader: callable
+		:param prefetch: Number of files loaded in advance
+		:type prefetch: int
+		:param workers: Number of files loaded at the same time (defaults
+		                to the number of CPUs)
+		:type workers: int
+		:param clock: Function giving the current time, in seconds
+		:type clock: callable
+		:param sleep: Function waiting for a given time, in seconds
+		:type sleep: callable
+		:raises: KeyError if a stream does not exist
+		:raises: ValueError if ``speed`` is not positive
+		"""
+		if speed is not None and speed <= 0:
+			raise ValueError("Replay speed must be positive")
+		self._steps = []
+		for name in streams:
+			timestamps, files = dataset._getStreamArrays(name)
+			self._steps.append([
+			    (timestamp, name, str(filename))
+			        for (timestamp, filename) in zip(timestamps.tolist(), files)
+			])
+		self._folder_path = dataset.name
+		self._speed = speed
+		self._max_lag = max_lag
+		self._loader = loader or _loadFile
+		self._prefetch = max(1, prefetch)
+		self._workers = workers or cpu_count()
+		self._clock = clock
+		self._sleep = sleep
+		self._dropped = []
+
+	# ──────────
+	# Properties
+
+	@property
+	def dropped(self):
+		"""
+		Files dropped during the last replay because the consumer was late,
+		as tuples ``(timestamp, stream, name)``
+		"""
+		return list(self._dropped)
+
+	# ──────────
+	# Public API
+
+	def __len__(self):
+		"""
+		Number of files to replay
+		"""
+		return sum([len(steps) for steps in self._steps])
+
+	def __iter__(self):
+		self._dropped = []
+		pool = ThreadPool(self._workers)
+		try:
+			pending = deque()
+			start = None
+			for step in heapq.merge(*self._steps):
+				pending.append((step, pool.apply_async(
+				    self._loader,
+				    (os.path.join(self._folder_path, step[2]),)
+				)))
+				if len(pending) < self._prefetch:
+					continue
+				start, emitted = self._emit(pending.popleft(), start)
+				if emitted is not None:
+					yield emitted
+			while len(pending) > 0:
+				start, emitted = self._emit(pending.popleft(), start)
+				if emitted is not None:
+					yield emitted
+		finally:
+			pool.terminate()
+			pool.join()
+
+	# ───────────
+	# Private API
+
+	def _emit(self, pending_step, start):
+		"""
+		Waits until a file is due, and returns it unless it is too late
+
+		:param pending_step: Step (timestamp, stream, name) and the result
+		                     of its loading
+		:type pending_step: tuple
+		:param start: Replay clock origin (clock time and timestamp of the
+		              first file), or None for the first file
+		:type start: tuple
+		:return: The clock origin, and the step to emit (None if it was
+		         dropped)
+		:rtype: tuple
+		:raises: Any exception raised while loading the file
+		"""
+		(timestamp, stream, name), result = pending_step
+		data = result.get()
+		if start is None:
+			start = (self._clock(), timestamp)
+		elif self._speed is not None:
+			due = start[0] + (timestamp - start[1]) / (1e9 * self._speed)
+			delay = due - self._clock()
+			if delay > 0:
+				self._sleep(delay)
+			elif self._max_lag is not None and -delay > self._max_lag:
+				self._dropped.append((timestamp, stream, name))
+				return start, None
+		return start, (timestamp, stream, name, data)
+
+def _loadFile(path):
+	"""
+	Decode an image, or read the content of another file
+	"""
+	if thumbnails.isImage(path):
+		image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+		if image is None:
+			raise IOError("Could not decode %s"%path)
+		return image
+	with open(path, "rb") as _f:
+		return _f.read()
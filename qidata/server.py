@@ -0,0 +1,491 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+The ``qidata.server`` module provides the ``qidata serve`` daemon, which
+answers queries about a collection of datasets through a Unix socket, so
+that scripts do not need to open (and lock) the datasets, nor read their
+metadata, each time they run.
+
+The daemon keeps an index of each dataset (annotation content, file types,
+streams and the annotation types of each file), built when the dataset is
+first queried and built again when its metadata file changes or when files
+are added to or removed from its folder. The annotation types of a file are
+read again when its annotations change. Datasets are only open while their
+index is built.
+
+Requests and responses are JSON objects, one per line. A request gives the
+name of a query and its parameters, ``{"method": ..., "params": {...}}``,
+and the response either holds its result, ``{"result": ...}``, or the
+reason why it failed, ``{"error": ...}``. See :class:`Catalog` for the
+available queries, and ``qidata_client`` to send them.
+"""
+
+# Standard libraries
+import fnmatch
+import json
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import os
+import socket
+import SocketServer
+import threading
+
+# Third-party libraries
+import numpy as np
+
+# Local modules
+from qidata import qidatafile, qidataset
+from qidata.manifest import _getStamp
+import _mixin as xmp_tools
+from qidata_client import DEFAULT_SOCKET_PATH
+
+class Catalog(object):
+	"""
+	Answers queries about the datasets found in some folders
+
+	Available queries (see the corresponding methods for their parameters):
+
+	- ``datasets``: paths of the known datasets (``getDatasets``)
+	- ``rescan``: look for new datasets (``rescan``)
+	- ``filter``: datasets having some annotations (``filter``)
+	- ``stream_range``: files of a stream between two times
+	  (``getStreamRange``)
+	- ``annotations``: raw annotations of a file (``getAnnotations``)
+	- ``search``: files matching some criteria (``search``)
+	"""
+
+	_QUERIES = dict(
+	    datasets="getDatasets",
+	    rescan="rescan",
+	    filter="filter",
+	    stream_range="getStreamRange",
+	    annotations="getAnnotations",
+	    search="search",
+	)
+
+	# ───────────
+	# Constructor
+
+	def __init__(self, roots, max_workers=None):
+		"""
+		Look for the datasets to serve
+
+		:param roots: Datasets, or folders containing datasets
+		:type roots: list
+		:param max_workers: Maximum number of files read at the same time
+		                    (defaults to the number of CPUs)
+		:type max_workers: int
+		"""
+		self._roots = [os.path.abspath(root) for root in roots]
+		self._max_workers = max_workers
+		# Only guards the two dicts: each dataset has its own lock so that
+		# indexing one of them does not hold queries on the others
+		self._lock = threading.Lock()
+		self._indexes = dict()
+		self._dataset_locks = dict()
+		self.rescan()
+
+	# ──────────
+	# Public API
+
+	def handle(self, request):
+		"""
+		Evaluate a request
+
+		:param request: Name of the query ("method") and its parameters
+		                ("params")
+		:type request: dict
+		:return: Result of the query ("result"), or the reason why it failed
+		         ("error")
+		:rtype: dict
+		"""
+		try:
+			if not Catalog._QUERIES.has_key(request["method"]):
+				raise ValueError("Unknown query: %s"%request["method"])
+			query = getattr(self, Catalog._QUERIES[request["method"]])
+			params = dict([
+			    (str(key), value)
+			        for (key, value) in request.get("params", dict()).iteritems()
+			])
+			return dict(result=query(**params))
+		except Exception as e:
+			return dict(error="%s: %s"%(type(e).__name__, e))
+
+	def getDatasets(self):
+		"""
+		Return the paths of the known datasets
+
+		:rtype: list
+		"""
+		with self._lock:
+			return sorted(self._indexes.keys())
+
+	def rescan(self):
+		"""
+		Look for datasets in the roots again
+
+		:return: Paths of the known datasets
+		:rtype: list
+		"""
+		found = []
+		for root in self._roots:
+			if qidataset.isDataset(root):
+				found.append(root)
+				continue
+			for (folder, subfolders, _) in os.walk(root):
+				if qidataset.isDataset(folder):
+					found.append(folder)
+					# Datasets are not nested
+					del subfolders[:]
+		with self._lock:
+			for path in set(self._indexes) - set(found):
+				self._indexes.pop(path)
+				self._dataset_locks.pop(path, None)
+			for path in found:
+				self._indexes.setdefault(path, None)
+				self._dataset_locks.setdefault(path, threading.Lock())
+			return sorted(self._indexes.keys())
+
+	def filter(self, datasets=None, only_annotated_by=None,
+	           only_with_annotations=None, only_total_annotations=False):
+		"""
+		Return the datasets having some annotations (see
+		``qidata.qidataset.QiDataSet.filter``)
+
+		:param datasets: Datasets to filter (defaults to all known datasets)
+		:type datasets: list
+		:rtype: list
+		"""
+		filtered = []
+		for path in self._getPaths(datasets):
+			for (annotator, annotation_type), is_total\
+			                   in self._getIndex(path)["content"].iteritems():
+				if only_total_annotations and not is_total:
+					continue
+				if only_annotated_by is not None\
+				   and not annotator in only_annotated_by:
+					continue
+				if only_with_annotations is not None\
+				   and not annotation_type in only_with_annotations:
+					continue
+				filtered.append(path)
+				break
+		return filtered
+
+	def getStreamRange(self, dataset, stream, start=None, end=None):
+		"""
+		Return the files of a stream between two times
+
+		:param dataset: Path of the dataset
+		:type dataset: str
+		:param stream: Name of the stream
+		:type stream: str
+		:param start: First time (in nanoseconds), included (defaults to the
+		              beginning of the stream)
+		:type start: int
+		:param end: Last time (in nanoseconds), included (defaults to the
+		            end of the stream)
+		:type end: int
+		:return: Pairs [timestamp (in nanoseconds), file name], by
+		         increasing timestamp
+		:rtype: list
+		:raises: KeyError if the stream does not exist
+		"""
+		streams = self._getIndex(self._getPaths([dataset])[0])["streams"]
+		if not streams.has_key(stream):
+			raise KeyError("%s is not a stream of %s"%(stream, dataset))
+		timestamps, files = streams[stream]
+		first = 0 if start is None\
+		        else np.searchsorted(timestamps, start, side="left")
+		last = len(timestamps) if end is None\
+		       else np.searchsorted(timestamps, end, side="right")
+		return [
+		    [int(t), f] for (t, f) in zip(timestamps[first:last], files[first:last])
+		]
+
+	def getAnnotations(self, dataset, name):
+		"""
+		Return the raw annotations of a file, as stored on disk
+
+		:param dataset: Path of the dataset
+		:type dataset: str
+		:param name: Name of the file
+		:type name: str
+		:return: Raw annotations (see ``qidata._mixin._read_annotations``)
+		:rtype: dict
+		:raises: IOError if the file is not a child of the dataset
+		"""
+		path = self._getPaths([dataset])[0]
+		if not self._getIndex(path)["file_types"].has_key(name):
+			raise IOError("%s is not a child of %s"%(name, dataset))
+		data = xmp_tools._read_file_annotations(
+		    qidatafile._findXMPPath(os.path.join(path, name))
+		)
+		return data if data is not None else dict()
+
+	def search(self, datasets=None, annotator=None, annotation_type=None,
+	           data_type=None, pattern=None):
+		"""
+		Return the files matching some criteria
+
+		:param datasets: Datasets to search (defaults to all known datasets)
+		:type datasets: list
+		:param annotator: Only files annotated by this annotator
+		:type annotator: str
+		:param annotation_type: Only files having this type of annotations
+		:type annotation_type: str
+		:param data_type: Only files of this data type
+		:type data_type: str
+		:param pattern: Only files whose name matches this shell pattern
+		:type pattern: str
+		:return: Pairs [dataset path, file name], sorted
+		:rtype: list
+		"""
+		found = []
+		for path in self._getPaths(datasets):
+			index = self._getIndex(path)
+			names = sorted([
+			    name for (name, type_name) in index["file_types"].iteritems()
+			        if (data_type is None or type_name == data_type)
+			           and (pattern is None or fnmatch.fnmatch(name, pattern))
+			])
+			if annotator is not None or annotation_type is not None:
+				keys = self._getKeys(path, names)
+				names = [
+				    name for name in names if any([
+				        (annotator is None or a == annotator)\
+				          and (annotation_type is None or t == annotation_type)
+				            for (a, t) in keys[name]
+				    ])
+				]
+			found.extend([[path, name] for name in names])
+		return found
+
+	# ───────────
+	# Private API
+
+	def _getPaths(self, datasets):
+		"""
+		Return the paths of some known datasets (all if None)
+
+		:raises: KeyError if a dataset is not known
+		"""
+		with self._lock:
+			if datasets is None:
+				return sorted(self._indexes.keys())
+			paths = [os.path.abspath(dataset) for dataset in datasets]
+			for (dataset, path) in zip(datasets, paths):
+				if not self._indexes.has_key(path):
+					raise KeyError("%s is not a served dataset"%dataset)
+			return paths
+
+	def _getIndex(self, path):
+		"""
+		Return the index of a dataset, built again if its metadata changed or
+		if files were added to or removed from its folder
+		"""
+		stamp = _getStamp(os.path.join(path, qidataset.METADATA_FILENAME))\
+		        + _getStamp(path)
+		with self._lock:
+			index = self._indexes.get(path)
+			dataset_lock = self._dataset_locks[path]
+		if index is not None and index["stamp"] == stamp:
+			return index
+		with dataset_lock:
+			# Another query may have rebuilt it while this one was waiting
+			with self._lock:
+				previous = self._indexes.get(path)
+			if previous is not None and previous["stamp"] == stamp:
+				return previous
+			index = self._loadIndex(path, stamp)
+			index["keys"] = dict() if previous is None else previous["keys"]
+			with self._lock:
+				if self._indexes.has_key(path):
+					self._indexes[path] = index
+			return index
+
+	@staticmethod
+	def _loadIndex(path, stamp):
+		"""
+		Read the content of a dataset
+		"""
+		with qidataset.QiDataSet(path, "r") as ds:
+			return dict(
+			    stamp=stamp,
+			    content=dict([
+			        (key, status == qidataset.QiDataSet.AnnotationStatus.TOTAL)
+			            for (key, status) in ds.annotations_available.iteritems()
+			    ]),
+			    file_types=ds._getFileTypes(ds.children),
+			    streams=dict([
+			        (name, ds._getStreamArrays(name))
+			            for name in ds.getAllStreams()
+			    ]),
+			)
+
+	def _getKeys(self, path, names):
+		"""
+		Return the (annotator, annotation type) pairs present in some files
+		of a dataset
+
+		Files whose annotations changed since they were last read are read
+		again, concurrently.
+		"""
+		xmp_paths = dict([
+		    (name, qidatafile._findXMPPath(os.path.join(path, name)))
+		        for name in names
+		])
+		stamps = dict([(name, _getStamp(xmp_paths[name])) for name in names])
+		with self._lock:
+			keys = self._indexes[path]["keys"]
+			dataset_lock = self._dataset_locks[path]
+		with dataset_lock:
+			outdated = [
+			    name for name in names
+			        if not keys.has_key(name) or keys[name][0] != stamps[name]
+			]
+			if len(outdated) > 0:
+				pool = ThreadPool(
+				    min(len(outdated), self._max_workers or cpu_count())
+				)
+				try:
+					read_keys = pool.map(
+					    lambda name: _readKeys(xmp_paths[name]), outdated
+					)
+				finally:
+					pool.close()
+					pool.join()
+				for (name, file_keys) in zip(outdated, read_keys):
+					keys[name] = (stamps[name], file_keys)
+			return dict([(name, keys[name][1]) for name in names])
+
+class QueryServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+	"""
+	Serves the queries of a catalog on a Unix socket, one thread per
+	connection
+	"""
+
+	daemon_threads = True
+
+	def __init__(self, catalog, socket_path=None):
+		"""
+		Listen on a socket
+
+		:param catalog: Datasets to serve
+		:type catalog: qidata.server.Catalog
+		:param socket_path: Path of the socket (defaults to
+		                    ``qidata_client.DEFAULT_SOCKET_PATH``)
+		:type socket_path: str
+		:raises: IOError if another server listens on this socket
+		"""
+		socket_path = socket_path or DEFAULT_SOCKET_PATH
+		_removeStaleSocket(socket_path)
+		self.catalog = catalog
+		SocketServer.UnixStreamServer.__init__(self, socket_path, _QueryHandler)
+		os.chmod(socket_path, 0600)
+
+	def server_close(self):
+		SocketServer.UnixStreamServer.server_close(self)
+		try:
+			os.remove(self.server_address)
+		except OSError:
+			pass
+
+class _QueryHandler(SocketServer.StreamRequestHandler):
+	"""
+	Answers the requests received on a connection, until it is closed
+	"""
+
+	def handle(self):
+		for line in iter(self.rfile.readline, ""):
+			try:
+				response = self.server.catalog.handle(json.loads(line))
+			except ValueError as e:
+				response = dict(error="%s: %s"%(type(e).__name__, e))
+			self.wfile.write(json.dumps(response) + "\n")
+			self.wfile.flush()
+
+def serve(roots, socket_path=None, max_workers=None):
+	"""
+	Serve the datasets found in some folders, until interrupted
+
+	:param roots: Datasets, or folders containing datasets
+	:type roots: list
+	:param socket_path: Path of the socket (defaults to
+	                    ``qidata_client.DEFAULT_SOCKET_PATH``)
+	:type socket_path: str
+	:param max_workers: Maximum number of files read at the same time
+	                    (defaults to the number of CPUs)
+	:type max_workers: int
+	"""
+	server = QueryServer(Catalog(roots, max_workers), socket_path)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+
+# ───────
+# Helpers
+
+def _readKeys(xmp_path):
+	"""
+	Return the (annotator, annotation type) pairs present in an XMP packet
+	"""
+	data = xmp_tools._read_file_annotations(xmp_path)
+	if data is None:
+		return []
+	return [
+	    [str(annotator), str(annotation_type)]
+	        for (annotator, annotations) in data.iteritems()
+	            for (annotation_type, typed_annotations) in annotations.iteritems()
+	                if len(typed_annotations) > 0
+	]
+
+def _removeStaleSocket(socket_path):
+	"""
+	Remove a socket left by a server which is not running anymore
+
+	:raises: IOError if a server listens on the socket
+	"""
+	if not os.path.exists(socket_path):
+		return
+	probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		probe.connect(socket_path)
+	except socket.error:
+		os.remove(socket_path)
+		return
+	finally:
+		probe.close()
+	raise IOError("A server is already listening on %s"%socket_path)
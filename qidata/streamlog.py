@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+The ``qidata.streamlog`` module packs a dataset stream into a single file,
+which can be read sequentially (or randomly) without opening the stream's
+files and their metadata one by one.
+
+A stream log is made of:
+
+ - a header, identifying the format and giving the number of records
+ - an index, giving the timestamp (in nanoseconds), offset and size of each
+   record, sorted by timestamp
+ - the records. Each one holds the timestamp, the pose (translation and
+   rotation quaternion) and the name of a file, followed by the file's
+   content (the encoded image, for image streams) and its raw annotations
+   (in JSON, so that reading a log never runs code from it).
+
+:Example:
+
+	>>> with QiDataSet("dummy/dataset", "r") as d:
+	...     exportStreamLog(d, "front_camera", "front_camera.qdl")
+	>>> log = StreamLog("front_camera.qdl")
+	>>> image = log.getImage(log.getIndex(1500000000))
+"""
+
+# Standard libraries
+from collections import deque, OrderedDict
+import json
+import mmap
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import os
+import struct
+import tempfile
+
+# Third-party libraries
+import cv2
+import numpy as np
+
+# Local modules
+from qidata import qidatasensorfile
+from qidata.metadata_objects.timestamp import asNanoseconds
+import _mixin as xmp_tools
+
+# Identifies the file format, followed by the number of records
+_LOG_HEADER = struct.Struct("<4sQ")
+_LOG_MAGIC = "QDL2"
+
+# Timestamp, offset and size of each record
+_INDEX_DTYPE = np.dtype([("timestamp", "<i8"), ("offset", "<u8"), ("size", "<u8")])
+
+# Timestamp, pose, and sizes of the name, data and annotations of a record
+_RECORD_HEADER = struct.Struct("<q7dIQI")
+
+def exportStreamLog(dataset, stream_name, out_path, max_workers=None):
+	"""
+	Pack a stream of a dataset into a stream log
+
+	Files are read concurrently, and records are written in timestamp order
+	as soon as they are ready. At most twice as many files as workers are
+	read in advance, so that memory use does not depend on the stream size.
+
+	:param dataset: Dataset containing the stream
+	:type dataset: qidata.qidataset.QiDataSet
+	:param stream_name: Name of the stream
+	:type stream_name: str
+	:param out_path: Path of the stream log to write
+	:type out_path: str
+	:param max_workers: Maximum number of files read at the same time
+	                    (defaults to the number of CPUs)
+	:type max_workers: int
+	:return: Number of records
+	:rtype: int
+	:raises: KeyError if stream does not exist
+	"""
+	timestamps, files = dataset._getStreamArrays(stream_name)
+	folder_path = dataset.name
+
+	def _read(args):
+		timestamp, name = args
+		path = os.path.join(folder_path, name)
+		with open(path, "rb") as _f:
+			data = _f.read()
+		annotations = json.dumps(dataset._readAnnotations(name),
+		                         separators=(",", ":"))
+		return "".join([
+		    _RECORD_HEADER.pack(timestamp, *(
+		        qidatasensorfile.getPose(path)
+		          + (len(name), len(data), len(annotations))
+		    )),
+		    name, data, annotations
+		])
+
+	index = np.zeros(len(files), dtype=_INDEX_DTYPE)
+	index["timestamp"] = timestamps
+
+	# Write the log next to its final location before moving it there, so
+	# that readers never see a partial file
+	_fd, tmp_path = tempfile.mkstemp(
+	    dir=os.path.dirname(os.path.abspath(out_path)),
+	    prefix="."+os.path.basename(out_path)+"."
+	)
+	try:
+		with os.fdopen(_fd, "wb") as _f:
+			_f.write(_LOG_HEADER.pack(_LOG_MAGIC, len(files)))
+			_f.write(index.tobytes())
+			offset = _LOG_HEADER.size + index.nbytes
+			if len(files) > 0:
+				workers = min(len(files), max_workers or cpu_count())
+				pool = ThreadPool(workers)
+				try:
+					pending = deque()
+					written = 0
+					for item in zip(timestamps.tolist(),
+					                [str(f) for f in files]):
+						pending.append(pool.apply_async(_read, (item,)))
+						if len(pending) < 2*workers:
+							continue
+						offset = _writeRecord(_f, index, written,
+						                      pending.popleft().get(), offset)
+						written += 1
+					while len(pending) > 0:
+						offset = _writeRecord(_f, index, written,
+						                      pending.popleft().get(), offset)
+						written += 1
+				finally:
+					pool.terminate()
+					pool.join()
+			_f.seek(_LOG_HEADER.size)
+			_f.write(index.tobytes())
+		os.rename(tmp_path, out_path)
+	finally:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+	return len(files)
+
+class StreamLog(object):
+	"""
+	Memory-mapped, read-only access to a stream log
+	"""
+
+	# ───────────
+	# Constructor
+
+	def __init__(self, path):
+		"""
+		Open a stream log written by ``exportStreamLog``
+
+		:param path: Path of the stream log
+		:type path: str
+		:raises: ValueError if the file is not a stream log
+		"""
+		with open(path, "rb") as _f:
+			self._buffer = mmap.mmap(_f.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			magic, count = _LOG_HEADER.unpack_from(self._buffer, 0)
+		except struct.error:
+			magic = None
+		if magic != _LOG_MAGIC:
+			self._buffer.close()
+			raise ValueError("%s is not a stream log"%path)
+		self._index = np.frombuffer(self._buffer, dtype=_INDEX_DTYPE,
+		                            count=count, offset=_LOG_HEADER.size)
+
+	# ──────────
+	# Properties
+
+	@property
+	def timestamps(self):
+		"""
+		Timestamps of the records (int64 nanoseconds), in increasing order
+		"""
+		return self._index["timestamp"].astype(np.int64)
+
+	# ──────────
+	# Public API
+
+	def getIndex(self, timestamp, policy="nearest"):
+		"""
+		Find the record at a given time
+
+		:param timestamp: Time of interest, in nanoseconds
+		:type timestamp: int or qidata.metadata_objects.TimeStamp
+		:param policy: Return the record whose timestamp is the closest one
+		               ("nearest"), or the closest one not after the given
+		               time ("previous")
+		:type policy: str
+		:return: Index of the record
+		:rtype: int
+		:raises: ValueError if the policy is unknown
+		:raises: KeyError if there is no matching record
+		"""
+		if policy not in ["nearest", "previous"]:
+			raise ValueError("%s is not a valid policy"%policy)
+		timestamp = asNanoseconds(timestamp)
+		timestamps = self._index["timestamp"]
+		previous = int(np.searchsorted(timestamps, timestamp, side="right")) - 1
+		if policy == "nearest" and previous+1 < len(timestamps):
+			if previous < 0 or timestamps[previous+1] - timestamp \
+			                     < timestamp - timestamps[previous]:
+				return previous+1
+		if previous < 0:
+			raise KeyError("No record at %d"%timestamp)
+		return previous
+
+	def getRecord(self, index):
+		"""
+		Read a record
+
+		:param index: Index of the record
+		:type index: int
+		:return: Timestamp (in nanoseconds), file name, pose (translation
+		         followed by the rotation quaternion), file content and
+		         annotations (in the same form as
+		         ``qidata.qidatafile.QiDataFile.annotations``)
+		:rtype: tuple
+		:raises: IndexError if there is no such record
+		"""
+		timestamp, pose, name, data, annotations = self._readRecord(index)
+		annotations = xmp_tools._build_annotations(
+		    json.loads(annotations, object_pairs_hook=OrderedDict)
+		)
+		return timestamp, name, pose, data, annotations
+
+	def getImage(self, index, flags=cv2.IMREAD_UNCHANGED):
+		"""
+		Decode the image of a record, without reading its annotations
+
+		:param index: Index of the record
+		:type index: int
+		:param flags: OpenCV decoding flags
+		:type flags: int
+		:return: Decoded image
+		:rtype: numpy.ndarray
+		:raises: IndexError if there is no such record
+		:raises: IOError if the record does not hold an image
+		"""
+		data = self._readRecord(index)[3]
+		image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+		if image is None:
+			raise IOError("Record %d does not hold an image"%index)
+		return image
+
+	def close(self):
+		"""
+		Release the memory map
+		"""
+		self._index = None
+		self._buffer.close()
+
+	def __len__(self):
+		return len(self._index)
+
+	def __iter__(self):
+		for index in range(len(self._index)):
+			yield self.getRecord(index)
+
+	# ───────────
+	# Private API
+
+	def _readRecord(self, index):
+		"""
+		Split a record in its parts, without decoding them
+		"""
+		if not -len(self._index) <= index < len(self._index):
+			raise IndexError("Record index out of range")
+		offset = int(self._index[index]["offset"])
+		fields = _RECORD_HEADER.unpack_from(self._buffer, offset)
+		name_size, data_size, annotations_size = fields[8:]
+		start = offset + _RECORD_HEADER.size
+		name = self._buffer[start:start+name_size]
+		start += name_size
+		data = self._buffer[start:start+data_size]
+		start += data_size
+		annotations = self._buffer[start:start+annotations_size]
+		return fields[0], fields[1:8], name, data, annotations
+
+# ───────
+# Helpers
+
+def _writeRecord(out, index, position, record, offset):
+	"""
+	Append a record to a stream log being written, and index it
+
+	:return: Offset following the record
+	:rtype: int
+	"""
+	out.write(record)
+	index["offset"][position] = offset
+	index["size"][position] = len(record)
+	return offset + len(record)
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+The ``qidata.thumbnails`` module keeps downscaled versions of images, so
+that they can be displayed without decoding them at full resolution.
+
+Thumbnails are stored as JPEG files in a hidden folder next to the images
+(see ``CACHE_FOLDER``), at a few fixed sizes forming a pyramid (see
+``THUMBNAIL_SIZES``). They are named after the hash of the image content,
+so identical images share their thumbnails and a modified image gets new
+ones. The hash of each image is recorded along with its modification time
+and size, so that it is only computed again when the image changes.
+"""
+
+# Standard libraries
+import hashlib
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import os
+import tempfile
+
+# Third-party libraries
+import cv2
+
+# Local modules
+import qidata
+
+#: Folder, next to the images, in which thumbnails are stored
+CACHE_FOLDER = os.path.join(".qidata_cache", "thumbnails")
+
+#: Sizes of the stored thumbnails (length of their longest side)
+THUMBNAIL_SIZES = (64, 128, 256, 512, 1024)
+
+# Reduced-resolution decoding modes (mostly useful for JPEG files, which can
+# be decoded directly at a lower resolution), from the smallest one
+_REDUCED_MODES = [
+    (factor, getattr(cv2, "IMREAD_REDUCED_COLOR_%d"%factor))
+        for factor in (8, 4, 2)
+            if hasattr(cv2, "IMREAD_REDUCED_COLOR_%d"%factor)
+]
+
+def getThumbnail(image_path, max_size):
+	"""
+	Return a downscaled version of an image
+
+	The thumbnail is read from the cache, and generated first if needed.
+
+	:param image_path: Path of the image
+	:type image_path: str
+	:param max_size: Maximum length of the thumbnail's sides
+	:type max_size: int
+	:return: Thumbnail (BGR), whose longest side is ``max_size``, or the
+	         image itself if it is smaller
+	:rtype: numpy.ndarray
+	:raises: IOError if the image cannot be decoded
+	"""
+	size = _getCachedSize(max_size)
+	if size is None:
+		# Bigger than any thumbnail
+		return _fit(_decode(image_path, max_size), max_size)
+
+	thumbnail_path = _getThumbnailPaths(image_path)[size]
+	thumbnail = cv2.imread(thumbnail_path, cv2.IMREAD_COLOR)
+	if thumbnail is None:
+		makeThumbnails(image_path)
+		thumbnail = cv2.imread(thumbnail_path, cv2.IMREAD_COLOR)
+	return _fit(thumbnail, max_size)
+
+def makeThumbnails(image_path):
+	"""
+	Generate all the thumbnails of an image, if they do not exist yet
+
+	The image is decoded once, at the lowest resolution possible.
+
+	:param image_path: Path of the image
+	:type image_path: str
+	:raises: IOError if the image cannot be decoded
+	"""
+	paths = _getThumbnailPaths(image_path)
+	if all(os.path.exists(path) for path in paths.itervalues()):
+		return
+
+	image = _decode(image_path, THUMBNAIL_SIZES[-1])
+	for size in reversed(THUMBNAIL_SIZES):
+		path = paths[size]
+		image = _fit(image, size)
+		_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+		                                 prefix=".",
+		                                 suffix=".jpg")
+		os.close(_fd)
+		try:
+			cv2.imwrite(tmp_path, image)
+			os.rename(tmp_path, path)
+		finally:
+			if os.path.exists(tmp_path):
+				os.remove(tmp_path)
+
+def makeFolderThumbnails(folder_path, max_workers=None):
+	"""
+	Generate the thumbnails of all the images of a folder, concurrently
+
+	:param folder_path: Path of the folder (typically, a dataset)
+	:type folder_path: str
+	:param max_workers: Maximum number of images processed at the same time
+	                    (defaults to the number of CPUs)
+	:type max_workers: int
+	:return: Names of the images whose thumbnails could not be generated,
+	         with the raised exception
+	:rtype: list
+	"""
+	names = sorted([name for name in os.listdir(folder_path) if isImage(name)])
+
+	def _make(name):
+		try:
+			makeThumbnails(os.path.join(folder_path, name))
+		except Exception as e:
+			return (name, e)
+
+	if len(names) == 0:
+		return []
+	pool = ThreadPool(min(len(names), max_workers or cpu_count()))
+	try:
+		results = pool.map(_make, names)
+	finally:
+		pool.close()
+		pool.join()
+	return [r for r in results if r is not None]
+
+def isImage(file_path):
+	"""
+	Return True if the file is an image supported by qidata
+
+	:param file_path: Path of the file to test
+	:type file_path: str
+	:rtype: bool
+	"""
+	for pattern, file_class in qidata._LOOKUP_ITEM_MODEL.iteritems():
+		if pattern.match(file_path):
+			return file_class.DEFAULT_TYPE == qidata.DataType.IMAGE
+	return False
+
+# ───────
+# Helpers
+
+def _getCachedSize(max_size):
+	"""
+	Return the size of the smallest thumbnail from which a thumbnail of
+	``max_size`` can be made, or None if they are all too small
+	"""
+	for size in THUMBNAIL_SIZES:
+		if size >= max_size:
+			return size
+	return None
+
+def _getThumbnailPaths(image_path):
+	"""
+	Return the paths of the thumbnails of an image, indexed by size, creating
+	the cache folder if needed
+	"""
+	folder = os.path.dirname(os.path.abspath(image_path))
+	cache_folder = os.path.join(folder, CACHE_FOLDER)
+	if not os.path.isdir(cache_folder):
+		try:
+			os.makedirs(cache_folder)
+		except OSError:
+			# Created concurrently
+			if not os.path.isdir(cache_folder):
+				raise
+	content_hash = _getContentHash(image_path)
+	return dict([
+	    (size, os.path.join(cache_folder, "%s_%d.jpg"%(content_hash, size)))
+	        for size in THUMBNAIL_SIZES
+	])
+
+def _getContentHash(image_path):
+	"""
+	Return the hash of an image content
+
+	The hash is stored in the cache folder with the image modification time
+	and size, and computed again only if one of them changed.
+	"""
+	folder, name = os.path.split(os.path.abspath(image_path))
+	key_path = os.path.join(folder, CACHE_FOLDER, name + ".key")
+	stat = os.stat(image_path)
+	stamp = "%r %d"%(stat.st_mtime, stat.st_size)
+	try:
+		with open(key_path) as _f:
+			stored_stamp, content_hash = _f.read().rsplit(" ", 1)
+		if stored_stamp == stamp:
+			return content_hash
+	except (IOError, ValueError):
+		pass
+
+	sha1 = hashlib.sha1()
+	with open(image_path, "rb") as _f:
+		for block in iter(lambda: _f.read(1<<20), ""):
+			sha1.update(block)
+	content_hash = sha1.hexdigest()
+
+	_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(key_path), prefix=".")
+	with os.fdopen(_fd, "w") as _f:
+		_f.write("%s %s"%(stamp, content_hash))
+	os.rename(tmp_path, key_path)
+	return content_hash
+
+def _decode(image_path, min_size):
+	"""
+	Decode an image at the lowest resolution keeping its longest side above
+	``min_size`` (or at full resolution)
+
+	The reduction factor is chosen from the image header, so that the image
+	is decoded only once.
+	"""
+	shape = qidata.qidataimagefile.getImageShape(image_path)
+	mode = cv2.IMREAD_COLOR
+	if shape is not None:
+		longest = max(shape[:2])
+		for factor, reduced_mode in _REDUCED_MODES:
+			# Reduced images are rounded up
+			if -(-longest // factor) >= min_size:
+				mode = reduced_mode
+				break
+	image = cv2.imread(image_path, mode)
+	if image is None:
+		raise IOError("Could not decode %s"%image_path)
+	return image
+
+def _fit(image, max_size):
+	"""
+	Downscale an image so that its longest side is at most ``max_size``
+	"""
+	height, width = image.shape[:2]
+	scale = float(max_size) / max(height, width)
+	if scale >= 1:
+		return image
+	return cv2.resize(image,
+	                  (max(1, int(round(width*scale))),
+	                   max(1, int(round(height*scale)))),
+	                  interpolation=cv2.INTER_AREA)
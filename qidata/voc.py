@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+The ``qidata.voc`` module imports annotations stored in the XML format used
+by the Pascal VOC dataset (one XML file per image).
+"""
+
+# Standard libraries
+import glob
+import os
+import xml.etree.cElementTree as ElementTree
+
+# Local modules
+from qidata.metadata_objects import Object
+
+def importVOC(dataset, xml_paths, annotator, max_workers=None):
+	"""
+	Add the annotations of Pascal VOC XML files to a dataset's images
+
+	Each object of a VOC file becomes an ``Object`` annotation of the image
+	named by the file, whose type is the object name and whose location is
+	the object's bounding box. Annotations are grouped by image, so that
+	each image's metadata is written once (see
+	``QiDataSet.importAnnotations``).
+
+	:param dataset: Dataset to which annotations are added, opened in "w"
+	                mode
+	:type dataset: qidata.qidataset.QiDataSet
+	:param xml_paths: Paths of the VOC XML files, or of a folder containing
+	                  them
+	:type xml_paths: list or str
+	:param annotator: Annotator of the imported annotations
+	:type annotator: str
+	:param max_workers: Maximum number of images written at the same time
+	                    (defaults to the number of CPUs)
+	:type max_workers: int
+	:return: Number of imported annotations
+	:rtype: int
+	:raises: IOError if an image is not a child of the dataset
+	:raises: ValueError if a file is not a valid VOC annotation
+
+	.. note::
+		VOC boxes are 1-based and include their last pixel. They are
+		converted to qidata locations, whose first corner is 0-based and
+		whose second corner is excluded.
+	"""
+	if isinstance(xml_paths, basestring):
+		xml_paths = sorted(glob.glob(os.path.join(xml_paths, "*.xml")))
+
+	annotations = dict()
+	count = 0
+	for xml_path in xml_paths:
+		name, objects = _readVOC(xml_path)
+		pairs = annotations.setdefault(name, dict()).setdefault(annotator, [])
+		pairs.extend(objects)
+		count += len(objects)
+
+	dataset.importAnnotations(annotations, max_workers)
+	return count
+
+def _readVOC(xml_path):
+	"""
+	Read the image name and the objects of a VOC XML file
+
+	:return: Image name, and pairs (annotation, location) of its objects
+	:rtype: tuple
+	"""
+	root = ElementTree.parse(xml_path).getroot()
+	name = root.findtext("filename")
+	if root.tag != "annotation" or not name:
+		raise ValueError("%s is not a VOC annotation file"%xml_path)
+
+	objects = []
+	for element in root.iterfind("object"):
+		box = element.find("bndbox")
+		try:
+			x0, y0, x1, y1 = [
+			    int(round(float(box.findtext(k))))
+			        for k in ("xmin", "ymin", "xmax", "ymax")
+			]
+		except (AttributeError, TypeError, ValueError):
+			raise ValueError("Invalid bounding box in %s"%xml_path)
+		objects.append((Object(type=str(element.findtext("name", ""))),
+		                [[x0-1, y0-1], [x1, y1]]))
+	return os.path.basename(name), objects
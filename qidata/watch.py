@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+The ``qidata.watch`` module provides :class:`qidata.watch.DatasetWatcher`,
+which keeps an open dataset consistent with changes made on disk by other
+processes (children, their external annotation files, and frame files
+being added, removed or modified).
+
+Changes are detected by comparing the modification time and size of the
+dataset's files, at a regular interval. When ``pyinotify`` is available,
+the folder is only examined after the system notified a change in it.
+
+:Example:
+
+	>>> d = QiDataSet("dummy/dataset", "r")
+	>>> def onChange(changes):
+	...     print changes
+	>>> with DatasetWatcher(d, onChange, interval=0.5):
+	...     serve(d)
+	[('image_1.png', 'modified')]
+"""
+
+# Standard libraries
+from collections import Counter
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import os
+import threading
+
+# Third-party libraries
+try:
+	import pyinotify
+	has_pyinotify = True
+except ImportError:
+	has_pyinotify = False
+
+# Local modules
+import qidata
+from qidata import qidataframe
+import _mixin as xmp_tools
+
+_FRAME_SUFFIX = ".frame.xmp"
+
+class DatasetWatcher(object):
+	"""
+	Applies the changes made on disk to the state of an open dataset
+
+	Each detected change is a tuple ``(name, change)``, where ``name`` is
+	the name of a child or of a frame file, and ``change`` is "added",
+	"removed" or "modified" (a child is modified when its data or its
+	annotations change). For each change, the dataset's file types,
+	annotation content and frames are updated.
+
+	Changes can be looked for explicitly with ``poll``, or continuously by a
+	background thread (see ``start``). In the latter case, the dataset is
+	updated from that thread: ``lock`` is held during the updates, and can
+	be held by consumers to use the dataset in the meantime.
+	"""
+
+	# ───────────
+	# Constructor
+
+	def __init__(self, dataset, callback=None, interval=1.0,
+	             use_inotify=True, max_workers=None):
+		"""
+		Start following the files of a dataset
+
+		The annotations of all children and frames are read once, to know
+		which ones provide each entry of the annotation content.
+
+		:param dataset: Dataset to keep up to date
+		:type dataset: qidata.qidataset.QiDataSet
+		:param callback: Function called with the list of changes, each
+		                 time some are applied
+		:type callback: callable
+		:param interval: Time (in seconds) between two examinations of the
+		                 folder by the background thread
+		:type interval: float
+		:param use_inotify: Use inotify (if available) to examine the folder
+		                    only when it changed
+		:type use_inotify: bool
+		:param max_workers: Maximum number of files read at the same time
+		                    (defaults to the number of CPUs)
+		:type max_workers: int
+		"""
+		self._dataset = dataset
+		self._folder_path = dataset.name
+		self._callback = callback
+		self._interval = interval
+		self._use_inotify = use_inotify and has_pyinotify
+		self._max_workers = max_workers
+		self.lock = threading.RLock()
+		self._thread = None
+		self._stopped = threading.Event()
+
+		self._stamps = self._scan()
+		names = sorted([
+		    name for name in self._stamps if self._getOwner(name) == name
+		])
+		self._keys = dict(zip(names, self._map(self._readKeys, names)))
+		self._key_counts = Counter()
+		for keys in self._keys.itervalues():
+			self._key_counts.update(keys)
+
+	# ──────────
+	# Public API
+
+	def poll(self):
+		"""
+		Look for changes, and apply them to the dataset
+
+		:return: Detected changes
+		:rtype: list
+		"""
+		with self.lock:
+			stamps = self._scan()
+			touched = sorted(set([
+			    self._getOwner(name)
+			        for name in set(stamps) | set(self._stamps)
+			            if stamps.get(name) != self._stamps.get(name)
+			]))
+			if len(touched) == 0:
+				return []
+			self._stamps = stamps
+
+			# Children whose data file is gone are removed, even if their
+			# external annotation file is still there
+			keys = dict(zip(touched, self._map(
+			    lambda name: self._readKeys(name) if name in stamps else None,
+			    touched
+			)))
+			changes = []
+			for name in touched:
+				if keys[name] is None:
+					if not self._keys.has_key(name):
+						continue
+					change = "removed"
+				elif not self._keys.has_key(name):
+					change = "added"
+				else:
+					change = "modified"
+				if name.endswith(_FRAME_SUFFIX):
+					self._updateFrame(name, change)
+				else:
+					self._updateChild(name, change)
+				self._updateKeys(name, keys[name])
+				changes.append((name, change))
+
+		if len(changes) == 0:
+			return []
+		if self._callback is not None:
+			self._callback(changes)
+		return changes
+
+	def start(self):
+		"""
+		Look for changes continuously, in a background thread
+		"""
+		if self._thread is not None:
+			return
+		self._stopped.clear()
+		self._thread = threading.Thread(target=self._run)
+		self._thread.daemon = True
+		self._thread.start()
+
+	def stop(self):
+		"""
+		Stop the background thread
+		"""
+		if self._thread is None:
+			return
+		self._stopped.set()
+		self._thread.join()
+		self._thread = None
+
+	# ───────────
+	# Private API
+
+	def _run(self):
+		"""
+		Background thread: examine the folder until stopped
+		"""
+		notifier = None
+		if self._use_inotify:
+			watch_manager = pyinotify.WatchManager()
+			notifier = pyinotify.Notifier(watch_manager, timeout=0)
+			watch_manager.add_watch(
+			    self._folder_path,
+			    pyinotify.IN_CLOSE_WRITE | pyinotify.IN_CREATE \
+			      | pyinotify.IN_DELETE | pyinotify.IN_MOVED_FROM \
+			      | pyinotify.IN_MOVED_TO | pyinotify.IN_ATTRIB
+			)
+		try:
+			while not self._stopped.is_set():
+				if notifier is not None:
+					if not notifier.check_events(int(self._interval*1000)):
+						continue
+					notifier.read_events()
+					notifier.process_events()
+				elif self._stopped.wait(self._interval):
+					break
+				self.poll()
+		finally:
+			if notifier is not None:
+				notifier.stop()
+
+	def _scan(self):
+		"""
+		Return the modification time and size of the followed files
+		"""
+		stamps = dict()
+		for name in os.listdir(self._folder_path):
+			is_sidecar = name.endswith(".xmp")\
+			             and qidata.isSupportedDataFile(name[:-4])
+			if not (qidata.isSupportedDataFile(name) or is_sidecar\
+			          or name.endswith(_FRAME_SUFFIX)):
+				continue
+			try:
+				stat = os.stat(os.path.join(self._folder_path, name))
+			except OSError:
+				# Removed in the meantime
+				continue
+			stamps[name] = (stat.st_mtime, stat.st_size)
+		return stamps
+
+	@staticmethod
+	def _getOwner(name):
+		"""
+		Return the child (or frame) a followed file belongs to
+		"""
+		if name.endswith(".xmp") and not name.endswith(_FRAME_SUFFIX):
+			return name[:-4]
+		return name
+
+	def _map(self, function, names):
+		"""
+		Apply a function to several names concurrently
+		"""
+		if len(names) <= 1:
+			return map(function, names)
+		pool = ThreadPool(min(len(names), self._max_workers or cpu_count()))
+		try:
+			return pool.map(function, names)
+		finally:
+			pool.close()
+			pool.join()
+
+	def _readKeys(self, name):
+		"""
+		Return the (annotator, annotation type) pairs present in a child or
+		a frame (empty if it cannot be read)
+		"""
+		path = os.path.join(self._folder_path, name)
+		try:
+			if not name.endswith(_FRAME_SUFFIX):
+				path = qidata.qidatafile._findXMPPath(path)
+			data = xmp_tools._read_file_annotations(path)
+		except Exception:
+			return set()
+		if data is None:
+			return set()
+		return set([
+		    (str(annotator), str(annotation_type))
+		        for (annotator, annotations) in data.iteritems()
+		            for (annotation_type, typed_annotations) \
+		                                        in annotations.iteritems()
+		                if len(typed_annotations) > 0
+		])
+
+	def _updateKeys(self, name, keys):
+		"""
+		Update the annotation content with the new annotation types of a
+		child or frame (None if it was removed)
+
+		Entries provided by no file anymore are removed, unless they were
+		declared as total (see ``QiDataSet.setAnnotationStatus``).
+		"""
+		content = self._dataset._annotation_content
+		status = qidata.QiDataSet.AnnotationStatus
+		old_keys = self._keys.pop(name, set())
+		new_keys = keys if keys is not None else set()
+		if keys is not None:
+			self._keys[name] = keys
+		for key in new_keys - old_keys:
+			self._key_counts[key] += 1
+			content.setdefault(key, status.PARTIAL)
+		for key in old_keys - new_keys:
+			self._key_counts[key] -= 1
+			if self._key_counts[key] <= 0:
+				del self._key_counts[key]
+				if content.get(key) == status.PARTIAL:
+					content.pop(key)
+
+	def _updateChild(self, name, change):
+		"""
+		Update the file types of the dataset after a child changed
+		"""
+		if change == "removed":
+			self._dataset._unregisterFileType(name)
+			return
+		try:
+			type_name = str(qidata.getFileDataType(
+			    os.path.join(self._folder_path, name)
+			))
+		except Exception:
+			# Not readable yet (being written for instance)
+			return
+		self._dataset._registerFileType(name, type_name)
+
+	def _updateFrame(self, name, change):
+		"""
+		Load, reload or forget a frame after its file changed
+		"""
+		dataset = self._dataset
+		current = [
+		    f for f in dataset.getAllFrames()
+		        if os.path.basename(f._file_path) == name
+		]
+		for frame in current:
+			if change == "added" or change == "modified" \
+			   and not dataset.read_only and frame._isModified():
+				# The frame was created, or modified, by this process
+				return
+			dataset._removeFrameFromIndexes(frame)
+			try:
+				# Releases its file and its lock
+				frame.close()
+			except Exception:
+				# Its file is gone, so its changes cannot be saved anymore
+				pass
+			frame._is_valid = False
+		if change != "removed":
+			try:
+				frame = qidataframe.QiDataFrame(
+				    os.path.join(self._folder_path, name),
+				    dataset.mode,
+				    merge=dataset._merge
+				)
+			except Exception:
+				return
+			dataset._addFrame(frame)
+
+	# ───────────────
+	# Context Manager
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, type, value, traceback):
+		self.stop()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+The ``qidata.xmpsession`` module avoids parsing the same XMP packets again
+and again when files are only read.
+
+Opening an XMP packet with the toolkit parses the whole packet, even when a
+single namespace is of interest. A :class:`XMPSession` keeps the namespaces
+it read, and gives them back as long as the file they were read from did
+not change (same modification time, size and inode, so that files replaced
+by ``qidata._mixin._atomic_update`` are read again).
+
+The module's session is shared by the functions reading annotations or
+sensor metadata without opening the files (see ``getSession``). Its
+statistics tell how often parsing was avoided:
+
+:Example:
+
+	>>> getSession().stats
+	{'reads': 20, 'hits': 15, 'misses': 5, 'evictions': 0, 'entries': 5,
+	 'hit_rate': 0.75}
+"""
+
+# Standard libraries
+from collections import OrderedDict
+import copy
+import os
+import threading
+
+# Third-party libraries
+from xmp.xmp import XMPFile
+
+class XMPSession(object):
+	"""
+	Cache of the namespaces read from XMP packets
+
+	Namespaces are stored by path, and the least recently read ones are
+	forgotten when there are more than ``max_entries``. Returned values are
+	copies, that callers can modify.
+	"""
+
+	# ───────────
+	# Constructor
+
+	def __init__(self, max_entries=4096):
+		"""
+		Create an empty session
+
+		:param max_entries: Maximum number of namespaces kept
+		:type max_entries: int
+		"""
+		self._max_entries = max_entries
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+		self.resetStats()
+
+	# ──────────
+	# Properties
+
+	@property
+	def stats(self):
+		"""
+		Number of reads, of reads answered from the cache (hits) or by
+		parsing the file (misses), of forgotten namespaces (evictions), of
+		namespaces kept (entries), and the ratio of hits
+		"""
+		with self._lock:
+			reads = self._hits + self._misses
+			return dict(
+			    reads=reads,
+			    hits=self._hits,
+			    misses=self._misses,
+			    evictions=self._evictions,
+			    entries=len(self._entries),
+			    hit_rate=float(self._hits)/reads if reads > 0 else 0.0,
+			)
+
+	# ──────────
+	# Public API
+
+	def readNamespace(self, xmp_path, namespace):
+		"""
+		Return the value of a namespace of an XMP packet
+
+		:param xmp_path: Path of the XMP packet (an XMP file, or a file
+		                 embedding its metadata)
+		:type xmp_path: str
+		:param namespace: URI of the namespace
+		:type namespace: unicode
+		:return: Raw value of the namespace (with its prefixes), or None if
+		         the namespace is empty
+		:raises: OSError if the file does not exist
+		"""
+		key = (os.path.abspath(xmp_path), namespace)
+		stamp = _getStamp(xmp_path)
+		with self._lock:
+			entry = self._entries.pop(key, None)
+			if entry is not None and entry[0] == stamp:
+				self._entries[key] = entry
+				self._hits += 1
+				return copy.deepcopy(entry[1])
+			self._misses += 1
+
+		with XMPFile(xmp_path, rw=False) as _xmp_file:
+			_raw_metadata = _xmp_file.metadata[namespace]
+			value = _raw_metadata.value if _raw_metadata.children else None
+
+		with self._lock:
+			self._entries.pop(key, None)
+			self._entries[key] = (stamp, value)
+			while len(self._entries) > self._max_entries:
+				self._entries.popitem(last=False)
+				self._evictions += 1
+		return copy.deepcopy(value)
+
+	def invalidate(self, xmp_path=None):
+		"""
+		Forget the namespaces read from a file (or from all files)
+
+		:param xmp_path: Path of the XMP packet
+		:type xmp_path: str
+		"""
+		with self._lock:
+			if xmp_path is None:
+				self._entries.clear()
+				return
+			xmp_path = os.path.abspath(xmp_path)
+			for key in [k for k in self._entries if k[0] == xmp_path]:
+				del self._entries[key]
+
+	def resetStats(self):
+		"""
+		Set all counters back to zero
+		"""
+		with self._lock:
+			self._hits = 0
+			self._misses = 0
+			self._evictions = 0
+
+	def __len__(self):
+		return len(self._entries)
+
+_SESSION = XMPSession()
+
+def getSession():
+	"""
+	Return the session shared by the module's functions
+
+	:rtype: qidata.xmpsession.XMPSession
+	"""
+	return _SESSION
+
+# ───────
+# Helpers
+
+def _getStamp(file_path):
+	"""
+	Return what identifies a version of a file
+	"""
+	stat = os.stat(file_path)
+	return (stat.st_mtime, stat.st_size, stat.st_ino)
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+The ``qidata_client`` module queries the datasets served by a ``qidata
+serve`` daemon (see ``qidata.server``), through its Unix socket.
+
+It is a top-level module which only depends on the standard library, so
+that short-lived scripts can use it without importing (and initializing)
+the ``qidata`` package. When no daemon is running, queries are evaluated in
+the current process instead, which gives the same results at the cost of
+loading qidata and the datasets.
+
+:Example:
+
+	>>> client = Client(roots=["/data/recordings"])
+	>>> client.search(annotator="jdoe", annotation_type="Face")
+	[['/data/recordings/session_1', 'image_1.png']]
+"""
+
+# Standard libraries
+import json
+import os
+import socket
+import tempfile
+
+#: Socket on which the daemon listens by default
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(),
+                                   "qidata-%d.sock"%os.getuid())
+
+class QueryError(Exception):
+	"""
+	Raised when a query fails. The message gives the type and the message
+	of the exception raised while evaluating it.
+	"""
+
+class Client(object):
+	"""
+	Sends queries to the daemon, or evaluates them locally if there is none
+	"""
+
+	# ───────────
+	# Constructor
+
+	def __init__(self, roots=None, socket_path=None):
+		"""
+		Connect to the daemon, if one is running
+
+		:param roots: Folders containing the datasets to query when no daemon
+		              is running (datasets, or folders containing datasets)
+		:type roots: list
+		:param socket_path: Socket of the daemon (defaults to
+		                    ``DEFAULT_SOCKET_PATH``)
+		:type socket_path: str
+		"""
+		self._roots = roots
+		self._catalog = None
+		self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			self._socket.connect(socket_path or DEFAULT_SOCKET_PATH)
+			self._stream = self._socket.makefile("rwb")
+		except socket.error:
+			self._socket.close()
+			self._socket = None
+
+	# ──────────
+	# Properties
+
+	@property
+	def is_remote(self):
+		"""
+		True if queries are sent to a daemon
+		"""
+		return self._socket is not None
+
+	# ──────────
+	# Public API
+
+	def query(self, method, **params):
+		"""
+		Evaluate a query
+
+		:param method: Name of the query (see ``qidata.server.Catalog``)
+		:type method: str
+		:param params: Parameters of the query
+		:return: Result of the query, made of JSON types
+		:raises: QueryError if the query failed
+		:raises: IOError if there is no daemon and no root was given
+		"""
+		request = json.dumps(dict(method=method, params=params))
+		if self._socket is not None:
+			self._stream.write(request + "\n")
+			self._stream.flush()
+			line = self._stream.readline()
+			if not line:
+				raise IOError("Connection to the query daemon was lost")
+			response = json.loads(line)
+		else:
+			response = json.loads(json.dumps(
+			    self._getCatalog().handle(json.loads(request))
+			))
+		if response.has_key("error"):
+			raise QueryError(response["error"])
+		return response["result"]
+
+	def filter(self, datasets=None, only_annotated_by=None,
+	           only_with_annotations=None, only_total_annotations=False):
+		"""
+		Find the datasets having some annotations (see
+		``qidata.qidataset.QiDataSet.filter``)
+
+		:param datasets: Datasets to filter (defaults to all served datasets)
+		:type datasets: list
+		:rtype: list
+		"""
+		return self.query("filter", datasets=_absolute(datasets),
+		                  only_annotated_by=only_annotated_by,
+		                  only_with_annotations=only_with_annotations,
+		                  only_total_annotations=only_total_annotations)
+
+	def getStreamRange(self, dataset, stream, start=None, end=None):
+		"""
+		Return the files of a stream between two times
+
+		:param dataset: Path of the dataset
+		:type dataset: str
+		:param stream: Name of the stream
+		:type stream: str
+		:param start: First time (in nanoseconds), included
+		:type start: int
+		:param end: Last time (in nanoseconds), included
+		:type end: int
+		:return: Pairs [timestamp, file name], by increasing timestamp
+		:rtype: list
+		"""
+		return self.query("stream_range", dataset=os.path.abspath(dataset),
+		                  stream=stream, start=start, end=end)
+
+	def getAnnotations(self, dataset, name):
+		"""
+		Return the raw annotations of a file (see
+		``qidata._mixin._read_annotations``)
+
+		:param dataset: Path of the dataset
+		:type dataset: str
+		:param name: Name of the file
+		:type name: str
+		:rtype: dict
+		"""
+		return self.query("annotations", dataset=os.path.abspath(dataset),
+		                  name=name)
+
+	def search(self, datasets=None, annotator=None, annotation_type=None,
+	           data_type=None, pattern=None):
+		"""
+		Find the files matching some criteria
+
+		:param datasets: Datasets to search (defaults to all served datasets)
+		:type datasets: list
+		:param annotator: Only files annotated by this annotator
+		:type annotator: str
+		:param annotation_type: Only files having this type of annotations
+		:type annotation_type: str
+		:param data_type: Only files of this data type
+		:type data_type: str
+		:param pattern: Only files whose name matches this shell pattern
+		:type pattern: str
+		:return: Pairs [dataset path, file name]
+		:rtype: list
+		"""
+		return self.query("search", datasets=_absolute(datasets),
+		                  annotator=annotator, annotation_type=annotation_type,
+		                  data_type=data_type, pattern=pattern)
+
+	def close(self):
+		"""
+		Close the connection to the daemon
+		"""
+		if self._socket is not None:
+			self._stream.close()
+			self._socket.close()
+			self._socket = None
+
+	# ───────────
+	# Private API
+
+	def _getCatalog(self):
+		"""
+		Load the datasets to query them in this process
+		"""
+		if self._catalog is None:
+			if self._roots is None:
+				raise IOError("No query daemon is running, and no dataset "
+				              "root was given")
+			from qidata.server import Catalog
+			self._catalog = Catalog(self._roots)
+		return self._catalog
+
+	# ───────────────
+	# Context Manager
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, type, value, traceback):
+		self.close()
+
+# ───────
+# Helpers
+
+def _absolute(paths):
+	"""
+	Make paths absolute, since the daemon does not share our working
+	directory
+	"""
+	if paths is None:
+		return None
+	return [os.path.abspath(path) for path in paths]
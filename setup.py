@@ -62,6 +62,7 @@ setup(
     ],
     keywords='metadata annotation tagging',
     packages=package_list,
+    py_modules=["qidata_client"],
     install_requires=[
         "opencv-python >= 3.0",
         "setuptools >= 35.0.0",
@@ -70,6 +71,7 @@ setup(
         "xmp >= 0.3",
         "qidata_devices >= 0.0.3",
         "image.py >= 0.4.0",
+        "numpy >= 1.11",
     ],
     package_data={"qidata":["VERSION"]},
     entry_points={
@@ -80,7 +82,10 @@ setup(
             'Speech = qidata._metadata_objects.speech:Speech',
         ],
         'qidata.commands': [
+            'diff = qidata.command_line.diff_command',
+            'serve = qidata.command_line.serve_command',
             'show = qidata.command_line.show_command',
+            'thumbnails = qidata.command_line.thumbnails_command',
         ],
         'console_scripts': [
             'qidata = qidata.__main__:main'
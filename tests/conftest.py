@@ -44,7 +44,8 @@ import errno
 import shutil
 import pytest
 
-from qidata.command_line import show_command
+from qidata.command_line import diff_command, serve_command, show_command,\
+                                 thumbnails_command
 
 #[MODULE INFO]-----------------------------------------------------------------
 __author__ = "sambrose"
@@ -129,10 +130,22 @@ def folder_with_annotations():
 def full_dataset():
 	return sandboxed(FULL_DATASET)
 
+@pytest.fixture(scope="session")
+def diff_command_parser():
+	return diff_command.make_command_parser()
+
+@pytest.fixture(scope="session")
+def serve_command_parser():
+	return serve_command.make_command_parser()
+
 @pytest.fixture(scope="session")
 def show_command_parser():
 	return show_command.make_command_parser()
 
+@pytest.fixture(scope="session")
+def thumbnails_command_parser():
+	return thumbnails_command.make_command_parser()
+
 @pytest.fixture(scope="function")
 def jpg_with_internal_annotations():
 	return sandboxed(JPG_WITH_INTERNAL_ANNOTATIONS)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# Third-party libraries
+import pytest
+
+# Local modules
+from qidata import QiDataSet
+from qidata.batchloader import BatchLoader
+from qidata.metadata_objects import Object
+
+def test_batch_loader(folder_with_annotations):
+	with QiDataSet(folder_with_annotations, "w") as d:
+		d.createNewStream("cam", [((1,0),"JPG_file.jpg"),
+		                          ((0,0),"Annotated_JPG_file.jpg")])
+		with d.openChild("Annotated_JPG_file.jpg") as _f:
+			_f.addAnnotation("jdoe", Object(type="cup"), [[10,10],[30,40]])
+			_f.addAnnotation("jdoe", Object(type="mug"), [[0,0],[4,4]])
+			_f.addAnnotation("jdoe", Object(type="pen"), None)
+
+	with QiDataSet(folder_with_annotations, "r") as d:
+		with pytest.raises(ValueError):
+			BatchLoader(d)
+		loader = BatchLoader(d, stream="cam", annotator="jdoe",
+		                     label=lambda o: o.type, batch_size=1,
+		                     size=(50, 50), crop=[[8,8],[108,108]])
+		unresized_loader = BatchLoader(d, files=["JPG_file.jpg"]*3,
+		                               batch_size=2, drop_last=True)
+
+	assert(["Annotated_JPG_file.jpg", "JPG_file.jpg"] == loader.files)
+	assert(2 == len(loader))
+	batches = list(loader)
+	images, boxes, labels = batches[0]
+	assert((1, 50, 50, 3) == images.shape)
+	assert(["cup"] == list(labels))
+	assert([0., 1., 1., 11., 16.] == [round(x) for x in boxes[0]])
+	images, boxes, labels = batches[1]
+	assert((0, 5) == boxes.shape and 0 == len(labels))
+
+	assert(1 == len(unresized_loader))
+	images, boxes, labels = list(unresized_loader)[0]
+	assert(2 == images.shape[0])
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+# Standard library
+import json
+
+# Third-party libraries
+import pytest
+
+# Local modules
+from qidata import QiDataSet, MetadataType, coco
+from qidata.qidataobject import ReadOnlyException
+from qidata.metadata_objects import Object, Property
+
+def test_categories():
+	categories = coco.getCategories()
+	assert(len(list(MetadataType)) == len(categories))
+	assert(range(1, len(categories)+1) == [c["id"] for c in categories])
+	assert(sorted([str(t) for t in MetadataType]) == [c["name"] for c in categories])
+
+def test_export_coco(folder_with_annotations, tmpdir):
+	with QiDataSet(folder_with_annotations, "w") as d:
+		with d.openChild("Annotated_JPG_file.jpg") as _f:
+			_f.addAnnotation("jdoe", Object(type="cup", id=3), [[10,20],[30,60]])
+			_f.addAnnotation("jdoe", Object(type="pen"), None)
+		with d.openChild("JPG_file.jpg") as _f:
+			_f.addAnnotation("jsmith", Object(type="mug"), [[0,0],[10,10]])
+
+	out_path = str(tmpdir.join("coco.json"))
+	with QiDataSet(folder_with_annotations, "r") as d:
+		assert((2, 1) == coco.exportCOCO(d, out_path, "jdoe", max_workers=1))
+		with open(out_path) as _f:
+			exported = json.load(_f)
+		assert(["Annotated_JPG_file.jpg", "JPG_file.jpg"]\
+		         == [i["file_name"] for i in exported["images"]])
+		assert((3968, 2232) == (exported["images"][0]["width"],
+		                        exported["images"][0]["height"]))
+		assert(coco.getCategories() == exported["categories"])
+		annotation = exported["annotations"][0]
+		category_id = dict([(c["name"], c["id"]) for c in coco.getCategories()])
+		assert(category_id["Object"] == annotation["category_id"])
+		assert([10, 20, 20, 40] == annotation["bbox"])
+		assert(800 == annotation["area"])
+		assert("jdoe" == annotation["annotator"])
+		assert(("cup", 3) == (annotation["attributes"]["type"],
+		                      annotation["attributes"]["id"]))
+
+		image_count, annotation_count = coco.exportCOCO(d, out_path)
+		with open(out_path) as _f:
+			exported = json.load(_f)
+		assert(annotation_count == len(exported["annotations"]))
+		assert([1, 2] == sorted(set([a["image_id"] for a in exported["annotations"]])))
+		assert(range(1, annotation_count+1) == [a["id"] for a in exported["annotations"]])
+
+def test_import_coco(folder_with_annotations, tmpdir):
+	json_path = str(tmpdir.join("detections.json"))
+	with open(json_path, "w") as _f:
+		json.dump(dict(
+		    images=[dict(id=7, file_name="images/JPG_file.jpg"),
+		            dict(id=8, file_name="Annotated_JPG_file.jpg")],
+		    categories=[dict(id=1, name="person"),
+		                dict(id=2, name="Property")],
+		    annotations=[
+		        dict(id=1, image_id=7, category_id=1, bbox=[10, 20, 5, 6]),
+		        dict(id=2, image_id=7, category_id=1, bbox=[0, 0, 1, 1]),
+		        dict(id=3, image_id=8, category_id=2, bbox=[1, 2, 3, 4],
+		             attributes=dict(key="k", value="v"), annotator="jsmith"),
+		        dict(id=4, image_id=7, category_id=1,
+		             bbox=[30.4, 40.6, 10.2, 4.7]),
+		    ]
+		), _f)
+
+	with QiDataSet(folder_with_annotations, "r") as d:
+		with pytest.raises(ReadOnlyException):
+			coco.importCOCO(d, json_path, "detector")
+
+	with QiDataSet(folder_with_annotations, "w") as d:
+		assert(4 == coco.importCOCO(d, json_path, "detector", max_workers=2))
+
+	with QiDataSet(folder_with_annotations, "r") as d:
+		assert(QiDataSet.AnnotationStatus.PARTIAL\
+		         == d.annotations_available[("detector", "Object")])
+		assert(d.annotations_available.has_key(("jsmith", "Property")))
+		with d.openChild("JPG_file.jpg") as _f:
+			assert([[Object(type="person"), [[10,20],[15,26]]],
+			        [Object(type="person"), [[0,0],[1,1]]],
+			        [Object(type="person"), [[30,41],[41,45]]]]\
+			         == _f.annotations["detector"]["Object"])
+		with d.openChild("Annotated_JPG_file.jpg") as _f:
+			assert([[Property(key="k", value="v"), [[1,2],[4,6]]]]\
+			         == _f.annotations["jsmith"]["Property"])
+			assert(_f.annotations.has_key("sambrose"))
+
+	# Images must belong to the dataset
+	with open(json_path, "w") as _f:
+		json.dump(dict(
+		    images=[dict(id=1, file_name="unknown.jpg")],
+		    categories=[dict(id=1, name="person")],
+		    annotations=[dict(id=1, image_id=1, category_id=1, bbox=[0,0,1,1])]
+		), _f)
+	with QiDataSet(folder_with_annotations, "w") as d:
+		with pytest.raises(IOError):
+			coco.importCOCO(d, json_path, "detector")
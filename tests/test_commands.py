@@ -29,14 +29,17 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 # Standard library
+import json
+import os
 import pytest
+import shutil
 import subprocess
 
 # Third-party libraries
 
 # Local modules
 from qidata.command_line import main
-from qidata import VERSION
+from qidata import VERSION, thumbnails
 
 @pytest.mark.parametrize("command_args",
 	[
@@ -273,3 +276,55 @@ Image shape: (2232, 3968, 3)
   assert(res == subprocess.check_output(["qidata",
                                          "show",
                                          "tests/data/Annotated_JPG_file.jpg"]))
+
+def test_thumbnails_command(folder_with_annotations, thumbnails_command_parser):
+	parsed_arguments = thumbnails_command_parser.parse_args(
+	                       [folder_with_annotations, "-j", "2"]
+	                   )
+	parsed_arguments.func(parsed_arguments)
+	cache_folder = os.path.join(folder_with_annotations, thumbnails.CACHE_FOLDER)
+	assert(
+	    2*len(thumbnails.THUMBNAIL_SIZES)
+	      == len([f for f in os.listdir(cache_folder) if f.endswith(".jpg")])
+	)
+
+	parsed_arguments = thumbnails_command_parser.parse_args(
+	                       [os.path.join(folder_with_annotations, "WAV_file.wav")]
+	                   )
+	with pytest.raises(SystemExit):
+		parsed_arguments.func(parsed_arguments)
+
+def test_diff_command(dataset_with_new_annotations, diff_command_parser):
+	after_path = dataset_with_new_annotations + "_after"
+	shutil.copytree(dataset_with_new_annotations, after_path)
+	shutil.copyfile("tests/data/Trumpet.wav",
+	                os.path.join(after_path, "Trumpet.wav"))
+
+	parsed_arguments = diff_command_parser.parse_args(
+	                       [dataset_with_new_annotations, after_path]
+	                   )
+	assert("+ Trumpet.wav" == parsed_arguments.func(parsed_arguments))
+
+	parsed_arguments = diff_command_parser.parse_args(
+	                       [after_path, dataset_with_new_annotations, "--json"]
+	                   )
+	assert(
+	    [dict(file="Trumpet.wav", annotator=None, change="removed", types=[])]
+	      == json.loads(parsed_arguments.func(parsed_arguments))
+	)
+
+	parsed_arguments = diff_command_parser.parse_args(
+	                       [after_path, after_path, "-j", "2"]
+	                   )
+	assert(parsed_arguments.func(parsed_arguments) is None)
+
+	parsed_arguments = diff_command_parser.parse_args(
+	                       [dataset_with_new_annotations, "tests/data"]
+	                   )
+	with pytest.raises(SystemExit):
+		parsed_arguments.func(parsed_arguments)
+
+def test_serve_command(serve_command_parser):
+	parsed_arguments = serve_command_parser.parse_args(["unknown/folder"])
+	with pytest.raises(SystemExit):
+		parsed_arguments.func(parsed_arguments)
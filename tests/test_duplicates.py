@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+# Standard library
+import os
+import shutil
+
+# Third-party libraries
+import cv2
+
+# Local modules
+from qidata import duplicates
+
+def test_image_hash(jpg_file_path):
+	image = cv2.imread(jpg_file_path)
+	blurred_path = jpg_file_path[:-4] + "_blurred.png"
+	flipped_path = jpg_file_path[:-4] + "_flipped.png"
+	cv2.imwrite(blurred_path, cv2.GaussianBlur(image, (5,5), 0))
+	cv2.imwrite(flipped_path, image[::-1])
+
+	image_hash = duplicates.getImageHash(jpg_file_path)
+	assert(2 >= duplicates.hammingDistance(
+	                image_hash, duplicates.getImageHash(blurred_path)
+	            ))
+	assert(10 < duplicates.hammingDistance(
+	                image_hash, duplicates.getImageHash(flipped_path)
+	            ))
+
+def test_bk_tree():
+	tree = duplicates.BKTree()
+	for i, item_hash in enumerate([0b0000, 0b0001, 0b0011, 0b1111, 0b0001]):
+		tree.add(item_hash, i)
+	assert(5 == len(tree))
+	assert([(0, [1, 4]), (1, [0])] == tree.search(0b0001, 1)[:2])
+	assert(3 == len(tree.search(0b0001, 1)))
+	assert([(0, [3])] == tree.search(0b1111, 1))
+	assert([] == duplicates.BKTree().search(0, 64))
+
+def test_find_duplicates(tmpdir):
+	first = tmpdir.mkdir("first")
+	second = tmpdir.mkdir("second")
+	shutil.copyfile("tests/data/SpringNebula.jpg", str(first.join("a.jpg")))
+	shutil.copyfile("tests/data/qidatafile_v1.png", str(first.join("b.png")))
+	image = cv2.imread("tests/data/SpringNebula.jpg")
+	cv2.imwrite(str(second.join("c.jpg")), cv2.resize(image, (992, 558)),
+	            [cv2.IMWRITE_JPEG_QUALITY, 70])
+
+	expected = [[str(first.join("a.jpg")), str(second.join("c.jpg"))]]
+	assert(expected == duplicates.findDuplicates([str(first), str(second)]))
+
+	# Hashes are stored, and computed again when an image changes
+	hash_file = str(second.join(duplicates.HASH_FILE))
+	assert(os.path.isfile(hash_file))
+	assert(expected == duplicates.findDuplicates([str(first), str(second)], 4, 1))
+	cv2.imwrite(str(second.join("c.jpg")), image[::-1])
+	os.utime(str(second.join("c.jpg")), (0, 0))
+	assert([] == duplicates.findDuplicates([str(first), str(second)]))
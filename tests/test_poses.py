@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# Third-party libraries
+import numpy as np
+import pytest
+
+# Local modules
+from qidata import poses
+
+# Quarter turn around Z, then translation
+QUARTER_TURN = [1., 2., 3., 0., 0., np.sqrt(0.5), np.sqrt(0.5)]
+IDENTITY = [0., 0., 0., 0., 0., 0., 1.]
+
+def test_compose_and_invert():
+	twice = poses.composePoses(QUARTER_TURN, QUARTER_TURN)
+	assert(np.allclose([-1., 3., 6., 0., 0., 1., 0.], twice))
+	assert(np.allclose(
+	    IDENTITY,
+	    poses.composePoses(poses.invertPoses(QUARTER_TURN), QUARTER_TURN)
+	))
+	trajectory = np.array([IDENTITY, QUARTER_TURN, twice])
+	assert(np.allclose(
+	    [QUARTER_TURN, QUARTER_TURN],
+	    poses.relativePoses(trajectory[:-1], trajectory[1:])
+	))
+	with pytest.raises(ValueError):
+		poses.invertPoses([0., 0., 0.])
+
+def test_interpolate():
+	timestamps = np.array([0, 10], dtype=np.int64) + 1500000000000000000
+	trajectory = np.array([IDENTITY, [2., 0., 0., 0., 0., 1., 0.]])
+	interpolated = poses.interpolatePoses(
+	    timestamps,
+	    trajectory,
+	    timestamps[0] + np.array([-5, 5, 10, 20])
+	)
+	assert(np.allclose(IDENTITY, interpolated[0]))
+	assert(np.allclose([1., 0., 0., 0., 0., np.sqrt(0.5), np.sqrt(0.5)],
+	                   interpolated[1]))
+	assert(np.allclose(trajectory[1], interpolated[2]))
+	assert(np.allclose(trajectory[1], interpolated[3]))
+	with pytest.raises(ValueError):
+		poses.interpolatePoses([], np.empty((0, 7)), [0])
+
+	# A single pose, possibly given as a flat list
+	for trajectory in [[IDENTITY], IDENTITY]:
+		interpolated = poses.interpolatePoses([0], trajectory, [-1, 0, 1])
+		assert((3, 7) == interpolated.shape)
+		assert(np.allclose(IDENTITY, interpolated))
@@ -29,11 +29,12 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 # Third-party libraries
+import numpy as np
 import pytest
 
 # Local modules
 from qidata.metadata_objects import *
-from qidata.metadata_objects import TimeStamp, Transform
+from qidata.metadata_objects import TimeStamp, Transform, timestamp
 from qidata import makeMetadataObject, MetadataType
 
 def test_make_non_existing_metadata_object():
@@ -223,4 +224,27 @@ def test_wrong_keys(metadata_objects):
 def test_import_from_old_versions(metadata_objects):
 	for input_dict, gnd in zip(metadata_objects["inputs"], metadata_objects["outputs"]):
 		output_object = metadata_objects["type"].fromDict(input_dict)
-		assert(output_object == gnd)
\ No newline at end of file
+		assert(output_object == gnd)
+
+def test_timestamp_nanoseconds():
+	ts = TimeStamp(12, 5)
+	assert(12000000005 == ts.total_nanoseconds)
+	assert(ts == TimeStamp.fromNanoseconds(12000000005))
+	assert(TimeStamp(11, 999999999) < ts)
+	assert(TimeStamp(12, 6) >= ts)
+	assert(TimeStamp(13, 0) == ts + 999999995)
+	assert(TimeStamp(11, 999999999) == ts - 6)
+	assert(-6 == TimeStamp(11, 999999999) - ts)
+	assert([TimeStamp(1,0), ts] == sorted([ts, TimeStamp(1,0)]))
+
+def test_timestamp_bulk_conversion():
+	ns = timestamp.toNanoseconds([TimeStamp(1, 2), (3, 4), 5])
+	assert(np.int64 == ns.dtype)
+	assert([1000000002, 3000000004, 5] == ns.tolist())
+	ns = ns[:2]
+	assert([(1, 2), (3, 4)] == timestamp.toPairs(ns))
+	assert([TimeStamp(1, 2), TimeStamp(3, 4)] == timestamp.toTimeStamps(ns))
+	assert(0 == len(timestamp.toNanoseconds([])))
+	assert(3000000004 == timestamp.asNanoseconds((3, 4)))
+	assert(3000000004 == timestamp.asNanoseconds(TimeStamp(3, 4)))
+	assert(3000000004 == timestamp.asNanoseconds(np.int64(3000000004)))
@@ -32,6 +32,7 @@
 import os
 
 # Third-party libraries
+import numpy as np
 import pytest
 
 # Local modules
@@ -211,4 +212,44 @@ def test_specify_type(jpg_file_path):
 			f.type = DataType.AUDIO
 
 	with qidata.open(jpg_file_path, "r") as f:
-		assert(DataType.IMAGE_2D == f.type)
\ No newline at end of file
+		assert(DataType.IMAGE_2D == f.type)
+
+def test_image_shape_and_location_bounds(jpg_file_path):
+	with qidata.open(jpg_file_path, "w") as _f:
+		assert((2232, 3968, 3) == _f.shape)
+		assert(_f._raw_data is None)
+		a = metadata_objects.Property(key="key", value="value")
+
+		# Any integer location is accepted by default
+		_f.addAnnotation("jdoe", a, [[3000,2000],[4000,3000]])
+
+		_f.check_location_bounds = True
+		_f.addAnnotation("jdoe", a, [[0,0],[3968,2232]])
+		for invalid_loc in [[[3000,2000],[4000,3000]],
+		                    [[-1,0],[10,10]],
+		                    [[10,10],[0,0]]]:
+			with pytest.raises(Exception):
+				_f.addAnnotation("jdoe", a, invalid_loc)
+		assert(_f._raw_data is None)
+
+def test_image_add_annotations(jpg_file_path):
+	a = metadata_objects.Property(key="key", value="value")
+	with qidata.open(jpg_file_path, "w") as _f:
+		_f.check_location_bounds = True
+		with pytest.raises(qidata.InvalidAnnotationsException) as e:
+			_f.addAnnotations("jdoe", [a]*5, [[[0,0],[10,10]],
+			                                   None,
+			                                   [[10,10],[0,0]],
+			                                   [[0,0],[4000,10]],
+			                                   [[0,0],[1.5,10]]])
+		assert([2, 3, 4] == [index for (index, _) in e.value.errors])
+
+		_f.addAnnotations("jdoe", [a]*3, np.array([[[0,0],[10,10]],
+		                                            [[5,5],[3968,2232]],
+		                                            [[1,2],[3,4]]]))
+		assert(_f._raw_data is None)
+
+	with qidata.open(jpg_file_path, "r") as _f:
+		assert(
+		    [[1,2],[3,4]] == _f.getAnnotations("jdoe", "Property")[2][1]
+		)
@@ -34,6 +34,7 @@ import pytest
 
 # Local modules
 from qidata.qidataobject import QiDataObject, ReadOnlyException
+from qidata.qidataobject import InvalidAnnotationsException
 from qidata import metadata_objects
 
 def test_abstract():
@@ -355,4 +356,28 @@ def test_read_only_cannot_be_modified():
 	      ]
 	    ),
 	  ) == qidata_object.annotations
-	)
\ No newline at end of file
+	)
+
+def test_add_annotations():
+	obj = ObjectForTests()
+	a = metadata_objects.Property(key="prop", value="10")
+	b = metadata_objects.Property(key="prop", value="11")
+	c = metadata_objects.TimeStamp(0,0)
+
+	with pytest.raises(ValueError):
+		obj.addAnnotations("jdoe", [a, b], [0])
+
+	# Nothing is added if an annotation is invalid
+	with pytest.raises(InvalidAnnotationsException) as e:
+		obj.addAnnotations("jdoe", [a, "", c, b], [0, 1, 2, -1])
+	assert([1, 2, 3] == [index for (index, _) in e.value.errors])
+	assert(0 == len(obj.annotations))
+
+	obj.addAnnotations("jdoe", [a, b], [0, None])
+	obj.addAnnotations("jdoe", [a], None)
+	assert(
+	    [[a, 0], [b, None], [a, None]] == obj.getAnnotations("jdoe", "Property")
+	)
+
+	with pytest.raises(ReadOnlyException):
+		ReadOnlyObjectForTests().addAnnotations("jdoe", [a], [0])
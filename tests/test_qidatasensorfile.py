@@ -32,8 +32,9 @@
 import pytest
 
 # Local modules
+import qidata
 from qidata.qidatasensorfile import QiDataSensorFile
-from qidata import metadata_objects,DataType, qidatafile
+from qidata import metadata_objects,DataType, qidatafile, qidatasensorfile
 from qidata import QiDataFile, ClosedFileException
 
 # Test
@@ -75,3 +76,29 @@ def test_qidata_sensor_file(jpg_file_path):
 		assert(ts == f.timestamp)
 		assert(p == f.transform)
 		assert(DataType.AUDIO == f.type)
+
+def test_data_type_reading(jpg_file_path):
+	assert(DataType.IMAGE == qidata.getFileDataType(jpg_file_path))
+	with SensorFileForTests(jpg_file_path, "w") as f:
+		f.type = DataType.IMAGE_2D
+	assert(DataType.IMAGE_2D == qidata.getFileDataType(jpg_file_path))
+	with pytest.raises(TypeError):
+		qidata.getFileDataType(jpg_file_path + ".txt")
+
+def test_pose_reading(jpg_file_path):
+	assert((0,0,0,0,0,0,1) == qidatasensorfile.getPose(jpg_file_path))
+	with SensorFileForTests(jpg_file_path, "w") as f:
+		f.transform = metadata_objects.Transform(
+		                  translation=dict(x=10,y=15,z=-2),
+		                  rotation=dict(x=0,y=0,z=1,w=0)
+		              )
+	assert((10,15,-2,0,0,1,0) == qidatasensorfile.getPose(jpg_file_path))
+
+def test_timestamps_reading(jpg_file_path):
+	assert([0] == qidatasensorfile.getTimestamps([jpg_file_path]).tolist())
+	with SensorFileForTests(jpg_file_path, "w") as f:
+		f.timestamp = metadata_objects.TimeStamp(2, 500)
+	assert(
+	    [2000000500, 2000000500]
+	      == qidatasensorfile.getTimestamps([jpg_file_path]*2).tolist()
+	)
@@ -29,16 +29,29 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 # Standard Library
+import csv
+import fcntl
 import os
 import pytest
+import shutil
+import subprocess
+import sys
+import time
+
+# Third-party libraries
+import cv2
+from xmp.xmp import XMPFile
 
 # Local modules
-from qidata import QiDataSet, isDataset, DataType
+import qidata
+from qidata import QiDataSet, FlushException, isDataset, DataType, AnnotationCache
+from qidata import manifest
 from qidata.qidataframe import FrameIsInvalid
 from qidata.qidatafile import ClosedFileException
 from qidata.qidataobject import ReadOnlyException
 from qidata.qidataimagefile import QiDataImageFile
-from qidata.metadata_objects import Property, Context
+from qidata.metadata_objects import Property, Context, Object, Transform,\
+                                    TimeStamp
 
 def test_wrong_path(jpg_file_path):
 	"""
@@ -489,4 +502,456 @@ def test_dataset_context(folder_with_annotations):
 		_ds.context = c
 
 	with QiDataSet(folder_with_annotations, "r") as _ds:
-		_ds.context.recorder_names = []
\ No newline at end of file
+		_ds.context.recorder_names = []
+
+def test_stream_alignment(folder_with_annotations):
+	with QiDataSet(folder_with_annotations, "w") as d:
+		imgs = d.getAllFilesOfType("IMAGE")
+		d.createNewStream("cam2d", zip([(0,0),(1,0)],imgs))
+		aud = d.getAllFilesOfType("AUDIO")
+		d.createNewStream("audio", zip([(1,500000000)],aud))
+
+		ts, aligned = d.alignStreams(["cam2d", "audio"], 600000000)
+		assert([1000000000] == ts.tolist())
+		assert(["cam2d", "audio"] == aligned.keys())
+		assert(["JPG_file.jpg"] == aligned["cam2d"][0].tolist())
+		assert([0] == aligned["cam2d"][1].tolist())
+		assert(["WAV_file.wav"] == aligned["audio"][0].tolist())
+		assert([500000000] == aligned["audio"][1].tolist())
+
+		ts, aligned = d.alignStreams(["cam2d", "audio"], 2000000000)
+		assert([0, 1000000000] == ts.tolist())
+		assert([1500000000, 500000000] == aligned["audio"][1].tolist())
+
+		ts, aligned = d.alignStreams(["cam2d", "audio"], 2000000000,
+		                             policy="previous")
+		assert([] == ts.tolist())
+
+		ts, aligned = d.alignStreams(["audio", "cam2d"], 600000000,
+		                             policy="previous")
+		assert([1500000000] == ts.tolist())
+		assert(["JPG_file.jpg"] == aligned["cam2d"][0].tolist())
+
+		with pytest.raises(ValueError):
+			d.alignStreams(["cam2d", "audio"], 0, policy="next")
+		with pytest.raises(KeyError):
+			d.alignStreams(["cam2d", "toto"], 0)
+
+def test_frame_indexes(folder_with_annotations):
+	with QiDataSet(folder_with_annotations, "w") as d:
+		_f1 = d.createNewFrame("JPG_file.jpg", "WAV_file.wav")
+		_f2 = d.createNewFrame("Annotated_JPG_file.jpg", "WAV_file.wav")
+		assert([_f1] == d.getFramesContaining("JPG_file.jpg"))
+		assert([_f1, _f2] == d.getFramesContaining("WAV_file.wav"))
+		assert([] == d.getFramesContaining("TXT_file.txt"))
+		assert(None == d.getFrame("JPG_file.jpg", "Annotated_JPG_file.jpg"))
+
+	with QiDataSet(folder_with_annotations, "w") as d:
+		_f2 = d.getFrame("WAV_file.wav", "Annotated_JPG_file.jpg")
+		assert(set(["Annotated_JPG_file.jpg", "WAV_file.wav"]) == _f2.files)
+		assert(2 == len(d.getFramesContaining("WAV_file.wav")))
+		d.removeFrame("JPG_file.jpg", "WAV_file.wav")
+		assert([] == d.getFramesContaining("JPG_file.jpg"))
+		assert([_f2] == d.getFramesContaining("WAV_file.wav"))
+		d.removeFrame(_f2)
+		assert([] == d.getFramesContaining("WAV_file.wav"))
+		assert(None == d.getFrame("WAV_file.wav", "Annotated_JPG_file.jpg"))
+
+def test_data_stream_bulk_update(folder_with_annotations):
+	with QiDataSet(folder_with_annotations, "w") as d:
+		d.createNewStream("cam2d", [((0,0),"Annotated_JPG_file.jpg")])
+		assert(set(["cam2d"]) == d.getStreamsContaining("Annotated_JPG_file.jpg"))
+		assert(set() == d.getStreamsContaining("JPG_file.jpg"))
+
+		with pytest.raises(ValueError):
+			d.addManyToStream("cam2d", [((1,0),"JPG_file.jpg"),
+			                            ((2,0),"JPG_file20.jpg")])
+		assert({(0,0):"Annotated_JPG_file.jpg"} == d.getStream("cam2d"))
+		with pytest.raises(KeyError):
+			d.addManyToStream("camxd", [((1,0),"JPG_file.jpg")])
+
+		d.addManyToStream("cam2d", [((1,0),"JPG_file.jpg")])
+		assert(
+		    {
+		        (0,0):"Annotated_JPG_file.jpg",
+		        (1,0):"JPG_file.jpg"
+		    } == d.getStream("cam2d")
+		)
+		assert(set(["cam2d"]) == d.getStreamsContaining("JPG_file.jpg"))
+
+		# A file can appear at several timestamps
+		d.addToStream("cam2d", ((2,0),"JPG_file.jpg"))
+		assert(
+		    {
+		        (0,0):"Annotated_JPG_file.jpg",
+		        (1,0):"JPG_file.jpg",
+		        (2,0):"JPG_file.jpg"
+		    } == d.getStream("cam2d")
+		)
+
+	# Repeated entries are kept when the dataset is loaded again
+	with QiDataSet(folder_with_annotations, "w") as d:
+		assert(3 == len(d.getStream("cam2d")))
+
+		with pytest.raises(ValueError):
+			d.removeManyFromStream("cam2d", ["JPG_file.jpg", "WAV_file.wav"])
+		with pytest.raises(ValueError):
+			d.removeManyFromStream("cam2d", ["Annotated_JPG_file.jpg",
+			                                 "Annotated_JPG_file.jpg"])
+		assert(3 == len(d.getStream("cam2d")))
+		with pytest.raises(KeyError):
+			d.removeManyFromStream("camxd", ["JPG_file.jpg"])
+
+		# Each name removes the earliest occurrence of the file
+		d.removeFromStream("cam2d", "JPG_file.jpg")
+		assert(
+		    {
+		        (0,0):"Annotated_JPG_file.jpg",
+		        (2,0):"JPG_file.jpg"
+		    } == d.getStream("cam2d")
+		)
+		d.removeManyFromStream("cam2d", ["JPG_file.jpg",
+		                                 "Annotated_JPG_file.jpg"])
+		assert(dict() == d.getStream("cam2d"))
+		assert(set() == d.getStreamsContaining("JPG_file.jpg"))
+
+def test_data_stream_timestamp_forms(folder_with_annotations):
+	# Timestamps can be given as pairs, TimeStamp instances or nanoseconds
+	with QiDataSet(folder_with_annotations, "w") as d:
+		d.createNewStream("cam2d", [(TimeStamp(0,5),"JPG_file.jpg")])
+		d.addToStream("cam2d", (1000000000,"Annotated_JPG_file.jpg"))
+		d.addManyToStream("cam2d", [((2,0),"JPG_file.jpg")])
+		expected = {
+		    (0,5):"JPG_file.jpg",
+		    (1,0):"Annotated_JPG_file.jpg",
+		    (2,0):"JPG_file.jpg"
+		}
+		assert(expected == d.getStream("cam2d"))
+
+	with QiDataSet(folder_with_annotations, "r") as d:
+		assert(expected == d.getStream("cam2d"))
+		assert(
+		    [5, 1000000000, 2000000000]\
+		      == d._getStreamArrays("cam2d")[0].tolist()
+		)
+
+def test_data_stream_type_registry(dataset_with_new_annotations):
+	with QiDataSet(dataset_with_new_annotations, "w") as d:
+		assert([] == d.getAllFilesOfType(DataType.IMAGE))
+		with pytest.raises(TypeError):
+			d.createNewStream("fail", [((0,0),"JPG_file.jpg"),
+			                           ((1,0),"WAV_file.wav")])
+		with pytest.raises(IOError):
+			d.createNewStream("fail", [((0,0),"JPG_file20.jpg")])
+
+		d.createNewStream("cam2d", [((0,0),"JPG_file.jpg"),
+		                            ((1,0),"Annotated_JPG_file.jpg")])
+		assert(DataType.IMAGE == d.getStreamType("cam2d"))
+		assert(
+		    set(["JPG_file.jpg", "Annotated_JPG_file.jpg"])\
+		      == set(d.getAllFilesOfType(DataType.IMAGE))
+		)
+		assert(["WAV_file.wav"] == d.getAllFilesOfType(DataType.AUDIO))
+
+def test_data_stream_compact_encoding(full_dataset):
+	with QiDataSet(full_dataset, "r") as d:
+		front = d.getStream("front")
+		streams = d.getAllStreams()
+	assert((1455891949,464833938) in front)
+	assert("front_13.png" == front[(1455891949,464833938)])
+
+	# Former layout is upgraded on write
+	with QiDataSet(full_dataset, "w") as d:
+		pass
+	with open(os.path.join(full_dataset, "metadata.xmp")) as f:
+		assert(not "t1455891949.464833938" in f.read())
+
+	with QiDataSet(full_dataset, "r") as d:
+		assert(streams == d.getAllStreams())
+
+def test_close_without_changes(folder_with_annotations):
+	with QiDataSet(folder_with_annotations, "w") as d:
+		d.createNewStream("cam2d", [((0,0),"JPG_file.jpg")])
+		_f = d.createNewFrame("JPG_file.jpg", "WAV_file.wav")
+		_f.addAnnotation("jdoe", Property("key", "value"), None)
+		frame_path = _f.name
+
+	metadata_path = os.path.join(folder_with_annotations, "metadata.xmp")
+	metadata_stat = os.stat(metadata_path)
+	frame_stat = os.stat(frame_path)
+
+	# Opening and closing an unchanged dataset does not write anything
+	with QiDataSet(folder_with_annotations, "w") as d:
+		d.getAllFrames()[0].annotations
+		d.getStream("cam2d")
+	assert(metadata_stat == os.stat(metadata_path))
+	assert(frame_stat == os.stat(frame_path))
+
+	# Changes are written atomically (metadata.xmp is replaced)
+	with QiDataSet(folder_with_annotations, "w") as d:
+		d.setAnnotationStatus("sambrose", "Property", True)
+	assert(metadata_stat.st_ino != os.stat(metadata_path).st_ino)
+	assert(frame_stat == os.stat(frame_path))
+	assert(
+	    [] == [f for f in os.listdir(folder_with_annotations)
+	             if f.startswith(".metadata.xmp")]
+	)
+
+	with QiDataSet(folder_with_annotations, "r") as d:
+		assert(
+		    QiDataSet.AnnotationStatus.TOTAL\
+		      == d.annotations_available[("sambrose", "Property")]
+		)
+		assert({(0,0):"JPG_file.jpg"} == d.getStream("cam2d"))
+		assert(1 == len(d.getAllFrames()[0].annotations["jdoe"]["Property"]))
+
+def test_close_flushes_frames_and_children(folder_with_annotations):
+	d = QiDataSet(folder_with_annotations, "w")
+	_f1 = d.createNewFrame("JPG_file.jpg", "WAV_file.wav")
+	_f2 = d.createNewFrame("Annotated_JPG_file.jpg", "WAV_file.wav")
+	_f2.addAnnotation("jdoe", Property("key", "value"), None)
+	_c = d.openChild("JPG_file.jpg")
+	_c.addAnnotation("jdoe", Property("key", "value"), None)
+
+	def _failingClose():
+		raise IOError("Disk full")
+	_f1.close = _failingClose
+
+	with pytest.raises(FlushException) as e:
+		d.close()
+	assert([_f1.name] == [name for (name, _) in e.value.errors])
+	assert(_f2.closed)
+	assert(_c.closed)
+
+	with QiDataSet(folder_with_annotations, "r") as d:
+		_f = d.getFrame("Annotated_JPG_file.jpg", "WAV_file.wav")
+		assert(1 == len(_f.annotations["jdoe"]["Property"]))
+		with d.openChild("JPG_file.jpg") as _c:
+			assert(1 == len(_c.annotations["jdoe"]["Property"]))
+
+def test_dataset_locking(folder_with_annotations):
+	fd = os.open(folder_with_annotations, os.O_RDONLY)
+	try:
+		# Readers share the dataset
+		with QiDataSet(folder_with_annotations, "r") as d:
+			fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+			fcntl.flock(fd, fcntl.LOCK_UN)
+			with pytest.raises(IOError):
+				fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+		# Writers do not
+		with QiDataSet(folder_with_annotations, "w") as d:
+			with pytest.raises(IOError):
+				fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+
+		# Locks are released on close
+		fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+		fcntl.flock(fd, fcntl.LOCK_UN)
+	finally:
+		os.close(fd)
+
+def test_dataset_merge_on_close(folder_with_annotations):
+	d1 = QiDataSet(folder_with_annotations, "w", merge=True)
+	d2 = QiDataSet(folder_with_annotations, "w", merge=True)
+
+	d1.setAnnotationStatus("sambrose", "Property", True)
+	d1.createNewStream("cam2d", [((0,0),"JPG_file.jpg")])
+	d2.setAnnotationStatus("jdoe", "Person", False)
+	d2.createNewStream("mic", [((0,0),"WAV_file.wav")])
+	d1.close()
+	d2.close()
+
+	with QiDataSet(folder_with_annotations, "r") as d:
+		assert(
+		    {
+		        ("sambrose", "Property"): QiDataSet.AnnotationStatus.TOTAL,
+		        ("jdoe", "Person"): QiDataSet.AnnotationStatus.PARTIAL
+		    } == d.annotations_available
+		)
+		assert({(0,0):"JPG_file.jpg"} == d.getStream("cam2d"))
+		assert({(0,0):"WAV_file.wav"} == d.getStream("mic"))
+
+def test_dataset_merge_in_parallel(folder_with_annotations):
+	with QiDataSet(folder_with_annotations, "w") as d:
+		d.createNewFrame("JPG_file.jpg", "WAV_file.wav")
+
+	# Another process edits a different child while this one keeps the
+	# dataset (and its frame) open
+	worker = subprocess.Popen([sys.executable, "-c", """
+from qidata import QiDataSet
+from qidata.metadata_objects import Property
+with QiDataSet(%r, "w", merge=True) as d:
+	with d.openChild("WAV_file.wav") as _c:
+		_c.addAnnotation("jsmith", Property("key", "value"), None)
+	d.setAnnotationStatus("jsmith", "Property", False)
+""" % folder_with_annotations])
+	with QiDataSet(folder_with_annotations, "w", merge=True) as d:
+		with d.openChild("JPG_file.jpg") as _c:
+			_c.addAnnotation("jdoe", Property("key", "value"), None)
+		d.setAnnotationStatus("jdoe", "Property", False)
+		d.getAllFrames()[0].addAnnotation("jdoe", Property("key", "value"),
+		                                  None)
+		deadline = time.time() + 60
+		while worker.poll() is None and time.time() < deadline:
+			time.sleep(0.1)
+		if worker.poll() is None:
+			worker.kill()
+			worker.wait()
+			pytest.fail("The other process was blocked by this one")
+		assert(0 == worker.returncode)
+
+	with QiDataSet(folder_with_annotations, "r") as d:
+		assert(
+		    set([("jdoe", "Property"), ("jsmith", "Property")])\
+		      <= set(d.annotations_available.keys())
+		)
+		assert(1 == len(d.getAllFrames()[0].annotations["jdoe"]["Property"]))
+		with d.openChild("WAV_file.wav") as _c:
+			assert(1 == len(_c.annotations["jsmith"]["Property"]))
+
+def test_share_annotations(folder_with_annotations, tmpdir):
+	with QiDataSet(folder_with_annotations, "w") as d:
+		with pytest.raises(IOError):
+			d.shareAnnotations()
+
+	with QiDataSet(folder_with_annotations, "r") as d:
+		cache = d.shareAnnotations()
+		stored_cache = d.shareAnnotations(str(tmpdir.join("annotations.cache")))
+		children = d.children
+		expected = dict()
+		for name in children:
+			with d.openChild(name) as _f:
+				expected[name] = _f.annotations
+
+	reopened_cache = AnnotationCache.open(str(tmpdir.join("annotations.cache")))
+	for _cache in [cache, stored_cache, reopened_cache]:
+		assert(children == _cache.names)
+		for name in children:
+			assert(expected[name] == _cache.getAnnotations(name))
+		with pytest.raises(KeyError):
+			_cache.getAnnotations("unknown.png")
+		_cache.close()
+	assert(0 < len(expected["Annotated_JPG_file.jpg"]["sambrose"]["Property"]))
+
+def test_extract_crops(folder_with_annotations, tmpdir):
+	with QiDataSet(folder_with_annotations, "w") as d:
+		with d.openChild("Annotated_JPG_file.jpg") as _f:
+			_f.addAnnotation("jdoe", Object(type="cup"), [[10,20],[30,60]])
+			_f.addAnnotation("jdoe", Object(type="mug"), [[-5,-5],[4,8]])
+			_f.addAnnotation("jdoe", Object(type="pen"), None)
+		with d.openChild("JPG_file.jpg") as _f:
+			_f.addAnnotation("jsmith", Object(type="cup"), [[0,0],[10,10]])
+
+	with QiDataSet(folder_with_annotations, "r") as d:
+		with pytest.raises(ValueError):
+			d.extractCrops("Object")
+		manifest_path = d.extractCrops("Object", "jdoe", str(tmpdir))
+
+	with open(manifest_path, "rb") as _f:
+		rows = list(csv.DictReader(_f))
+	assert(2 == len(rows))
+	assert(set(["Annotated_JPG_file.jpg"]) == set([r["source"] for r in rows]))
+	assert(["0", "0", "4", "8"] == [rows[1][k] for k in ["x0","y0","x1","y1"]])
+	crop = cv2.imread(str(tmpdir.join(rows[0]["crop"])))
+	assert((40, 20, 3) == crop.shape)
+
+def test_extract_crops_names(folder_with_annotations, tmpdir):
+	# Images sharing a stem, and an annotator name with a path separator
+	shutil.copyfile(os.path.join(folder_with_annotations, "JPG_file.jpg"),
+	                os.path.join(folder_with_annotations, "JPG_file.png"))
+	with QiDataSet(folder_with_annotations, "w") as d:
+		for name in ["JPG_file.jpg", "JPG_file.png"]:
+			with d.openChild(name) as _f:
+				_f.addAnnotation("team/jdoe", Object(type="cup"),
+				                 [[0,0],[10,10]])
+
+	with QiDataSet(folder_with_annotations, "r") as d:
+		manifest_path = d.extractCrops("Object", "team/jdoe", str(tmpdir))
+
+	with open(manifest_path, "rb") as _f:
+		rows = list(csv.DictReader(_f))
+	assert(["JPG_file.jpg", "JPG_file.png"]\
+	         == sorted([r["source"] for r in rows]))
+	assert(2 == len(set([r["crop"] for r in rows])))
+	for row in rows:
+		assert("team/jdoe" == row["annotator"])
+		assert(not "/" in row["crop"])
+		assert(os.path.isfile(str(tmpdir.join(row["crop"]))))
+
+def test_find_invalid_locations(folder_with_annotations):
+	with QiDataSet(folder_with_annotations, "w") as d:
+		with d.openChild("JPG_file.jpg") as _f:
+			_f.addAnnotation("jdoe", Object(type="cup"), [[10,20],[30,60]])
+			_f.addAnnotation("jdoe", Object(type="mug"), [[3960,0],[3970,8]])
+			_f.addAnnotation("jdoe", Property("key", "value"), None)
+
+	with QiDataSet(folder_with_annotations, "r") as d:
+		assert(
+		    [("JPG_file.jpg", "jdoe", "Object", 1, [[3960,0],[3970,8]])]\
+		      == d.findInvalidLocations()
+		)
+
+def test_stream_poses(folder_with_annotations):
+	with QiDataSet(folder_with_annotations, "w") as d:
+		d.createNewStream("cam", [((1,0),"JPG_file.jpg"),
+		                          ((0,5),"Annotated_JPG_file.jpg")])
+		with d.openChild("JPG_file.jpg") as _f:
+			_f.transform = Transform(translation=dict(x=1,y=2,z=3),
+			                         rotation=dict(x=0,y=0,z=1,w=0))
+
+	with QiDataSet(folder_with_annotations, "r") as d:
+		timestamps, poses = d.getStreamPoses("cam")
+	assert([5, 1000000000] == list(timestamps))
+	assert((2, 7) == poses.shape)
+	assert([0,0,0,0,0,0,1] == list(poses[0]))
+	assert([1,2,3,0,0,1,0] == list(poses[1]))
+
+def test_dataset_diff(dataset_with_new_annotations):
+	after_path = dataset_with_new_annotations + "_after"
+	shutil.copytree(dataset_with_new_annotations, after_path)
+	with QiDataSet(after_path, "w") as d:
+		with d.openChild("Annotated_JPG_file.jpg") as _f:
+			_f.addAnnotation("jdoe", Object(type="cup"), [[10,20],[30,60]])
+			_f.addAnnotation("sambrose", Property(key="k", value="v"), None)
+	shutil.copyfile("tests/data/SpringNebula.jpg",
+	                os.path.join(after_path, "JPG_file.jpg"))
+	shutil.copyfile("tests/data/Trumpet.wav",
+	                os.path.join(after_path, "Trumpet.wav"))
+
+	expected = [
+	    ("Annotated_JPG_file.jpg", "jdoe", "added", ["Object"]),
+	    ("Annotated_JPG_file.jpg", "sambrose", "modified", ["Property"]),
+	    ("JPG_file.jpg", None, "modified", []),
+	    ("Trumpet.wav", None, "added", []),
+	]
+	with QiDataSet(dataset_with_new_annotations, "r") as before:
+		with QiDataSet(after_path, "r") as after:
+			assert(expected == before.diff(after))
+			assert([] == after.diff(after))
+			# Hashes are stored, and used again
+			assert(os.path.isfile(os.path.join(after_path,
+			                                   manifest.MANIFEST_FILE)))
+			assert(expected == before.diff(after, max_workers=1))
+
+	with QiDataSet(dataset_with_new_annotations, "w") as before:
+		with QiDataSet(after_path, "r") as after:
+			with pytest.raises(IOError):
+				before.diff(after)
+
+def test_manifest_internal_annotations(jpg_with_internal_annotations):
+	folder, name = os.path.split(jpg_with_internal_annotations)
+	data_hash, annotation_hashes = manifest.getManifest(folder, [name])[name]
+
+	# Annotations written in the file itself, by another tool
+	with qidata.open(jpg_with_internal_annotations, "w") as _f:
+		_f.addAnnotation("jsmith", Property(key="k", value="v"), None)
+	with XMPFile(jpg_with_internal_annotations + ".xmp", rw=False) as _external:
+		with XMPFile(jpg_with_internal_annotations, rw=True) as _internal:
+			_internal.libxmp_metadata = _external.libxmp_metadata
+	os.remove(jpg_with_internal_annotations + ".xmp")
+
+	new_data_hash, new_annotation_hashes =\
+	    manifest.getManifest(folder, [name])[name]
+	assert(data_hash == new_data_hash)
+	assert(not annotation_hashes.has_key("jsmith"))
+	assert(new_annotation_hashes.has_key("jsmith"))
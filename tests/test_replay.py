@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+# Third-party libraries
+import pytest
+
+# Local modules
+from qidata import QiDataSet
+from qidata.replay import StreamReplay
+
+class FakeClock(object):
+	def __init__(self):
+		self.time = 100.
+		self.sleeps = []
+
+	def __call__(self):
+		return self.time
+
+	def sleep(self, delay):
+		self.sleeps.append(round(delay, 6))
+		self.time += delay
+
+def test_replay(folder_with_annotations):
+	with QiDataSet(folder_with_annotations, "w") as d:
+		d.createNewStream("cam", [((0,0),"JPG_file.jpg"),
+		                          ((0,200000000),"Annotated_JPG_file.jpg")])
+		d.createNewStream("mic", [((0,100000000),"WAV_file.wav")])
+		d.createNewStream("copy", [((0,400000000),"JPG_file.jpg")])
+
+	with QiDataSet(folder_with_annotations, "r") as d:
+		with pytest.raises(KeyError):
+			StreamReplay(d, ["unknown"])
+		with pytest.raises(ValueError):
+			StreamReplay(d, ["cam"], speed=0)
+
+		clock = FakeClock()
+		replay = StreamReplay(d, ["cam", "mic", "copy"], speed=2.,
+		                      clock=clock, sleep=clock.sleep, prefetch=2)
+		fast_replay = StreamReplay(d, ["cam", "mic", "copy"], speed=None,
+		                           loader=lambda path: path)
+
+	assert(4 == len(replay))
+	steps = [step for step in replay]
+	assert([(0, "cam", "JPG_file.jpg"),
+	        (100000000, "mic", "WAV_file.wav"),
+	        (200000000, "cam", "Annotated_JPG_file.jpg"),
+	        (400000000, "copy", "JPG_file.jpg")]\
+	         == [step[:3] for step in steps])
+	assert((2232, 3968, 3) == steps[0][3].shape)
+	assert([0.05, 0.05, 0.1] == clock.sleeps)
+	assert([] == replay.dropped)
+
+	# Late files are dropped
+	clock.sleeps = []
+	names = []
+	for step in replay:
+		names.append(step[2])
+		if step[2] == "WAV_file.wav":
+			clock.time += 0.2
+	assert(["JPG_file.jpg", "WAV_file.wav", "JPG_file.jpg"] == names)
+	assert([(200000000, "cam", "Annotated_JPG_file.jpg")] == replay.dropped)
+
+	assert([folder_with_annotations + "/WAV_file.wav"]\
+	         == [step[3] for step in fast_replay if step[1] == "mic"])
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+# Standard library
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+# Third-party libraries
+import pytest
+
+# Local modules
+import qidata
+from qidata import QiDataSet
+from qidata.metadata_objects import Object
+from qidata.server import Catalog, QueryServer
+from qidata_client import Client, QueryError
+
+def prepare(folder):
+	with QiDataSet(folder, "w") as d:
+		d.createNewStream("cam", [((0,5),"JPG_file.jpg"),
+		                          ((1,0),"Annotated_JPG_file.jpg"),
+		                          ((2,0),"JPG_file.jpg")])
+		with d.openChild("JPG_file.jpg") as _f:
+			_f.addAnnotation("jdoe", Object(type="cup"), [[0,0],[10,10]])
+
+def test_catalog(folder_with_annotations):
+	prepare(folder_with_annotations)
+	root = os.path.dirname(folder_with_annotations)
+	catalog = Catalog([root], max_workers=2)
+	path = os.path.abspath(folder_with_annotations)
+	assert(path in catalog.getDatasets())
+
+	assert([path] == catalog.filter([path], only_annotated_by=["jdoe"]))
+	assert([] == catalog.filter([path], only_annotated_by=["jdoe"],
+	                            only_total_annotations=True))
+	assert([[1000000000, "Annotated_JPG_file.jpg"]]\
+	         == catalog.getStreamRange(path, "cam", 6, 1999999999))
+	assert(3 == len(catalog.getStreamRange(path, "cam")))
+	assert([[path, "JPG_file.jpg"]]\
+	         == catalog.search([path], annotator="jdoe",
+	                           annotation_type="Object"))
+	assert(catalog.getAnnotations(path, "JPG_file.jpg").has_key("jdoe"))
+
+	# Annotations written since the catalog was built
+	with qidata.open(os.path.join(path, "Annotated_JPG_file.jpg"), "w") as _f:
+		_f.addAnnotation("jsmith", Object(type="cup"), [[0,0],[10,10]])
+	assert([[path, "Annotated_JPG_file.jpg"]]\
+	         == catalog.search([path], annotator="jsmith"))
+
+	# Files added and removed since the catalog was built
+	shutil.copyfile("tests/data/SpringNebula.jpg", os.path.join(path, "new.jpg"))
+	assert([[path, "new.jpg"]]\
+	         == catalog.search([path], data_type="IMAGE", pattern="new*"))
+	assert(not catalog.getAnnotations(path, "new.jpg").has_key("jdoe"))
+	os.remove(os.path.join(path, "new.jpg"))
+	assert([] == catalog.search([path], pattern="new*"))
+	with pytest.raises(IOError):
+		catalog.getAnnotations(path, "new.jpg")
+
+	assert(catalog.handle(dict(method="unknown")).has_key("error"))
+	assert(catalog.handle(dict(
+	    method="stream_range", params=dict(dataset=path, stream="unknown")
+	)).has_key("error"))
+	assert(catalog.handle(dict(
+	    method="search", params=dict(datasets=["tests/data"])
+	)).has_key("error"))
+
+def test_client(folder_with_annotations, tmpdir):
+	prepare(folder_with_annotations)
+	path = os.path.abspath(folder_with_annotations)
+	socket_path = str(tmpdir.join("qidata.sock"))
+
+	# No daemon: queries are evaluated locally
+	with Client([path], socket_path) as client:
+		assert(not client.is_remote)
+		local = client.search(annotator="jdoe")
+		assert([[path, "JPG_file.jpg"]] == local)
+	with pytest.raises(IOError):
+		Client(socket_path=socket_path).search()
+
+	server = QueryServer(Catalog([path]), socket_path)
+	thread = threading.Thread(target=server.serve_forever)
+	thread.start()
+	try:
+		with pytest.raises(IOError):
+			QueryServer(Catalog([path]), socket_path)
+		with Client(socket_path=socket_path) as client:
+			assert(client.is_remote)
+			assert(local == client.search(annotator="jdoe"))
+			assert([path] == client.filter(only_with_annotations=["Object"]))
+			assert([[2000000000, "JPG_file.jpg"]]\
+			         == client.getStreamRange(path, "cam", start=1500000000))
+			assert(client.getAnnotations(path, "JPG_file.jpg").has_key("jdoe"))
+			with pytest.raises(QueryError):
+				client.getAnnotations(path, "unknown.jpg")
+	finally:
+		server.shutdown()
+		server.server_close()
+		thread.join()
+	assert(not os.path.exists(socket_path))
+
+def test_client_imports():
+	# The client does not load qidata nor its dependencies
+	subprocess.check_call([sys.executable, "-c", """
+import sys
+import qidata_client
+for name in ["qidata", "numpy", "cv2", "xmp"]:
+	assert not name in sys.modules, name
+"""])
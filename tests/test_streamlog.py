@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+# Standard library
+import json
+
+# Third-party libraries
+import cv2
+import pytest
+
+# Local modules
+from qidata import QiDataSet
+from qidata.metadata_objects import Object, TimeStamp, Transform
+from qidata.streamlog import exportStreamLog, StreamLog
+
+def test_stream_log(folder_with_annotations, tmpdir):
+	with QiDataSet(folder_with_annotations, "w") as d:
+		d.createNewStream("cam", [((1,0),"JPG_file.jpg"),
+		                          ((0,5),"Annotated_JPG_file.jpg")])
+		with d.openChild("JPG_file.jpg") as _f:
+			_f.transform = Transform(translation=dict(x=1,y=2,z=3),
+			                         rotation=dict(x=0,y=0,z=1,w=0))
+			_f.addAnnotation("jdoe", Object(type="cup"), [[10,20],[30,60]])
+
+	log_path = str(tmpdir.join("cam.qdl"))
+	with QiDataSet(folder_with_annotations, "r") as d:
+		assert(2 == exportStreamLog(d, "cam", log_path, max_workers=2))
+		with pytest.raises(KeyError):
+			exportStreamLog(d, "unknown", log_path)
+		with d.openChild("JPG_file.jpg") as _f:
+			expected_annotations = _f.annotations
+
+	log = StreamLog(log_path)
+	assert(2 == len(log))
+	assert([5, 1000000000] == log.timestamps.tolist())
+
+	timestamp, name, pose, data, annotations = log.getRecord(1)
+	assert((1000000000, "JPG_file.jpg") == (timestamp, name))
+	assert((1,2,3,0,0,1,0) == pose)
+	with open(folder_with_annotations + "/JPG_file.jpg", "rb") as _f:
+		assert(_f.read() == data)
+	assert(expected_annotations == annotations)
+	# Annotations are stored as JSON
+	assert(json.loads(log._readRecord(1)[4]).has_key("jdoe"))
+	assert((2232, 3968, 3) == log.getImage(1).shape)
+	assert(["Annotated_JPG_file.jpg", "JPG_file.jpg"] == [r[1] for r in log])
+
+	assert(0 == log.getIndex(6))
+	assert(1 == log.getIndex(TimeStamp(0, 600000000)))
+	assert(0 == log.getIndex(TimeStamp(0, 600000000), "previous"))
+	with pytest.raises(KeyError):
+		log.getIndex(0, "previous")
+	with pytest.raises(ValueError):
+		log.getIndex(0, "unknown")
+	with pytest.raises(IndexError):
+		log.getRecord(2)
+	log.close()
+
+	with pytest.raises(ValueError):
+		StreamLog(folder_with_annotations + "/JPG_file.jpg")
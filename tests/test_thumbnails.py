@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# Standard library
+import os
+
+# Local modules
+import qidata
+from qidata import thumbnails
+
+def test_thumbnails(jpg_file_path):
+	with qidata.open(jpg_file_path, "r") as _f:
+		thumbnail = _f.getThumbnail(100)
+		assert(_f._raw_data is None)
+	assert((56, 100, 3) == thumbnail.shape)
+	assert((1125, 2000, 3) == thumbnails.getThumbnail(jpg_file_path, 2000).shape)
+
+	cache_folder = os.path.join(os.path.dirname(jpg_file_path),
+	                            thumbnails.CACHE_FOLDER)
+	cached = sorted(os.listdir(cache_folder))
+	assert(len(thumbnails.THUMBNAIL_SIZES) + 1 == len(cached))
+
+	# Thumbnails are reused, and made again when the image changes
+	thumbnails.makeThumbnails(jpg_file_path)
+	assert(cached == sorted(os.listdir(cache_folder)))
+	with open(jpg_file_path, "ab") as _f:
+		_f.write("\0")
+	os.utime(jpg_file_path, (0, 0))
+	assert((56, 100, 3) == thumbnails.getThumbnail(jpg_file_path, 100).shape)
+	assert(2*len(thumbnails.THUMBNAIL_SIZES) + 1 == len(os.listdir(cache_folder)))
+
+def test_reduced_decoding(jpg_file_path):
+	# The image (2232x3968) is decoded at the lowest sufficient resolution
+	assert((279, 496, 3) == thumbnails._decode(jpg_file_path, 64).shape)
+	assert((1116, 1984, 3) == thumbnails._decode(jpg_file_path, 1024).shape)
+	assert((2232, 3968, 3) == thumbnails._decode(jpg_file_path, 2000).shape)
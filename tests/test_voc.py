@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+# Third-party libraries
+import pytest
+
+# Local modules
+from qidata import QiDataSet, voc
+from qidata.metadata_objects import Object
+
+VOC_ANNOTATION = """<annotation>
+	<folder>images</folder>
+	<filename>%s</filename>
+	<object>
+		<name>dog</name>
+		<bndbox><xmin>11</xmin><ymin>21</ymin><xmax>30</xmax><ymax>60</ymax></bndbox>
+	</object>
+	<object>
+		<name>cat</name>
+		<bndbox><xmin>1</xmin><ymin>1</ymin><xmax>10.2</xmax><ymax>9.8</ymax></bndbox>
+	</object>
+</annotation>
+"""
+
+def test_import_voc(folder_with_annotations, tmpdir):
+	for name in ["JPG_file.jpg", "Annotated_JPG_file.jpg"]:
+		tmpdir.join(name[:-4] + ".xml").write(VOC_ANNOTATION%name)
+
+	with QiDataSet(folder_with_annotations, "w") as d:
+		assert(4 == voc.importVOC(d, str(tmpdir), "labeler"))
+	with QiDataSet(folder_with_annotations, "r") as d:
+		assert(d.annotations_available.has_key(("labeler", "Object")))
+		with d.openChild("JPG_file.jpg") as _f:
+			assert([[Object(type="dog"), [[10,20],[30,60]]],
+			        [Object(type="cat"), [[0,0],[10,10]]]]\
+			         == _f.annotations["labeler"]["Object"])
+
+	tmpdir.join("invalid.xml").write("<annotation><filename>JPG_file.jpg</filename>"
+	                                 "<object><name>dog</name></object></annotation>")
+	with QiDataSet(folder_with_annotations, "w") as d:
+		with pytest.raises(ValueError):
+			voc.importVOC(d, [str(tmpdir.join("invalid.xml"))], "labeler")
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+# Standard library
+import os
+import shutil
+import threading
+
+# Local modules
+import qidata
+from qidata import QiDataSet, qidataframe
+from qidata.metadata_objects import Object
+from qidata.watch import DatasetWatcher
+
+def test_watch_children(dataset_with_new_annotations):
+	folder = dataset_with_new_annotations
+	received = []
+	with QiDataSet(folder, "r") as d:
+		watcher = DatasetWatcher(d, received.append)
+		assert([] == watcher.poll())
+
+		# Annotations written by someone else
+		with qidata.open(os.path.join(folder, "JPG_file.jpg"), "w") as _f:
+			_f.addAnnotation("jdoe", Object(type="cup"), [[0,0],[10,10]])
+		assert([("JPG_file.jpg", "modified")] == watcher.poll())
+		assert([[("JPG_file.jpg", "modified")]] == received)
+		assert(QiDataSet.AnnotationStatus.PARTIAL\
+		         == d.annotations_available[("jdoe", "Object")])
+
+		# New and removed children
+		shutil.copyfile("tests/data/SpringNebula.jpg",
+		                os.path.join(folder, "new.jpg"))
+		assert([("new.jpg", "added")] == watcher.poll())
+		assert("new.jpg" in d.getAllFilesOfType("IMAGE"))
+		os.remove(os.path.join(folder, "new.jpg"))
+		assert([("new.jpg", "removed")] == watcher.poll())
+		assert(not "new.jpg" in d.getAllFilesOfType("IMAGE"))
+
+		# Annotations provided by no file anymore are forgotten
+		os.remove(os.path.join(folder, "JPG_file.jpg.xmp"))
+		assert([("JPG_file.jpg", "modified")] == watcher.poll())
+		assert(not d.annotations_available.has_key(("jdoe", "Object")))
+		assert([] == watcher.poll())
+
+def test_watch_frames(dataset_with_new_annotations):
+	folder = dataset_with_new_annotations
+	with QiDataSet(folder, "r") as d:
+		watcher = DatasetWatcher(d)
+		frame = qidataframe.QiDataFrame.create(["JPG_file.jpg", "WAV_file.wav"],
+		                                       folder)
+		frame.close()
+		frame_name = os.path.basename(frame._file_path)
+		assert([(frame_name, "added")] == watcher.poll())
+		assert(d.getFrame("JPG_file.jpg", "WAV_file.wav") is not None)
+
+		# Frame modified by someone else is reloaded
+		old_frame = d.getFrame("JPG_file.jpg", "WAV_file.wav")
+		with qidataframe.QiDataFrame(frame._file_path, "w") as _f:
+			_f.addAnnotation("jdoe", Object(type="cup"), None)
+		assert([(frame_name, "modified")] == watcher.poll())
+		assert(old_frame.closed)
+		assert(not old_frame._is_valid)
+		new_frame = d.getFrame("JPG_file.jpg", "WAV_file.wav")
+		assert(new_frame is not old_frame)
+		assert(new_frame.annotations.has_key("jdoe"))
+
+		os.remove(frame._file_path)
+		assert([(frame_name, "removed")] == watcher.poll())
+		assert(new_frame.closed)
+		assert(d.getFrame("JPG_file.jpg", "WAV_file.wav") is None)
+
+def test_watch_thread(dataset_with_new_annotations):
+	folder = dataset_with_new_annotations
+	received = []
+	notified = threading.Event()
+	def onChange(changes):
+		received.extend(changes)
+		notified.set()
+
+	with QiDataSet(folder, "r") as d:
+		with DatasetWatcher(d, onChange, interval=0.05, use_inotify=False):
+			# Files which are not followed are ignored
+			shutil.copyfile("tests/data/SpringNebula.jpg",
+			                os.path.join(folder, "new.tmp"))
+			os.rename(os.path.join(folder, "new.tmp"),
+			          os.path.join(folder, "new.jpg"))
+			assert(notified.wait(5))
+		assert([("new.jpg", "added")] == received)
+		assert("new.jpg" in d.getAllFilesOfType("IMAGE"))
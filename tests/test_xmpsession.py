@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2017, Softbank Robotics Europe
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+# Standard library
+import os
+
+# Third-party libraries
+import pytest
+
+# Local modules
+import qidata
+from qidata import xmpsession
+from qidata._mixin import QIDATA_NS, _read_file_annotations
+from qidata.metadata_objects import Object
+
+def test_session(folder_with_annotations):
+	path = os.path.join(folder_with_annotations, "JPG_file.jpg")
+	session = xmpsession.XMPSession(max_entries=1)
+	assert(session.readNamespace(path, QIDATA_NS) is None)
+	assert(session.readNamespace(path, QIDATA_NS) is None)
+	assert(dict(reads=2, hits=1, misses=1, evictions=0, entries=1,
+	            hit_rate=0.5) == session.stats)
+
+	# Changed files are read again
+	with qidata.open(path, "w") as _f:
+		_f.addAnnotation("jdoe", Object(type="cup"), [[0,0],[10,10]])
+	xmp_path = path + ".xmp"
+	data = session.readNamespace(xmp_path, QIDATA_NS)
+	assert(1 == len(session))
+	assert(1 == session.stats["evictions"])
+
+	# Returned values are copies
+	data.clear()
+	assert(0 != len(session.readNamespace(xmp_path, QIDATA_NS)))
+	assert(2 == session.stats["hits"])
+
+	session.invalidate(xmp_path)
+	assert(0 == len(session))
+	session.resetStats()
+	assert(0 == session.stats["reads"])
+	with pytest.raises(OSError):
+		session.readNamespace(path + ".unknown", QIDATA_NS)
+
+def test_read_file_annotations(folder_with_annotations):
+	path = os.path.join(folder_with_annotations, "JPG_file.jpg")
+	with qidata.open(path, "w") as _f:
+		_f.addAnnotation("jdoe", Object(type="cup"), [[0,0],[10,10]])
+	assert(["Object"] == _read_file_annotations(path + ".xmp")["jdoe"].keys())
+
+	# Writes made by this process are seen immediately
+	with qidata.open(path, "w") as _f:
+		_f.addAnnotation("jsmith", Object(type="cup"), [[0,0],[10,10]])
+	assert(set(["jdoe", "jsmith"])\
+	         == set(_read_file_annotations(path + ".xmp").keys()))
+	assert(xmpsession.getSession().stats["reads"] >= 2)